@@ -1,10 +1,23 @@
 import streamlit as st
-import pandas as pd
-from docx import Document
-from docx.shared import Pt
-from datetime import datetime
 import os
-from io import StringIO
+from datetime import datetime, timedelta
+from functools import partial
+
+# pandas y python-docx no se importan aquí: pandas solo lo usa el lote y
+# python-docx se carga con el primer template (ver cartas.arranque)
+from cartas import arranque, estaticos, indice, metricas, registro, renders, trabajos, vista_previa
+from cartas.artefactos import obtener as obtener_artefacto
+from cartas.constantes import CANALES_INGRESO, GERENTES
+from cartas.formato import capitalizar_texto
+from cartas.generador import campos_faltantes, fecha_chile
+from cartas.plantillas import contar_templates, ruta_template
+from cartas.procesos import PROCESOS, TAMANO_BLOQUE
+from cartas.registro import CATEGORIAS, TIPOS_CARTA
+
+arranque.marcar("imports")
+
+# Endpoint /metrics para Prometheus (solo si metricas.PUERTO_METRICAS tiene un puerto)
+metricas.exponer()
 
 # ================= CONFIG =================
 st.set_page_config(
@@ -13,142 +26,243 @@ st.set_page_config(
     layout="wide"
 )
 
-# 1. PRIMERO INICIALIZAMOS (Esto debe ir antes de cualquier 'if')
+# count_reset va en las keys de los widgets: al reiniciar el formulario
+# todos los campos nacen de nuevo vacíos
 if 'count_reset' not in st.session_state:
     st.session_state.count_reset = 0
 
-if 'limpieza_inicial' not in st.session_state:
-    st.session_state.limpieza_inicial = False
-
-# 2. SEGUIDO HACEMOS LA VALIDACIÓN DE LIMPIEZA
-if st.session_state.count_reset == 0 and not st.session_state.limpieza_inicial:
-    st.session_state.limpieza_inicial = True
-    st.rerun()
-
 if 'carta_generada' not in st.session_state:
     st.session_state.carta_generada = False
 
 if 'output_path' not in st.session_state:
     st.session_state.output_path = None
 
-if 'vista_previa_html' not in st.session_state:
-    st.session_state.vista_previa_html = None
+if 'artefacto_id' not in st.session_state:
+    st.session_state.artefacto_id = None
+
+# Últimos valores de cada sección del formulario (los lee la vista previa)
+if 'formulario' not in st.session_state:
+    st.session_state.formulario = {}
+
+# Lugar de la vista previa en la barra lateral; se crea más abajo si está abierta
+lugar_vista_previa = None
 
 os.makedirs("templates", exist_ok=True)
 os.makedirs("output", exist_ok=True)
 
-# ================= GERENTES POR ZONA =================
-GERENTES = {
-    "Norte": "Christian Alberto Gómez Díaz",
-    "Centro": "Alex Andrés González Villablanca",
-    "Sur": "Christian Enrique Araya Silva"
-}
-
-# ================= CATEGORÍAS Y TIPOS DE CARTAS =================
-CATEGORIAS = {
-    "Cobros": {
-        "apertura_casa_nolu": "Apertura Casa Cerrada NOLU",
-        "carta_aporte_lectura": "Aporte Lectura",
-        "atencion_emergencia_halu": "Atención de Emergencias HALU",
-        "aumento_consumo_halu_sinvisita": "Aumento Consumo HALU Sin visita técnica",
-        "aumento_consumo_nolu_sinvisita": "Aumento Consumo NOLU Sin visita técnica",
-        "carta_compromiso": "Carta Compromiso 10 días",
-        "carta_compromiso_i5": "Carta Compromiso con I5",
-        "carta_falta_info": "Carta falta información reclamo",
-        "error_lectura_halu": "Error de Lectura HALU",
-        "error_lectura_nolu": "Error de Lectura NOLU",
-        "error_lectura_regularizado_sgte_lectura": "Error Lectura Regularizado Siguiente Lectura HALU",
-        "facturaciones_normalizadas": "Facturaciones Normalizadas",
-        "normal_avance": "Normal Avance"
-    },
-    "DAR (Artefacto Dañado)": {
-        # Por ahora vacío, se agregarán después
-    },
-    "Técnico Comercial": {
-        # Por ahora vacío, se agregarán después
-    }
-}
-
-# ================= CANALES CON GÉNERO =================
-CANALES_MASCULINO = ["Call Center", "Correo Electrónico"]
-CANALES_FEMENINO = ["Oficina Comercial", "Página Web", "App CGE 1Click"]
-CANALES_EXTERNOS = ["Portal SEC", "Portal SERNAC"]  # Sin "nuestro/nuestra"
-
-# ================= FUNCIONES AUXILIARES =================
-def formatear_monto(valor):
-    """Formatea monto con $ y puntos de miles"""
-    try:
-        valor_limpio = str(valor).replace('$', '').replace('.', '').replace(',', '').strip()
-        if valor_limpio:
-            numero = int(valor_limpio)
-            return f"${numero:,}".replace(',', '.')
-        return valor
-    except:
-        return valor
-
-def formatear_numero_kwh(valor):
-    """
-    Formatea número con puntos de miles (sin $)
-    6500 → 6.500
-    """
-    try:
-        valor_limpio = str(valor).replace('.', '').replace(',', '').strip()
-        if valor_limpio:
-            numero = int(valor_limpio)
-            return f"{numero:,}".replace(',', '.')
-        return valor
-    except:
-        return valor
-
-def capitalizar_texto(texto):
-    """
-    Capitaliza la primera letra de cada palabra
-    eduardo lópez → Eduardo López
-    """
-    if texto:
-        return texto.title()
-    return texto
+# ================= TRABAJOS EN SEGUNDO PLANO =================
+# La carta y el lote se generan en cartas.trabajos, fuera del script. El id
+# del trabajo queda en la sesión y en la URL (?carta=... / ?lote=...): al
+# recargar la página se retoma el trabajo en curso.
+TRABAJOS_SEGUNDOS = 0.5
+
+
+def trabajo_en_curso(tipo):
+    """Id del trabajo de 'tipo' ("carta" o "lote") que sigue esta sesión, o None"""
+    clave = f"trabajo_{tipo}"
+    if clave not in st.session_state:
+        st.session_state[clave] = st.query_params.get(tipo)
+    return st.session_state[clave]
+
+
+def seguir_trabajo(tipo, trabajo_id):
+    st.session_state[f"trabajo_{tipo}"] = trabajo_id
+    if trabajo_id:
+        st.query_params[tipo] = trabajo_id
+    elif tipo in st.query_params:
+        del st.query_params[tipo]
+
+
+def recoger_trabajo(tipo):
+    """Estado final del trabajo de 'tipo' si ya terminó (y se deja de seguir); si no, None"""
+    trabajo_id = trabajo_en_curso(tipo)
+    if not trabajo_id:
+        return None
+    trabajo = trabajos.estado(trabajo_id)
+    if trabajo is None:
+        seguir_trabajo(tipo, None)
+        return {"estado": trabajos.ERROR, "error": "El trabajo ya no existe (venció o se reinició la app)"}
+    if trabajo["estado"] not in trabajos.TERMINADOS:
+        return None
+    seguir_trabajo(tipo, None)
+    return trabajo
+
+
+# Fragmento con refresco propio: muestra el avance sin bloquear el resto de la
+# página y, al terminar el trabajo, vuelve a ejecutar la app para recogerlo
+@st.fragment(run_every=TRABAJOS_SEGUNDOS)
+def avance_trabajo(tipo, texto):
+    trabajo_id = trabajo_en_curso(tipo)
+    trabajo = trabajos.estado(trabajo_id)
+    if trabajo is None or trabajo["estado"] in trabajos.TERMINADOS:
+        st.rerun()
 
-def formatear_fecha(fecha_input):
-    """
-    Formatea fecha de DDMMYYYY a DD/MM/YYYY
-    20022025 → 20/02/2025
-    También acepta ya formateadas: 20/02/2025 → 20/02/2025
-    """
-    if not fecha_input:
-        return fecha_input
-    
-    # Limpiar entrada (quitar espacios, guiones, puntos, barras)
-    fecha_limpia = str(fecha_input).replace('/', '').replace('-', '').replace('.', '').replace(' ', '').strip()
+    col_barra, col_cancelar = st.columns([4, 1])
+    with col_barra:
+        hechas, total = trabajo["hechas"], trabajo["total"]
+        if trabajo["estado"] == trabajos.PENDIENTE:
+            texto = "⏳ En espera..."
+        st.progress(hechas / total if total else 0.0, text=texto.format(hechas=hechas, total=total))
+    with col_cancelar:
+        if st.button("✖️ Cancelar", use_container_width=True, key=f"cancelar_{trabajo_id}"):
+            trabajos.cancelar(trabajo_id)
+
+
+def avisar_fin(trabajo, exito):
+    if trabajo["estado"] == trabajos.LISTO:
+        st.success(exito)
+    elif trabajo["estado"] == trabajos.CANCELADO:
+        st.warning("✖️ Generación cancelada")
+    else:
+        st.error(f"❌ Error: {trabajo['error']}")
+        with st.expander("🔍 Ver detalles del error"):
+            st.code(trabajo["error"])
+
+
+# ================= HEADER =================
+st.markdown(estaticos.ENCABEZADO_HTML, unsafe_allow_html=True)
+
+# ================= BUSCAR CARTA YA GENERADA =================
+# Fragmento: buscar no vuelve a ejecutar el formulario. La descarga lee el
+# archivo registrado en el índice recién al hacer clic.
+@st.fragment
+def buscar_carta():
+    with st.expander("🔎 BUSCAR CARTA YA GENERADA"):
+        col_texto, col_fechas = st.columns([2, 1])
+        with col_texto:
+            texto = st.text_input("N° GR o número de cliente", key="buscar_texto")
+        with col_fechas:
+            fechas = st.date_input("Generada entre", value=(), format="DD/MM/YYYY", key="buscar_fechas")
+        if not texto and len(fechas) != 2:
+            return
+
+        desde = hasta = None
+        if len(fechas) == 2:
+            zona_horaria = fecha_chile().tzinfo
+            desde = datetime.combine(fechas[0], datetime.min.time(), zona_horaria).timestamp()
+            hasta = datetime.combine(fechas[1] + timedelta(days=1), datetime.min.time(), zona_horaria).timestamp()
+        encontradas = indice.buscar(texto=texto, desde=desde, hasta=hasta, limite=10)
+        if not encontradas:
+            st.info("No hay cartas registradas con esos datos")
+            return
+
+        for carta in encontradas:
+            col_info, col_boton = st.columns([3, 1])
+            with col_info:
+                creada = datetime.fromtimestamp(carta["creada"], fecha_chile().tzinfo)
+                st.markdown(
+                    f"**{TIPOS_CARTA.get(carta['tipo_carta'], carta['tipo_carta'] or 'Carta')}** · "
+                    f"GR {carta['gr_numero']} · Cliente {carta['numero_cliente'] or '—'} · "
+                    f"{creada.strftime('%d/%m/%Y %H:%M')}"
+                )
+            with col_boton:
+                disponible = bool(carta["ruta"]) and os.path.exists(carta["ruta"])
+                st.download_button(
+                    label="📥 Descargar" if disponible else "No disponible",
+                    data=partial(_leer_registrada, carta["id"]),
+                    file_name=carta["nombre"],
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    on_click="ignore",
+                    disabled=not disponible,
+                    use_container_width=True,
+                    key=f"btn_registrada_{carta['id']}",
+                )
+
+
+def _leer_registrada(carta_id):
+    return indice.leer(carta_id) or b""
+
+
+buscar_carta()
+
+# ================= MODO DE GENERACIÓN =================
+modo_generacion = st.radio(
+    "Modo de generación:",
+    ["Carta individual", "Lote desde planilla (CSV / Excel)"],
+    # Al recargar la página con un lote en curso se vuelve a la vista del lote
+    index=1 if trabajo_en_curso("lote") else 0,
+    horizontal=True,
+    key="modo_generacion"
+)
+
+if modo_generacion != "Carta individual":
+    from cartas.lote import leer_planilla, planilla_ejemplo, revisar_planilla
+
+    st.markdown("### 📦 GENERACIÓN POR LOTE")
+    st.info("💡 Una fila por reclamo. Columnas: tipo_carta, gr_numero, tratamiento, nombre_cliente, direccion, "
+            "comuna, numero_cliente, zona, canal_ingreso y los campos propios de cada carta")
+    st.download_button(
+        "📄 Descargar planilla de ejemplo",
+        data=planilla_ejemplo(),
+        file_name="planilla_cartas.csv",
+        mime="text/csv"
+    )
     
-    # Si tiene exactamente 8 dígitos, formatear
-    if len(fecha_limpia) == 8 and fecha_limpia.isdigit():
-        dia = fecha_limpia[0:2]
-        mes = fecha_limpia[2:4]
-        anio = fecha_limpia[4:8]
-        
-        # Validación básica
+    archivo_lote = st.file_uploader("Planilla:", type=["csv", "xlsx"], key="archivo_lote")
+    if archivo_lote is not None:
         try:
-            dia_int = int(dia)
-            mes_int = int(mes)
-            anio_int = int(anio)
-            
-            if 1 <= dia_int <= 31 and 1 <= mes_int <= 12 and 2000 <= anio_int <= 2100:
-                return f"{dia}/{mes}/{anio}"
-        except:
-            pass
+            df_lote = leer_planilla(archivo_lote, archivo_lote.name)
+        except Exception as e:
+            st.error(f"⚠️ No se pudo leer la planilla: {str(e)}")
+            st.stop()
+        
+        st.success(f"✅ {len(df_lote)} filas cargadas")
+        st.dataframe(df_lote, use_container_width=True)
+        
+        # Revisión previa: se ve qué filas fallarán antes de generar nada
+        _, errores_revision = revisar_planilla(df_lote)
+        if errores_revision:
+            st.warning(f"⚠️ {len(errores_revision)} filas no pasan la revisión y no se generarán")
+            st.dataframe(errores_revision, use_container_width=True)
+        
+        col_procesos, col_bloque = st.columns(2)
+        with col_procesos:
+            procesos_lote = st.number_input(
+                "Procesos en paralelo:",
+                min_value=1,
+                max_value=max(PROCESOS, 1),
+                value=PROCESOS,
+                help="Cantidad de núcleos que generan cartas al mismo tiempo"
+            )
+        with col_bloque:
+            bloque_lote = st.number_input(
+                "Filas por bloque:",
+                min_value=1,
+                value=TAMANO_BLOQUE,
+                help="Filas que recibe cada proceso por envío"
+            )
+        
+        if st.button("📦 GENERAR LOTE", type="primary", use_container_width=True,
+                     disabled=bool(trabajo_en_curso("lote"))):
+            # El lote corre en segundo plano: la página sigue respondiendo mientras avanza
+            st.session_state.lote_zip = None
+            seguir_trabajo("lote", trabajos.enviar_lote(df_lote, procesos=procesos_lote, tamano_bloque=bloque_lote))
+            st.rerun()
     
-    # Si ya está formateada o no es válida, devolver tal cual
-    return fecha_input
-
-# ================= HEADER =================
-st.markdown("""
-<div style='background:linear-gradient(90deg,#1e40af,#0ea5e9);
-padding:25px;border-radius:12px;margin-bottom:25px;box-shadow:0 4px 6px rgba(0,0,0,0.1)'>
-<h1 style='color:white;margin:0;font-size:2.2em'>⚡ AUTOMATIZADOR DE CARTAS </h1>
-<p style='color:#e0f2fe;margin:8px 0 0 0;font-size:1.1em'>Sistema de Generación Automática de Respuestas</p>
-</div>
-""", unsafe_allow_html=True)
+    lote_terminado = recoger_trabajo("lote")
+    if lote_terminado:
+        if lote_terminado["estado"] == trabajos.LISTO:
+            st.session_state.lote_zip = lote_terminado["resultado"]["zip"]
+            st.session_state.lote_errores = lote_terminado["resultado"]["errores"]
+            st.session_state.lote_generadas = lote_terminado["resultado"]["generadas"]
+        else:
+            avisar_fin(lote_terminado, "")
+    if trabajo_en_curso("lote"):
+        avance_trabajo("lote", "⚡ Generando cartas... {hechas}/{total}")
+    
+    if st.session_state.get('lote_zip'):
+        st.success(f"✅ {st.session_state.lote_generadas} cartas generadas")
+        if st.session_state.lote_errores:
+            st.error(f"❌ {len(st.session_state.lote_errores)} filas con error (también en errores.csv dentro del .zip)")
+            st.dataframe(st.session_state.lote_errores, use_container_width=True)
+        st.download_button(
+            label="📥 DESCARGAR CARTAS (.zip)",
+            data=st.session_state.lote_zip,
+            file_name=f"Cartas_lote_{fecha_chile().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip",
+            use_container_width=True
+        )
+    st.stop()
 
 # ================= SELECTOR DE CATEGORÍA Y CARTA =================
 st.markdown("### 📋 SELECCIONAR TIPO DE CARTA")
@@ -182,57 +296,71 @@ with col_boton:
     st.markdown("<div style='height: 28px;'></div>", unsafe_allow_html=True)
     
     # Estilo para el botón rectangular - BLANCO con NEGRO
-    st.markdown("""
-        <style>
-        div[data-testid="stButton"] button[kind="secondary"] {
-            background-color: white !important;
-            background: white !important;
-            color: black !important;
-            border: 2px solid #000000 !important;
-            font-weight: 700 !important;
-            font-size: 0.9rem !important;
-            border-radius: 8px !important;
-            padding: 12px 8px !important;
-            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2) !important;
-            transition: all 0.3s !important;
-            width: 100% !important;
-            height: 60px !important;
-            display: flex !important;
-            align-items: center !important;
-            justify-content: center !important;
-            text-align: center !important;
-            white-space: normal !important;
-            line-height: 1.2 !important;
-        }
-        div[data-testid="stButton"] button[kind="secondary"]:hover {
-            background-color: #f0f0f0 !important;
-            background: #f0f0f0 !important;
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3) !important;
-            transform: scale(1.02) !important;
-            border-color: #000000 !important;
-            color: black !important;
-        }
-        div[data-testid="stButton"] button[kind="secondary"]:active {
-            transform: scale(0.98) !important;
-            background-color: #e0e0e0 !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(estaticos.ESTILO_BOTON_REINICIAR, unsafe_allow_html=True)
     
     # Botón rectangular con texto
     if st.button("🔄 REINICIAR FORMULARIO", type="secondary", use_container_width=True, key=f"btn_reset_{st.session_state.count_reset}"):
         st.session_state.count_reset += 1 
         st.session_state.carta_generada = False
         st.session_state.output_path = None
-        st.session_state.vista_previa_html = None
+        st.session_state.artefacto_id = None
+        st.session_state.vista_en_vivo = False
         st.rerun()
 
 st.markdown("---")
 
+# ================= VISTA PREVIA =================
+# Se arma desde el template real (cartas.vista_previa) con lo que hay en el
+# formulario, sin generar el .docx. Va en un st.empty() de la barra lateral,
+# creado antes del formulario: la dibuja la ejecución completa y, al cambiar
+# un dato, la sección que se re-ejecuta (refrescar_vista_previa).
+def mostrar_vista_previa(tipo_carta):
+    template_path = ruta_template(tipo_carta)
+    if not os.path.exists(template_path):
+        st.info(f"📝 No hay template para '{tipo_carta}'")
+        return
+
+    # Una VistaPrevia por sesión: entre ejecuciones solo se rellenan los huecos que cambiaron
+    vista = st.session_state.get("vista_previa")
+    if vista is None or vista.path_template != template_path:
+        vista = st.session_state.vista_previa = vista_previa.VistaPrevia(template_path)
+    formulario = st.session_state.formulario
+    datos = {**formulario.get("cliente", {}), **formulario.get("reclamo", {}), **formulario.get("especificos", {})}
+    st.markdown(vista.actualizar(vista_previa.reemplazos(tipo_carta, datos)), unsafe_allow_html=True)
+
+
+with st.sidebar:
+    if st.toggle("👁️ Vista previa en vivo", key="vista_en_vivo", help="La carta se actualiza mientras completas el formulario"):
+        lugar_vista_previa = st.empty()
+
 # ================= FORMULARIO =================
-col1, col2 = st.columns(2)
+# Cada sección es un fragmento: escribir en un campo vuelve a ejecutar solo
+# esa sección y no todo el script. Los valores se leen en la ejecución
+# completa que dispara "GENERAR CARTA"; cada sección además los deja en
+# st.session_state.formulario para la vista previa en vivo.
+def refrescar_vista_previa():
+    """
+    Al re-ejecutarse una sección (solo ella, como fragmento) vuelve a dibujar
+    la vista previa, sin ejecutar todo el script. En la ejecución completa la
+    sección solo reserva su lugar en el st.empty() (Streamlit lo exige para
+    que después pueda escribir ahí) y la vista se dibuja una vez, al final
+    del formulario.
+    """
+    if lugar_vista_previa is None:
+        return
+    if dibujar_vista_previa:
+        with lugar_vista_previa:
+            mostrar_vista_previa(tipo_carta)
+    else:
+        lugar_vista_previa.empty()
 
-with col1:
+
+# Pasa a True al terminar el formulario; las secciones re-ejecutadas solas lo ven así
+dibujar_vista_previa = False
+
+
+@st.fragment
+def seccion_cliente():
     st.markdown("### 📋 DATOS DEL CLIENTE")
     
     # ⭐ MEJORA: Auto-capitalizar comuna
@@ -276,7 +404,20 @@ with col1:
         autocomplete="off"
     )
 
-with col2:
+    datos = {
+        "comuna": comuna,
+        "tratamiento": tratamiento,
+        "nombre_cliente": nombre_cliente,
+        "direccion": direccion,
+        "numero_cliente": numero_cliente,
+    }
+    st.session_state.formulario["cliente"] = datos
+    refrescar_vista_previa()
+    return datos
+
+
+@st.fragment
+def seccion_reclamo():
     st.markdown("### 📄 DATOS DEL RECLAMO")
     
     gr_numero = st.text_input(
@@ -326,502 +467,146 @@ with col2:
     
     canal_ingreso = st.selectbox(
         "Canal de ingreso del reclamo:",
-        [
-            "Oficina Comercial",
-            "WhatsApp",
-            "App CGE 1Click",
-            "Call Center",
-            "Correo Electrónico",
-            "Página Web",
-            "Portal SEC",
-            "Portal SERNAC"
-        ],
+        CANALES_INGRESO,
         key=f"canal_{st.session_state.count_reset}"
     )
 
-st.markdown("---")
-
-# ================= DATOS ESPECÍFICOS POR TIPO DE CARTA =================
-if tipo_carta == "error_lectura_halu":
-    with st.expander("📊 DATOS ADICIONALES DE FACTURACIÓN (Opcional)"):
-        col_a, col_b, col_c = st.columns(3)
-        
-        with col_a:
-            fecha_boleta_raw = st.text_input(
-                "Fecha boleta:", 
-                placeholder="20122025 o 20/12/2025",
-                key=f"fecha_boleta_{st.session_state.count_reset}",
-                help="Formato: DDMMYYYY (ej: 20122025) o DD/MM/YYYY"
-            )
-            fecha_boleta = formatear_fecha(fecha_boleta_raw)
-            if fecha_boleta_raw and fecha_boleta != fecha_boleta_raw:
-                st.caption(f"📅 Formateado: {fecha_boleta}")
-            tipo_doc = st.selectbox(
-                "Tipo documento:", 
-                ["boleta", "factura"],
-                key=f"tipo_doc_{st.session_state.count_reset}"
-            )
-            numero_boleta = st.text_input(
-                "N° Boleta/Factura:", 
-                placeholder="123456",
-                key=f"num_boleta_{st.session_state.count_reset}",
-                help="Número de la boleta o factura generada"
-            )
-        
-        with col_b:
-            consumo_kwh = st.text_input(
-                "Consumo kWh:", 
-                placeholder="350",
-                key=f"consumo_kwh_{st.session_state.count_reset}"
-            )
-            monto_boleta_input = st.text_input(
-                "Monto:", 
-                placeholder="45000",
-                key=f"monto_{st.session_state.count_reset}"
-            )
-            monto_boleta = formatear_monto(monto_boleta_input) if monto_boleta_input else ""
-            if monto_boleta:
-                st.caption(f"💰 Formateado: {monto_boleta}")
-        
-        with col_c:
-            dia_inicio = st.text_input(
-                "Día inicio lectura:", 
-                placeholder="06",
-                key=f"dia_inicio_{st.session_state.count_reset}"
-            )
-            dia_fin = st.text_input(
-                "Día fin lectura:", 
-                placeholder="12",
-                key=f"dia_fin_{st.session_state.count_reset}"
-            )
-            rango_lectura = f"{dia_inicio} y {dia_fin}" if dia_inicio and dia_fin else ""
-
-elif tipo_carta == "apertura_casa_nolu":
-    with st.expander("📊 DATOS ESPECÍFICOS - APERTURA CASA CERRADA NOLU", expanded=True):
-        st.markdown("#### 📅 Periodo sin acceso al medidor")
-        
-        col_a, col_b, col_c, col_d = st.columns(4)
-        
-        with col_a:
-            periodo_inicio = st.text_input(
-                "Mes inicio sin acceso:",
-                placeholder="marzo",
-                key=f"periodo_inicio_{st.session_state.count_reset}",
-                help="Ejemplo: marzo, abril, mayo..."
-            )
-        
-        with col_b:
-            anio_inicio = st.text_input(
-                "Año inicio:",
-                placeholder="2024",
-                value="2024",
-                key=f"anio_inicio_{st.session_state.count_reset}",
-                help="Año en que comenzó el periodo sin acceso"
-            )
-        
-        with col_c:
-            periodo_fin = st.text_input(
-                "Mes fin sin acceso:",
-                placeholder="agosto",
-                key=f"periodo_fin_{st.session_state.count_reset}",
-                help="Ejemplo: agosto, septiembre..."
-            )
-        
-        with col_d:
-            anio_fin = st.text_input(
-                "Año fin:",
-                placeholder="2025",
-                value="2025",
-                key=f"anio_fin_{st.session_state.count_reset}",
-                help="Año en que se accedió al medidor"
-            )
-        
-        st.markdown("---")
-        st.markdown("#### 🔢 Número de medidor")
-        
-        numero_medidor = st.text_input(
-            "N° Medidor:",
-            placeholder="E044124",
-            key=f"numero_medidor_{st.session_state.count_reset}",
-            help="Número del medidor eléctrico"
-        )
-        
-        st.markdown("---")
-        st.markdown("#### 📊 Datos de lectura y consumo")
-        
-        col_c, col_d, col_e = st.columns(3)
-        
-        with col_c:
-            fecha_lectura_raw = st.text_input(
-                "Fecha de acceso al medidor:",
-                placeholder="08082025 o 08/08/2025",
-                key=f"fecha_lectura_{st.session_state.count_reset}",
-                help="Fecha en que se logró acceder al medidor"
-            )
-            fecha_lectura = formatear_fecha(fecha_lectura_raw)
-            if fecha_lectura_raw and fecha_lectura != fecha_lectura_raw:
-                st.caption(f"📅 Formateado: {fecha_lectura}")
-            
-            lectura_kwh_raw = st.text_input(
-                "Lectura registrada (kWh):",
-                placeholder="20041",
-                key=f"lectura_kwh_{st.session_state.count_reset}",
-                help="Lectura total registrada en el medidor"
-            )
-            lectura_kwh = formatear_numero_kwh(lectura_kwh_raw) if lectura_kwh_raw else ""
-            if lectura_kwh_raw and lectura_kwh != lectura_kwh_raw:
-                st.caption(f"🔢 Formateado: {lectura_kwh}")
-        
-        with col_d:
-            consumo_total_raw = st.text_input(
-                "Consumo total (kWh):",
-                placeholder="756",
-                key=f"consumo_total_{st.session_state.count_reset}",
-                help="Consumo total del periodo"
-            )
-            consumo_total = formatear_numero_kwh(consumo_total_raw) if consumo_total_raw else ""
-            if consumo_total_raw and consumo_total != consumo_total_raw:
-                st.caption(f"🔢 Formateado: {consumo_total}")
-            
-            consumo_provisorio_raw = st.text_input(
-                "Consumo provisorio (kWh):",
-                placeholder="184",
-                key=f"consumo_provisorio_{st.session_state.count_reset}",
-                help="Consumos provisorios descontados"
-            )
-            consumo_provisorio = formatear_numero_kwh(consumo_provisorio_raw) if consumo_provisorio_raw else ""
-            if consumo_provisorio_raw and consumo_provisorio != consumo_provisorio_raw:
-                st.caption(f"🔢 Formateado: {consumo_provisorio}")
-        
-        with col_e:
-            fecha_inicio_periodo_raw = st.text_input(
-                "Fecha inicio periodo apertura:",
-                placeholder="11032025 o 11/03/2025",
-                key=f"fecha_inicio_periodo_{st.session_state.count_reset}"
-            )
-            fecha_inicio_periodo = formatear_fecha(fecha_inicio_periodo_raw)
-            if fecha_inicio_periodo_raw and fecha_inicio_periodo != fecha_inicio_periodo_raw:
-                st.caption(f"📅 Formateado: {fecha_inicio_periodo}")
-            
-            fecha_fin_periodo_raw = st.text_input(
-                "Fecha fin periodo apertura:",
-                placeholder="08082025 o 08/08/2025",
-                key=f"fecha_fin_periodo_{st.session_state.count_reset}"
-            )
-            fecha_fin_periodo = formatear_fecha(fecha_fin_periodo_raw)
-            if fecha_fin_periodo_raw and fecha_fin_periodo != fecha_fin_periodo_raw:
-                st.caption(f"📅 Formateado: {fecha_fin_periodo}")
-        
-        st.markdown("---")
-        st.markdown("#### 💰 Reversa de Electricidad")
-        
-        monto_ajuste_input = st.text_input(
-            "Monto reversa:",
-            placeholder="39112",
-            key=f"monto_ajuste_{st.session_state.count_reset}",
-            help="Monto de la reversa de electricidad"
-        )
-        monto_ajuste = formatear_monto(monto_ajuste_input) if monto_ajuste_input else ""
-        if monto_ajuste:
-            st.caption(f"💰 Formateado: {monto_ajuste}")
-        
-        st.markdown("---")
-        st.markdown("#### 📅 Historial de consumos (BO)")
-        
-        meses_historial = st.text_input(
-            "Meses de historial:",
-            placeholder="24",
-            value="24",
-            key=f"meses_historial_{st.session_state.count_reset}",
-            help="Cantidad de meses del historial (ejemplo: 24)"
-        )
-
-elif tipo_carta == "aumento_consumo_halu_sinvisita":
-    with st.expander("📊 DATOS ESPECÍFICOS - AUMENTO CONSUMO SIN VISITA", expanded=True):
-        st.markdown("#### 📅 Historial de consumos")
-        
-        meses_historial_aumento = st.text_input(
-            "Meses de historial:",
-            placeholder="24",
-            value="24",
-            key=f"meses_historial_aumento_{st.session_state.count_reset}",
-            help="Cantidad de meses del historial de consumo"
-        )
-        
-        st.markdown("---")
-        st.markdown("#### 💰 Rebaja aplicada")
-        
-        monto_rebaja_input = st.text_input(
-            "Monto de rebaja:",
-            placeholder="80058",
-            key=f"monto_rebaja_{st.session_state.count_reset}",
-            help="Monto de la rebaja aplicada por promedio histórico"
-        )
-        monto_rebaja = formatear_monto(monto_rebaja_input) if monto_rebaja_input else ""
-        if monto_rebaja:
-            st.caption(f"💰 Formateado: {monto_rebaja}")
-
-elif tipo_carta == "aumento_consumo_nolu_sinvisita":
-    with st.expander("📊 DATOS ESPECÍFICOS - AUMENTO CONSUMO NOLU SIN VISITA", expanded=True):
-        st.markdown("#### 📅 Historial de consumos")
-        
-        meses_historial_nolu = st.text_input(
-            "Meses de historial:",
-            placeholder="24",
-            value="24",
-            key=f"meses_historial_nolu_{st.session_state.count_reset}",
-            help="Cantidad de meses del historial de consumo"
-        )
+    datos = {
+        "gr_numero": gr_numero,
+        "tipo_caso": tipo_caso,
+        "caso_sec_numero": caso_sec_numero,
+        "zona": zona,
+        "canal_ingreso": canal_ingreso,
+    }
+    st.session_state.formulario["reclamo"] = datos
+    refrescar_vista_previa()
+    return datos
 
-elif tipo_carta == "facturaciones_normalizadas":
-    with st.expander("📊 DATOS ESPECÍFICOS - FACTURACIONES NORMALIZADAS", expanded=True):
-        st.markdown("#### 📝 Motivo del reclamo")
-        
-        motivo_reclamo_fn = st.text_input(
-            "Motivo del reclamo:",
-            placeholder="error en la lectura",
-            key=f"motivo_reclamo_fn_{st.session_state.count_reset}",
-            help="Ejemplo: error en la lectura, aumento consumo, servicio no facturado, etc."
-        )
-        
-        st.markdown("---")
-        st.markdown("#### 📅 Rango de días de lectura")
-        
-        col_a, col_b = st.columns(2)
-        
-        with col_a:
-            dia_inicio_fn = st.text_input(
-                "Día inicio:",
-                placeholder="15",
-                key=f"dia_inicio_fn_{st.session_state.count_reset}",
-                help="Día de inicio del rango de lectura"
-            )
-        
-        with col_b:
-            dia_fin_fn = st.text_input(
-                "Día fin:",
-                placeholder="20",
-                key=f"dia_fin_fn_{st.session_state.count_reset}",
-                help="Día de fin del rango de lectura"
-            )
 
-elif tipo_carta == "carta_aporte_lectura":
-    with st.expander("📊 DATOS ESPECÍFICOS - APORTE LECTURA", expanded=True):
-        st.markdown("#### 📅 Fecha del requerimiento")
-        
-        fecha_requerimiento_raw = st.text_input(
-            "Fecha del requerimiento:",
-            placeholder="24112025 o 24/11/2025",
-            key=f"fecha_requerimiento_{st.session_state.count_reset}",
-            help="Fecha en que se efectuó el requerimiento"
-        )
-        fecha_requerimiento = formatear_fecha(fecha_requerimiento_raw)
-        if fecha_requerimiento_raw and fecha_requerimiento != fecha_requerimiento_raw:
-            st.caption(f"📅 Formateado: {fecha_requerimiento}")
-        
-        st.info("ℹ️ El N° de requerimiento se copiará automáticamente del N° GR")
+col1, col2 = st.columns(2)
 
-elif tipo_carta == "error_lectura_regularizado_sgte_lectura":
-    with st.expander("📊 DATOS ESPECÍFICOS - ERROR LECTURA REGULARIZADO", expanded=True):
-        st.markdown("#### 📅 Rango de días de lectura")
-        
-        col_a, col_b = st.columns(2)
-        
-        with col_a:
-            dia_inicio_reg = st.text_input(
-                "Día inicio:",
-                placeholder="13",
-                key=f"dia_inicio_reg_{st.session_state.count_reset}",
-                help="Día de inicio del rango"
-            )
-        
-        with col_b:
-            dia_fin_reg = st.text_input(
-                "Día fin:",
-                placeholder="18",
-                key=f"dia_fin_reg_{st.session_state.count_reset}",
-                help="Día de fin del rango"
-            )
-        
-        st.markdown("---")
-        st.markdown("#### 📅 Historial de consumos (BO)")
-        
-        meses_historial_reg = st.text_input(
-            "Meses de historial:",
-            placeholder="24",
-            value="24",
-            key=f"meses_historial_reg_{st.session_state.count_reset}",
-            help="Cantidad de meses del historial"
-        )
+with col1:
+    datos_cliente = seccion_cliente()
 
-elif tipo_carta == "error_lectura_nolu":
-    with st.expander("📊 DATOS ESPECÍFICOS - ERROR LECTURA NOLU", expanded=True):
-        st.markdown("#### 📅 Rango de días de lectura")
-        
-        col_a, col_b = st.columns(2)
-        
-        with col_a:
-            dia_inicio_nolu = st.text_input(
-                "Día inicio:",
-                placeholder="10",
-                key=f"dia_inicio_nolu_{st.session_state.count_reset}",
-                help="Día de inicio del rango"
-            )
-        
-        with col_b:
-            dia_fin_nolu = st.text_input(
-                "Día fin:",
-                placeholder="15",
-                key=f"dia_fin_nolu_{st.session_state.count_reset}",
-                help="Día de fin del rango"
-            )
-        
-        st.markdown("---")
-        st.markdown("#### 📊 Datos de facturación")
-        
-        col_c, col_d = st.columns(2)
-        
-        with col_c:
-            fecha_factura_nolu_raw = st.text_input(
-                "Fecha factura:",
-                placeholder="15122025 o 15.12.2025",
-                key=f"fecha_factura_nolu_{st.session_state.count_reset}",
-                help="Fecha de la factura (se formateará con puntos: dd.mm.yyyy)"
-            )
-            # Para esta carta específica, formatear con PUNTOS en lugar de barras
-            fecha_temp = formatear_fecha(fecha_factura_nolu_raw)
-            fecha_factura_nolu = fecha_temp.replace('/', '.') if fecha_temp else ""
-            if fecha_factura_nolu_raw and fecha_factura_nolu != fecha_factura_nolu_raw:
-                st.caption(f"📅 Formateado: {fecha_factura_nolu}")
-        
-        with col_d:
-            monto_factura_nolu_input = st.text_input(
-                "Monto factura:",
-                placeholder="36745",
-                key=f"monto_factura_nolu_{st.session_state.count_reset}",
-                help="Monto de la factura"
-            )
-            monto_factura_nolu = formatear_monto(monto_factura_nolu_input) if monto_factura_nolu_input else ""
-            if monto_factura_nolu:
-                st.caption(f"💰 Formateado: {monto_factura_nolu}")
-
-elif tipo_carta == "atencion_emergencia_halu":
-    with st.expander("📊 DATOS ESPECÍFICOS - ATENCIÓN EMERGENCIAS FORMULARIO 21", expanded=True):
-        st.markdown("#### 📋 Datos de Formulario 21")
-        st.markdown("##### 👤 Persona que solicitó atención emergencias")
-        
-        col_a, col_b = st.columns(2)
-        
-        with col_a:
-            # ⭐ Selector de Señor/Señora para quien solicitó
-            tratamiento_solicitante = st.selectbox(
-                "Formalidad (Señor o Señora):",
-                ["", "Señor", "Señora"],
-                key=f"tratamiento_solicitante_{st.session_state.count_reset}",
-                help="Tratamiento de quien solicitó la emergencia (puede ser distinto a quien va dirigida la carta)"
-            )
-            
-            nombre_solicitante_raw = st.text_input(
-                "Nombre completo:",
-                placeholder="Mariana Lidia Espinoza Osorio",
-                key=f"nombre_solicitante_{st.session_state.count_reset}",
-                help="Nombre completo de quien solicitó la atención"
-            )
-            nombre_solicitante = capitalizar_texto(nombre_solicitante_raw)
-        
-        with col_b:
-            fecha_solicitud_formulario_raw = st.text_input(
-                "Fecha de solicitud en formulario:",
-                placeholder="03102025 o 03/10/2025",
-                key=f"fecha_solicitud_formulario_{st.session_state.count_reset}",
-                help="Fecha en que se solicitó la atención en el formulario 21"
-            )
-            fecha_solicitud_formulario = formatear_fecha(fecha_solicitud_formulario_raw)
-            if fecha_solicitud_formulario_raw and fecha_solicitud_formulario != fecha_solicitud_formulario_raw:
-                st.caption(f"📅 Formateado: {fecha_solicitud_formulario}")
-        
-        st.markdown("---")
-        st.markdown("#### 💰 Monto de Atención de Emergencias")
-        
-        col_c, col_d = st.columns(2)
-        
-        with col_c:
-            monto_emerg_input = st.text_input(
-                "Monto:",
-                placeholder="24903",
-                key=f"monto_emerg_{st.session_state.count_reset}",
-                help="Monto de la atención de emergencia"
-            )
-            monto_emerg = formatear_monto(monto_emerg_input) if monto_emerg_input else ""
-            if monto_emerg:
-                st.caption(f"💰 Formateado: {monto_emerg}")
-        
-        with col_d:
-            fecha_emision_boleta_raw = st.text_input(
-                "Fecha de emisión boleta:",
-                placeholder="15102025 o 15/10/2025",
-                key=f"fecha_emision_boleta_{st.session_state.count_reset}",
-                help="Fecha de emisión de la boleta"
-            )
-            fecha_emision_boleta = formatear_fecha(fecha_emision_boleta_raw)
-            if fecha_emision_boleta_raw and fecha_emision_boleta != fecha_emision_boleta_raw:
-                st.caption(f"📅 Formateado: {fecha_emision_boleta}")
-        
-        st.markdown("---")
-        st.markdown("#### 📄 N° Boleta donde se facturó monto de atención de emergencias")
-        
-        numero_boleta_emerg = st.text_input(
-            "N° Boleta:",
-            placeholder="460506214",
-            key=f"numero_boleta_emerg_{st.session_state.count_reset}",
-            help="Número de la boleta donde se facturó la emergencia"
-        )
-        
-        st.markdown("---")
-        st.markdown("#### 📋 Numero de Nota de crédito")
-        
-        nota_credito = st.text_input(
-            "N° Nota de crédito:",
-            placeholder="6669093",
-            key=f"nota_credito_{st.session_state.count_reset}",
-            help="Número de la nota de crédito"
-        )
+with col2:
+    datos_reclamo = seccion_reclamo()
 
-elif tipo_carta == "carta_falta_info":
-    with st.expander("📊 DATOS ESPECÍFICOS - CARTA FALTA INFO", expanded=True):
-        st.info("ℹ️ El N° de reclamo ingresado se copiará automáticamente del N° GR")
-        st.markdown("Esta carta no requiere campos adicionales")
+st.markdown("---")
 
-elif tipo_carta in ["carta_compromiso", "carta_compromiso_i5", "normal_avance"]:
-    # Estas cartas no requieren campos específicos adicionales
-    pass
+# ================= DATOS ESPECÍFICOS POR TIPO DE CARTA =================
+# Campos propios de cada carta, generados desde cartas.registro con los nombres que usa cartas.generador
+ICONOS_FORMATO = {"fecha": "📅", "fecha_puntos": "📅", "monto": "💰", "kwh": "🔢"}
+
+
+def campo_especifico(tipo_carta, campo, definicion):
+    """Widget de un campo del registro; devuelve el valor ya formateado"""
+    key = f"{campo}_{tipo_carta}_{st.session_state.count_reset}"
+    if definicion.get("opciones"):
+        return st.selectbox(definicion["etiqueta"], definicion["opciones"], key=key, help=definicion.get("ayuda"))
+
+    valor_raw = st.text_input(
+        definicion["etiqueta"],
+        value=definicion.get("valor", ""),
+        placeholder=definicion.get("placeholder"),
+        key=key,
+        help=definicion.get("ayuda")
+    )
+    formato = definicion.get("formato")
+    valor = registro.formatear(formato, valor_raw) if valor_raw else ""
+    if formato in ICONOS_FORMATO and valor_raw and valor != valor_raw:
+        st.caption(f"{ICONOS_FORMATO[formato]} Formateado: {valor}")
+    return valor
+
+
+@st.fragment
+def seccion_especifica(tipo_carta):
+    datos_especificos = {}
+    st.session_state.formulario["especificos"] = datos_especificos
+    definicion = registro.carta(tipo_carta)
+    formulario = definicion["formulario"]
+    if formulario is None:
+        # Esta carta no requiere campos específicos adicionales
+        return datos_especificos
+
+    campos = definicion.get("campos", {})
+    with st.expander(formulario["titulo"], expanded=formulario["abierto"]):
+        for i, seccion in enumerate(definicion["secciones"]):
+            if i:
+                st.markdown("---")
+            if seccion.get("titulo"):
+                st.markdown(f"#### {seccion['titulo']}")
+            if seccion.get("subtitulo"):
+                st.markdown(f"##### {seccion['subtitulo']}")
+
+            columnas = seccion.get("columnas", [])
+            # Una sola columna va a todo el ancho, igual que el resto del formulario
+            contenedores = st.columns(len(columnas)) if len(columnas) > 1 else [st.container()] * len(columnas)
+            for contenedor, nombres in zip(contenedores, columnas):
+                with contenedor:
+                    for campo in nombres:
+                        datos_especificos[campo] = campo_especifico(tipo_carta, campo, campos[campo])
+
+            if seccion.get("nota"):
+                st.info(seccion["nota"])
+            if seccion.get("texto"):
+                st.markdown(seccion["texto"])
+
+    refrescar_vista_previa()
+    return datos_especificos
+
+
+datos_especificos = seccion_especifica(tipo_carta)
+
+dibujar_vista_previa = True
+refrescar_vista_previa()
 
 
 # ================= TABLA EXCEL =================
 with st.expander("📎 TABLA DE DATOS (Opcional - se agrega al final)"):
-    st.warning("⚙️ **Funcionalidad en desarrollo** - Próximamente podrás adjuntar tablas dinámicas de Excel")
-    st.info("💡 Copia y pega tabla desde Excel usando TAB como separador")
+    st.info("💡 Copia y pega tabla desde Excel usando TAB como separador, o sube el archivo")
     tabla_excel = st.text_area(
         "Pegar datos aquí:",
         height=150,
         placeholder="Período\tConsumo\tMonto\nEne-2025\t150\t$45.000",
-        key=f"tabla_excel_{st.session_state.count_reset}",
-        disabled=True  # Deshabilitado mientras está en desarrollo
+        key=f"tabla_excel_{st.session_state.count_reset}"
+    )
+    archivo_tabla = st.file_uploader(
+        "O subir archivo:",
+        type=["xlsx", "csv"],
+        key=f"archivo_tabla_{st.session_state.count_reset}"
     )
     
-    # TEMPORALMENTE DESHABILITADO - En desarrollo
     df = None
-    # if tabla_excel:
-    #     try:
-    #         df = pd.read_csv(StringIO(tabla_excel), sep="\t")
-    #         st.success(f"✅ {len(df)} filas cargadas")
-    #         st.dataframe(df, use_container_width=True)
-    #     except:
-    #         st.error("⚠️ Formato incorrecto. Asegúrate de separar con TAB")
+    if tabla_excel.strip() or archivo_tabla is not None:
+        # pandas solo se carga si la carta lleva anexo
+        from cartas import anexo
+        
+        try:
+            if archivo_tabla is not None:
+                df = anexo.leer_archivo(archivo_tabla, archivo_tabla.name)
+            else:
+                df = anexo.leer_tabla(tabla_excel)
+        except Exception as e:
+            st.error(f"⚠️ No se pudo leer la tabla: {str(e)}. Asegúrate de separar con TAB")
+        else:
+            if df.empty:
+                df = None
+            else:
+                st.success(f"✅ {len(df)} filas cargadas")
+                # Así quedará en la carta (montos y kWh formateados)
+                st.dataframe(anexo.formatear_tabla(df), use_container_width=True, hide_index=True)
 
 st.markdown("---")
 
 # ================= BOTONES GENERAR Y DESCARGAR =================
+# Si la carta enviada ya terminó se deja lista para descargar antes de dibujar los botones
+carta_terminada = recoger_trabajo("carta")
+if carta_terminada and carta_terminada["estado"] == trabajos.LISTO:
+    arranque.informar("primera carta")
+    st.session_state.carta_generada = True
+    st.session_state.artefacto_id = carta_terminada["resultado"]["artefacto_id"]
+    st.session_state.output_path = carta_terminada["resultado"]["output_path"]
+
 col_btn1, col_btn2, col_btn3, col_btn4 = st.columns([1, 1.2, 1.2, 1])
 
 with col_btn2:
@@ -829,380 +614,95 @@ with col_btn2:
         "📝 GENERAR CARTA", 
         type="primary", 
         use_container_width=True,
+        disabled=bool(trabajo_en_curso("carta")),
         key=f"btn_generar_{st.session_state.count_reset}"
     )
 
 with col_btn3:
-    if st.session_state.get('carta_generada') and st.session_state.get('output_path'):
-        if os.path.exists(st.session_state.output_path):
-            with open(st.session_state.output_path, "rb") as f:
-                st.download_button(
-                    label="📥 DESCARGAR CARTA",
-                    data=f,
-                    file_name=os.path.basename(st.session_state.output_path),
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True,
-                    key=f"btn_descarga_{st.session_state.count_reset}"
-                )
+    # Los bytes salen de la caché en memoria; output/ solo se lee si la carta ya fue expulsada
+    artefacto = None
+    if st.session_state.get('carta_generada'):
+        artefacto = obtener_artefacto(st.session_state.artefacto_id, st.session_state.output_path)
+    if artefacto:
+        nombre_descarga, contenido_descarga = artefacto
+        st.download_button(
+            label="📥 DESCARGAR CARTA",
+            data=contenido_descarga,
+            file_name=nombre_descarga,
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            use_container_width=True,
+            key=f"btn_descarga_{st.session_state.count_reset}"
+        )
 
 if generar:
-    campos_requeridos = {
-        "Nombre cliente": nombre_cliente,
-        "N° GR": gr_numero,
-        "Dirección": direccion,
-        "Comuna": comuna,
-        "Número cliente": numero_cliente,
-        "Tratamiento": tratamiento
-    }
+    datos = {**datos_cliente, **datos_reclamo, **datos_especificos}
     
-    faltantes = [k for k, v in campos_requeridos.items() if not v]
+    faltantes = campos_faltantes(datos)
     
     if faltantes:
         st.error(f"❌ Faltan campos obligatorios: {', '.join(faltantes)}")
     else:
-        template_path = f"templates/{tipo_carta}.docx"
+        template_path = ruta_template(tipo_carta)
         
         if not os.path.exists(template_path):
             st.error(f"❌ No se encontró el template: {template_path}")
             st.info(f"📝 Copia tu carta Word a la carpeta 'templates/' como '{tipo_carta}.docx'")
         else:
-            with st.spinner("⚡ Generando carta..."):
-                try:
-                    from datetime import datetime, timedelta, timezone
-                    tz_chile = timezone(timedelta(hours=-3))
-                    hoy = datetime.now(tz_chile)
-                    
-                    meses = ["", "enero", "febrero", "marzo", "abril", "mayo", "junio",
-                             "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
-                    fecha_completa = f"{comuna}, {hoy.day} de {meses[hoy.month]} de {hoy.year}"
-                    
-                    if canal_ingreso == "WhatsApp":
-                        texto_canal = "WhatsApp"
-                    elif canal_ingreso in CANALES_EXTERNOS:
-                        # Canales externos: solo el nombre (el template ya tiene "a través de")
-                        texto_canal = canal_ingreso
-                    elif canal_ingreso in CANALES_MASCULINO:
-                        texto_canal = f"nuestro {canal_ingreso}"
-                    else:
-                        texto_canal = f"nuestra {canal_ingreso}"
-                    
-                    estimado = "Estimado" if tratamiento == "Señor" else "Estimada"
-                    primer_nombre = nombre_cliente.split()[0] if nombre_cliente else "Cliente"
-                    
-                    doc = Document(template_path)
-                    
-                    # REEMPLAZOS COMUNES
-                    reemplazos = {
-                        "Valparaiso, 16 de diciembre de [202X]": fecha_completa,
-                        "Valparaíso, 16 de diciembre de [202X]": fecha_completa,
-                        "Valparaiso": comuna,
-                        "Valparaíso": comuna,
-                        "[Comuna]": comuna,
-                        "DGR N.º XXXXXXX /[202X]": f"DGR N° {gr_numero} /{hoy.year}",
-                        # Variantes de Ref.: Reclamo (se reemplazará después si hay caso SEC)
-                        "Ref.: Reclamo N° 15965848": f"Ref.: Reclamo N° {gr_numero}",
-                        "Ref.: Reclamo N° XXXXXXX": f"Ref.: Reclamo N° {gr_numero}",
-                        "Reclamo N° XXXXXXX": f"Ref.: Reclamo N° {gr_numero}",  # Agrega "Ref.:" si falta
-                        "Número de cliente: 15965848": f"Número de cliente: {numero_cliente}",
-                        "[Señor(a)]": tratamiento,
-                        "[Nombre y apellido reclamante]": nombre_cliente,
-                        "[Dirección]": direccion,
-                        "[Estimado(a) Nombre,]": f"{estimado} {primer_nombre},",
-                        "[(Ej: nuestra Oficina Comercial / WhatsApp / App CGE 1Click / Call Center / Correo Electrónico / Página Web).]": f"{texto_canal}.",
-                        "[Nombre y apellido Gerente Comercial]": GERENTES[zona],
-                    }
-                    
-                    # Caso SEC/SERNAC (opcional)
-                    # Si hay caso SEC/SERNAC, reemplaza COMPLETAMENTE la línea de Reclamo
-                    # Si NO hay, deja solo "Ref.: Reclamo N°"
-                    if tiene_caso_sec and caso_sec_numero and tipo_caso:
-                        # Reemplazar COMPLETAMENTE con la línea de Caso SEC/SERNAC
-                        texto_caso = f"Ref.: Caso {tipo_caso} N° {caso_sec_numero}, Reclamo N° {gr_numero}"
-                        reemplazos["Ref.: Reclamo N° XXXXXXX"] = texto_caso
-                        reemplazos["Reclamo N° XXXXXXX"] = texto_caso
-                    # Si no hay caso SEC, ya se reemplazó arriba con "Ref.: Reclamo N° {gr_numero}"
-
-
-                    # REEMPLAZOS ESPECÍFICOS POR TIPO DE CARTA
-                    if tipo_carta == "error_lectura_halu":
-                        if 'rango_lectura' in locals() and rango_lectura:
-                            reemplazos["[XXXXXX y XXXXXX.]"] = f"{rango_lectura}."
-                            reemplazos["[XXXXXX y XXXXXX]"] = rango_lectura
-                            reemplazos["XXXXXX y XXXXXX"] = rango_lectura
-                        if 'fecha_boleta' in locals() and fecha_boleta:
-                            reemplazos["[día/mes/año]"] = fecha_boleta
-                        if 'tipo_doc' in locals() and tipo_doc:
-                            reemplazos["[boleta/factura]"] = tipo_doc
-                        if 'numero_boleta' in locals() and numero_boleta:
-                            reemplazos["[XXXXXX]"] = numero_boleta
-                        if 'consumo_kwh' in locals() and consumo_kwh:
-                            reemplazos["XXX kWh"] = f"{consumo_kwh} kWh"
-                        if 'monto_boleta' in locals() and monto_boleta:
-                            reemplazos["[$ XX.XXX]"] = monto_boleta
-                    
-                    elif tipo_carta == "apertura_casa_nolu":
-                        # Periodo sin acceso (con año inicio y fin)
-                        if 'periodo_inicio' in locals() and periodo_inicio and 'periodo_fin' in locals() and periodo_fin and 'anio_inicio' in locals() and anio_inicio and 'anio_fin' in locals() and anio_fin:
-                            # Si es el mismo año: "marzo a agosto del 2025"
-                            if anio_inicio == anio_fin:
-                                periodo_texto = f"{periodo_inicio} a {periodo_fin} del {anio_fin}"
-                            else:
-                                # Si son años diferentes: "marzo del 2024 a agosto del 2025"
-                                periodo_texto = f"{periodo_inicio} del {anio_inicio} a {periodo_fin} del {anio_fin}"
-                            reemplazos["[marzo a agosto del 2025]"] = periodo_texto
-                        
-                        # Número de medidor
-                        if 'numero_medidor' in locals() and numero_medidor:
-                            reemplazos["[E044124]"] = numero_medidor
-                        
-                        # Fecha de lectura
-                        if 'fecha_lectura' in locals() and fecha_lectura:
-                            reemplazos["[08/08/2025]"] = fecha_lectura
-                        
-                        # Lectura registrada
-                        if 'lectura_kwh' in locals() and lectura_kwh:
-                            reemplazos["[20.041]"] = lectura_kwh
-                            reemplazos["[20041]"] = lectura_kwh
-                        
-                        # Consumo total
-                        if 'consumo_total' in locals() and consumo_total:
-                            reemplazos["[756]"] = consumo_total
-                        
-                        # Periodo completo
-                        if 'fecha_inicio_periodo' in locals() and fecha_inicio_periodo and 'fecha_fin_periodo' in locals() and fecha_fin_periodo:
-                            periodo_completo = f"{fecha_inicio_periodo} a {fecha_fin_periodo}"
-                            reemplazos["[11/03/2025 a 08/08/2025]"] = periodo_completo
-                        
-                        # Consumo provisorio
-                        if 'consumo_provisorio' in locals() and consumo_provisorio:
-                            reemplazos["[184]"] = consumo_provisorio
-                        
-                        # Monto ajuste
-                        if 'monto_ajuste' in locals() and monto_ajuste:
-                            reemplazos["[$39.112]"] = monto_ajuste
-                        
-                        # Meses de historial
-                        if 'meses_historial' in locals() and meses_historial:
-                            reemplazos["[24]"] = meses_historial
-                    
-                    elif tipo_carta == "aumento_consumo_halu_sinvisita":
-                        # Meses de historial
-                        if 'meses_historial_aumento' in locals() and meses_historial_aumento:
-                            reemplazos["[24]"] = meses_historial_aumento
-                        
-                        # Monto de rebaja
-                        if 'monto_rebaja' in locals() and monto_rebaja:
-                            reemplazos["[$80.058]"] = monto_rebaja
-                    
-                    elif tipo_carta == "aumento_consumo_nolu_sinvisita":
-                        # Meses de historial
-                        if 'meses_historial_nolu' in locals() and meses_historial_nolu:
-                            reemplazos["[24]"] = meses_historial_nolu
-                    
-                    elif tipo_carta == "facturaciones_normalizadas":
-                        # Motivo del reclamo
-                        if 'motivo_reclamo_fn' in locals() and motivo_reclamo_fn:
-                            reemplazos["[error en la lectura]"] = motivo_reclamo_fn
-                        
-                        # Rango de días
-                        if 'dia_inicio_fn' in locals() and dia_inicio_fn and 'dia_fin_fn' in locals() and dia_fin_fn:
-                            rango_dias = f"{dia_inicio_fn} y {dia_fin_fn}"
-                            reemplazos["[15 y 20]"] = rango_dias
-                    
-                    elif tipo_carta == "carta_aporte_lectura":
-                        # N° de requerimiento (igual que GR)
-                        reemplazos["[15939748]"] = gr_numero
-                        
-                        # Fecha del requerimiento
-                        if 'fecha_requerimiento' in locals() and fecha_requerimiento:
-                            reemplazos["[24/11/2025]"] = fecha_requerimiento
-                    
-                    elif tipo_carta == "error_lectura_regularizado_sgte_lectura":
-                        # Rango de días
-                        if 'dia_inicio_reg' in locals() and dia_inicio_reg and 'dia_fin_reg' in locals() and dia_fin_reg:
-                            rango_dias_reg = f"{dia_inicio_reg} y {dia_fin_reg}"
-                            reemplazos["[13 y 18]"] = rango_dias_reg
-                        
-                        # Meses de historial
-                        if 'meses_historial_reg' in locals() and meses_historial_reg:
-                            reemplazos["[24]"] = meses_historial_reg
-                    
-                    elif tipo_carta == "error_lectura_nolu":
-                        # Rango de días
-                        if 'dia_inicio_nolu' in locals() and dia_inicio_nolu and 'dia_fin_nolu' in locals() and dia_fin_nolu:
-                            rango_dias_nolu = f"{dia_inicio_nolu} y {dia_fin_nolu}"
-                            reemplazos["[10 y 15]"] = rango_dias_nolu
-                        
-                        # Fecha factura
-                        if 'fecha_factura_nolu' in locals() and fecha_factura_nolu:
-                            reemplazos["[15.12.2025]"] = fecha_factura_nolu
-                        
-                        # Lectura kWh (SIN signo $, solo número con puntos)
-                        if 'monto_factura_nolu_input' in locals() and monto_factura_nolu_input:
-                            # Formatear solo con puntos de miles, sin $
-                            valor_limpio = str(monto_factura_nolu_input).replace('$', '').replace('.', '').replace(',', '').strip()
-                            if valor_limpio:
-                                numero = int(valor_limpio)
-                                lectura_formateada = f"{numero:,}".replace(',', '.')
-                                reemplazos["[$65.000]"] = lectura_formateada
-                                reemplazos["[36.745]"] = lectura_formateada
-                    
-                    elif tipo_carta == "atencion_emergencia_halu":
-                        # Fecha de solicitud en formulario
-                        if 'fecha_solicitud_formulario' in locals() and fecha_solicitud_formulario:
-                            reemplazos["[03/10/2025]"] = fecha_solicitud_formulario
-                        
-                        # Persona solicitante con "el Sr." o "la Sra."
-                        if 'nombre_solicitante' in locals() and nombre_solicitante and 'tratamiento_solicitante' in locals() and tratamiento_solicitante:
-                            # Determinar artículo según tratamiento DEL SOLICITANTE
-                            if tratamiento_solicitante == "Señor":
-                                texto_solicitante = f"el Sr. {nombre_solicitante}"
-                            else:  # Señora
-                                texto_solicitante = f"la Sra. {nombre_solicitante}"
-                            
-                            reemplazos["[Mariana Lidia Espinoza Osorio]"] = nombre_solicitante
-                            reemplazos["[el(a) Sr(a). XXXXXX XXXXXX]"] = texto_solicitante
-                        
-                        # Monto
-                        if 'monto_emerg' in locals() and monto_emerg:
-                            reemplazos["[$24.903]"] = monto_emerg
-                        
-                        # Número de boleta
-                        if 'numero_boleta_emerg' in locals() and numero_boleta_emerg:
-                            reemplazos["[460506214]"] = numero_boleta_emerg
-                        
-                        # Fecha de emisión boleta
-                        if 'fecha_emision_boleta' in locals() and fecha_emision_boleta:
-                            reemplazos["[15/10/2025]"] = fecha_emision_boleta
-                        
-                        # Nota de crédito
-                        if 'nota_credito' in locals() and nota_credito:
-                            reemplazos["[6669093]"] = nota_credito
-                    
-                    elif tipo_carta == "carta_falta_info":
-                        # N° de reclamo ingresado (igual que GR)
-                        reemplazos["[15939815]"] = gr_numero
-                    
-                    reemplazos_ordenados = sorted(reemplazos.items(), key=lambda x: len(x[0]), reverse=True)
-                    
-                    def aplicar_reemplazos(texto):
-                        for key, value in reemplazos_ordenados:
-                            texto = texto.replace(key, str(value))
-                        return texto
-                    
-                    # Aplicar a párrafos
-                    for paragraph in doc.paragraphs:
-                        texto = paragraph.text
-                        texto_nuevo = aplicar_reemplazos(texto)
-                        if texto_nuevo != texto:
-                            paragraph.clear()
-                            run = paragraph.add_run(texto_nuevo)
-                            run.font.name = 'Arial'
-                            run.font.size = Pt(10)
-                            
-                            # SOLO estas palabras van en negrita (SIN fecha, SIN DGR, SIN cuerpo de carta)
-                            palabras_con_negrita = [
-                                tratamiento, 
-                                nombre_cliente, 
-                                direccion,
-                                "Número de cliente:", 
-                                "Ref.: Reclamo N°", 
-                                GERENTES[zona], 
-                                "COMPAÑÍA GENERAL DE ELECTRICIDAD S.A."
-                            ]
-                            
-                            # Aplica negrita SOLO si coincide Y NO es fecha ni DGR
-                            es_fecha = (f"{comuna}," in texto_nuevo and "de" in texto_nuevo and str(hoy.year) in texto_nuevo)
-                            es_dgr = ("DGR N°" in texto_nuevo and str(hoy.year) in texto_nuevo)
-                            
-                            # NO aplicar negrita si el texto es muy largo (más de 100 caracteres = cuerpo de carta)
-                            es_cuerpo_carta = len(texto_nuevo) > 100
-                            
-                            if any(x in texto_nuevo for x in palabras_con_negrita) and not es_fecha and not es_dgr and not es_cuerpo_carta:
-                                run.font.bold = True
-                            else:
-                                run.font.bold = False
-                            
-                            # Excepción: Si el párrafo es SOLO la comuna (una línea), SÍ va en negrita
-                            if texto_nuevo.strip() == comuna:
-                                run.font.bold = True
-                    
-                    # Tablas
-                    for table in doc.tables:
-                        for row in table.rows:
-                            for cell in row.cells:
-                                for p in cell.paragraphs:
-                                    texto = aplicar_reemplazos(p.text)
-                                    if texto != p.text:
-                                        p.clear()
-                                        r = p.add_run(texto)
-                                        r.font.name = 'Arial'
-                                        r.font.size = Pt(10)
-                    
-                    # Excel Anexo
-                    if df is not None:
-                        doc.add_page_break()
-                        doc.add_heading("Anexo - Datos Adicionales", level=1)
-                        table = doc.add_table(rows=len(df)+1, cols=len(df.columns))
-                        table.style = "Light Grid Accent 1"
-                        for i, col in enumerate(df.columns):
-                            cell = table.rows[0].cells[i]
-                            cell.text = str(col)
-                        for i, row in df.iterrows():
-                            for j, value in enumerate(row):
-                                table.rows[i+1].cells[j].text = str(value)
-                    
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"Carta_{tipo_carta}_{gr_numero}_{timestamp}.docx"
-                    output_path = os.path.join("output", filename)
-                    doc.save(output_path)
-                    
-                    st.session_state.carta_generada = True
-                    st.session_state.output_path = output_path
-                    
-                    st.session_state.vista_previa_html = f"""
-                        <div style='font-family:Arial;font-size:10pt;background:white;padding:20px;border:1px solid #ddd;border-radius:8px;color:black'>
-                            <div style='text-align:right;margin-bottom:20px'>
-                                <p style='margin:0'>{comuna}, {hoy.day} de {meses[hoy.month]} de {hoy.year}</p>
-                                <p style='margin:0'>DGR N° {gr_numero} /{hoy.year}</p>
-                            </div>
-                            <p><strong>{tratamiento}</strong></p>
-                            <p><strong>{nombre_cliente}</strong></p>
-                            <p><strong>{direccion}</strong></p>
-                            <p><strong>{comuna}</strong></p>
-                            <p style='margin-top:10px'><strong>Número de cliente: {numero_cliente}</strong></p>
-                            <p><strong>Ref.: Reclamo N° {gr_numero}</strong></p>
-                            <p style='margin-top:15px'>{estimado} {primer_nombre},</p>
-                            <p style='text-align:justify'>Junto con saludar, le confirmamos que hemos recibido su reclamo...</p>
-                        </div>
-                    """
-                    st.success("✅ ¡Carta generada exitosamente!")
-                    st.rerun()
-
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
-                    with st.expander("🔍 Ver detalles del error"):
-                        st.code(str(e))
-
-# MOSTRAR VISTA PREVIA
-if st.session_state.get('carta_generada') and 'vista_previa_html' in st.session_state:
-    with st.expander("👁️ VER VISTA PREVIA", expanded=True):
-        st.markdown(st.session_state.vista_previa_html, unsafe_allow_html=True)
+            # La carta se genera en segundo plano (cartas.trabajos); avance_trabajo la sigue
+            st.session_state.carta_generada = False
+            seguir_trabajo("carta", trabajos.enviar_carta(tipo_carta, datos, anexo=df))
+            st.rerun()
+
+if trabajo_en_curso("carta"):
+    avance_trabajo("carta", "⚡ Generando carta...")
+elif carta_terminada:
+    avisar_fin(carta_terminada, "✅ ¡Carta generada exitosamente!")
 
 # FOOTER
+# Fragmento con refresco propio: los contadores se actualizan sin rerun completo
+@st.fragment(run_every=60)
+def pie_de_pagina():
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("📁 Cartas", indice.contadores()["generadas"])
+    with col2:
+        st.metric("📄 Templates", contar_templates())
+    with col3:
+        tiempos = metricas.total()
+        if tiempos:
+            st.metric(
+                "⏱️ Generación", f"{tiempos['p50_ms']:.0f} ms",
+                help=f"p50 {tiempos['p50_ms']} ms · p95 {tiempos['p95_ms']} ms · p99 {tiempos['p99_ms']} ms (últimas cartas)",
+            )
+        else:
+            st.metric("⏱️ Generación", "—", help="Todavía no se generan cartas en esta instancia")
+
+    por_tipo = metricas.resumen()
+    if por_tipo:
+        with st.expander("📊 Tiempos por tipo de carta"):
+            filas = [
+                "| Tipo | Cartas | Error | p50 | p95 | p99 | p95 por etapa |",
+                "|---|---:|---:|---:|---:|---:|---|",
+            ]
+            for tipo, medido in sorted(por_tipo.items()):
+                carta = medido["etapas"]["total"]
+                etapas = " · ".join(
+                    f"{etapa} {valores['p95_ms']:.1f}" for etapa, valores in medido["etapas"].items() if etapa != "total"
+                )
+                filas.append(
+                    f"| {TIPOS_CARTA.get(tipo, tipo)} | {medido['cartas']} | {100 * medido['tasa_error']:.1f}% "
+                    f"| {carta['p50_ms']:.1f} ms | {carta['p95_ms']:.1f} ms | {carta['p99_ms']:.1f} ms | {etapas} |"
+                )
+            st.markdown("\n".join(filas))
+            cache = renders.estadisticas()
+            st.caption(
+                f"Caché de cartas: {cache['aciertos']} aciertos, {cache['fallos']} fallos, "
+                f"{cache['cartas']} cartas en memoria, {cache['expulsadas']} expulsadas"
+            )
+
+
 st.markdown("---")
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.metric("📁 Cartas", len([f for f in os.listdir('output') if f.endswith('.docx')]))
-with col2:
-    st.metric("📄 Templates", len([f for f in os.listdir('templates') if f.endswith('.docx')]))
-with col3:
-    st.metric("⏱️ Generación", "< 60 seg")
-
-st.markdown(f"""
-<div style='text-align:center;padding:20px;color:#64748b;font-size:0.9em'>
-    <p style='margin:5px 0'>⚡ <strong>Automatizador de Cartas</strong></p>
-    <p style='margin:5px 0'>Desarrollado por <a href='https://ciberbyte.vercel.app/' target='_blank' style='color:#0ea5e9; text-decoration:none; font-weight:bold;'>CiberByte</a> <span style='color:#94a3b8'>/</span> <a href='https://wa.me/56979693753?text=Hola%20Javier,%20consulta%20sobre%20el%20Automatizador%20de%20Cartas' target='_blank' style='color:#1e40af; text-decoration:none; font-weight:600;'>Javier Ruiz Arismendi <svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="#25D366" style="vertical-align: middle; margin-left: 3px;"><path d="M17.472 14.382c-.297-.149-1.758-.867-2.03-.967-.273-.099-.471-.148-.67.15-.197.297-.767.966-.94 1.164-.173.199-.347.223-.644.075-.297-.15-1.255-.463-2.39-1.475-.883-.788-1.48-1.761-1.653-2.059-.173-.297-.018-.458.13-.606.134-.133.298-.347.446-.52.149-.174.198-.298.298-.497.099-.198.05-.371-.025-.52-.075-.149-.669-1.612-.916-2.207-.242-.579-.487-.5-.669-.51-.173-.008-.371-.01-.57-.01-.198 0-.52.074-.792.372-.272.297-1.04 1.016-1.04 2.479 0 1.462 1.065 2.875 1.213 3.074.149.198 2.096 3.2 5.077 4.487.709.306 1.262.489 1.694.625.712.227 1.36.195 1.871.118.571-.085 1.758-.719 2.006-1.413.248-.694.248-1.289.173-1.413-.074-.124-.272-.198-.57-.347m-5.421 7.403h-.004a9.87 9.87 0 01-5.031-1.378l-.361-.214-3.741.982.998-3.648-.235-.374a9.86 9.86 0 01-1.51-5.26c.001-5.45 4.436-9.884 9.888-9.884 2.64 0 5.122 1.03 6.988 2.898a9.825 9.825 0 012.893 6.994c-.003 5.45-4.437 9.884-9.885 9.884m8.413-18.297A11.815 11.815 0 0012.05 0C5.495 0 .16 5.335.157 11.892c0 2.096.547 4.142 1.588 5.945L.057 24l6.305-1.654a11.882 11.882 0 005.683 1.448h.005c6.554 0 11.89-5.335 11.893-11.893a11.821 11.821 0 00-3.48-8.413Z"/></svg></a></p>
-    <p style='margin:5px 0'>© 2025 - Sistema de Generación Automática</p>
-</div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+pie_de_pagina()
+st.markdown(estaticos.PIE_HTML, unsafe_allow_html=True)
+
+arranque.informar("primer render")
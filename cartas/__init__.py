@@ -0,0 +1,11 @@
+"""
+Motor de generación de cartas.
+
+Lógica compartida por la app Streamlit, la línea de comandos
+(python -m cartas) y cualquier otro proceso que necesite generar cartas
+a partir de los templates de 'templates/'.
+"""
+from cartas.generador import generar_carta, generar_documento
+from cartas.manifiesto import cargar_manifiesto
+from cartas.plantillas import clonar_template, limpiar_cache, ruta_template
+from cartas.reemplazos import compilar_reemplazos
@@ -0,0 +1,222 @@
+"""
+Generación de cartas desde la línea de comandos, sin Streamlit.
+
+    python -m cartas tipos
+    python -m cartas carta error_lectura_halu --datos datos.json -o carta.docx
+    python -m cartas carta normal_avance -c gr_numero=15624563 -c comuna=Talca ...
+    python -m cartas lote planilla.xlsx -o cartas.zip --procesos 8
+    python -m cartas lote planilla.xlsx --revisar
+    python -m cartas manifiestos
+    python -m cartas planes
+    python -m cartas servicio --puerto 8080 --procesos 8 --cola 64
+    python -m cartas retencion --dias 365 --accion archivar
+    python -m cartas buscar 15624563 --desde 2026-01-01 -o carta.docx
+    python -m cartas benchmark -o benchmark.json --comparar anterior.json
+
+Se usa la misma carpeta 'templates/' que la app (relativa al directorio actual).
+"""
+import argparse
+import json
+import os
+import sys
+
+from cartas import indice
+from cartas.artefactos import escribir, guardar
+from cartas.generador import generar_carta, nombre_archivo
+from cartas.registro import TIPOS_CARTA
+
+
+def _leer_datos(args):
+    datos = {}
+    if args.datos:
+        if args.datos == "-":
+            datos.update(json.load(sys.stdin))
+        else:
+            with open(args.datos, encoding="utf-8") as f:
+                datos.update(json.load(f))
+    for campo in args.campo or []:
+        clave, _, valor = campo.partition("=")
+        datos[clave.strip()] = valor
+    return datos
+
+
+def _comando_tipos(args):
+    for tipo_carta, nombre in TIPOS_CARTA.items():
+        print(f"{tipo_carta}\t{nombre}")
+    return 0
+
+
+def _comando_carta(args):
+    datos = _leer_datos(args)
+    try:
+        contenido = generar_carta(args.tipo_carta, datos)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    if args.salida == "-":
+        sys.stdout.buffer.write(contenido)
+        return 0
+
+    if args.salida:
+        salida = args.salida
+        escribir(salida, contenido)
+    else:
+        # En output/ la carta queda registrada en el índice como las de la app
+        nombre = nombre_archivo(args.tipo_carta, datos.get("gr_numero", ""))
+        _, salida = guardar(nombre, contenido, en_disco=True)
+        indice.registrar(os.path.basename(salida), salida, args.tipo_carta, datos, contenido)
+    print(salida)
+    return 0
+
+
+def _comando_lote(args):
+    # pandas solo se importa cuando se usa el lote
+    from cartas.lote import generar_lote, leer_planilla, revisar_planilla
+    from cartas.procesos import cerrar_pool
+
+    with open(args.planilla, "rb") as f:
+        df = leer_planilla(f, args.planilla)
+
+    if args.revisar:
+        validas, errores = revisar_planilla(df)
+        print(f"{len(validas)} filas listas para generar, {len(errores)} con error")
+        for error in errores:
+            print(f"Fila {error['fila']} (GR {error['gr_numero']}): {error['error']}", file=sys.stderr)
+        return 1 if errores else 0
+
+    def avanzar(hechas, total):
+        print(f"\r{hechas}/{total}", end="", file=sys.stderr, flush=True)
+
+    try:
+        contenido, errores, generadas = generar_lote(
+            df, progreso=avanzar, procesos=args.procesos, tamano_bloque=args.bloque
+        )
+    finally:
+        cerrar_pool()
+    print(file=sys.stderr)
+
+    escribir(args.salida, contenido)
+    print(f"{generadas} cartas en {args.salida}")
+    for error in errores:
+        print(f"Fila {error['fila']} (GR {error['gr_numero']}): {error['error']}", file=sys.stderr)
+    return 1 if errores else 0
+
+
+def _comando_manifiestos(args):
+    from cartas import manifiesto
+    manifiesto.main(args.tipos)
+    return 0
+
+
+def _comando_planes(args):
+    from cartas import planes
+    planes.main(args.tipos)
+    return 0
+
+
+def _comando_servicio(args):
+    from cartas.servicio import servir
+    servir(args.host, args.puerto, procesos=args.procesos, cola=args.cola)
+    return 0
+
+
+def _comando_retencion(args):
+    procesadas = indice.aplicar_retencion(args.dias, args.accion)
+    print(f"{procesadas} cartas procesadas ({args.accion or indice.ACCION_RETENCION})")
+    return 0
+
+
+def _comando_buscar(args):
+    from datetime import datetime
+
+    desde = datetime.fromisoformat(args.desde).timestamp() if args.desde else None
+    hasta = datetime.fromisoformat(args.hasta).timestamp() if args.hasta else None
+    encontradas = indice.buscar(texto=args.texto, desde=desde, hasta=hasta, limite=args.limite)
+    for carta in encontradas:
+        creada = datetime.fromtimestamp(carta["creada"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{carta['id']}\t{creada}\t{carta['gr_numero']}\t{carta['numero_cliente']}\t"
+              f"{carta['tipo_carta']}\t{carta['ruta'] or '(' + carta['estado'] + ')'}")
+    if args.salida and encontradas:
+        # La más reciente, tal como se generó
+        contenido = indice.leer(encontradas[0]["id"])
+        if contenido is None:
+            print("❌ El archivo ya no está disponible", file=sys.stderr)
+            return 1
+        escribir(args.salida, contenido)
+    return 0 if encontradas else 1
+
+
+def _comando_benchmark(args):
+    from cartas import benchmark
+    benchmark.main(args)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cartas", description="Automatizador de Cartas")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    comandos.add_parser("tipos", help="Lista los tipos de carta disponibles")
+
+    carta = comandos.add_parser("carta", help="Genera una carta")
+    carta.add_argument("tipo_carta", choices=sorted(TIPOS_CARTA))
+    carta.add_argument("--datos", help="Archivo JSON con los datos ('-' para stdin)")
+    carta.add_argument("-c", "--campo", action="append", metavar="CAMPO=VALOR", help="Dato suelto (se puede repetir)")
+    carta.add_argument("-o", "--salida", help="Archivo .docx de salida ('-' para stdout)")
+
+    lote = comandos.add_parser("lote", help="Genera todas las cartas de una planilla CSV/Excel")
+    lote.add_argument("planilla")
+    lote.add_argument("-o", "--salida", default="cartas.zip")
+    lote.add_argument("--procesos", type=int, default=None)
+    lote.add_argument("--bloque", type=int, default=None)
+    lote.add_argument("--revisar", action="store_true", help="Solo revisa la planilla, sin generar nada")
+
+    manifiestos = comandos.add_parser("manifiestos", help="Regenera los índices de marcadores de los templates")
+    manifiestos.add_argument("tipos", nargs="*")
+
+    planes = comandos.add_parser("planes", help="Compila los planes de generación de los templates")
+    planes.add_argument("tipos", nargs="*")
+
+    servicio = comandos.add_parser("servicio", help="Servicio HTTP que genera cartas a pedido")
+    servicio.add_argument("--host", default="127.0.0.1")
+    servicio.add_argument("--puerto", type=int, default=8080)
+    servicio.add_argument("--procesos", type=int, default=None)
+    servicio.add_argument("--cola", type=int, default=None, help="Pedidos en espera antes de responder 503")
+
+    retencion = comandos.add_parser("retencion", help="Archiva o borra las cartas antiguas de output/")
+    retencion.add_argument("--dias", type=int, default=None)
+    retencion.add_argument("--accion", choices=["archivar", "borrar"], default=None)
+
+    buscar = comandos.add_parser("buscar", help="Busca cartas ya generadas por GR o número de cliente")
+    buscar.add_argument("texto", nargs="?")
+    buscar.add_argument("--desde", help="Fecha ISO (AAAA-MM-DD)")
+    buscar.add_argument("--hasta", help="Fecha ISO (AAAA-MM-DD), sin incluir")
+    buscar.add_argument("--limite", type=int, default=20)
+    buscar.add_argument("-o", "--salida", help="Copia aquí la carta más reciente encontrada")
+
+    benchmark = comandos.add_parser("benchmark", help="Mide la generación de todos los templates de Cobros")
+    benchmark.add_argument("-o", "--salida", default="benchmark.json")
+    benchmark.add_argument("--motores", nargs="+", choices=["plan", "ooxml", "docx", "docx-parrafo"])
+    benchmark.add_argument("--repeticiones", type=int, default=None, help="Cartas medidas por tipo y motor")
+    benchmark.add_argument("--procesos", type=int, nargs="*", help="Procesos del lote (sin valores: no se mide el lote)")
+    benchmark.add_argument("--cartas", type=int, default=None, help="Cartas del lote")
+    benchmark.add_argument("--comparar", metavar="JSON", help="Corrida anterior para comparar")
+
+    args = parser.parse_args(argv)
+    comando = {
+        "tipos": _comando_tipos,
+        "carta": _comando_carta,
+        "lote": _comando_lote,
+        "manifiestos": _comando_manifiestos,
+        "planes": _comando_planes,
+        "servicio": _comando_servicio,
+        "retencion": _comando_retencion,
+        "buscar": _comando_buscar,
+        "benchmark": _comando_benchmark,
+    }[args.comando]
+    return comando(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Tabla de datos adicionales (anexo) al final de la carta.
+
+La tabla llega pegada desde Excel (texto separado por TAB) o como archivo
+.xlsx / .csv. Las columnas de montos y kWh se formatean por columnas con
+cartas.formato, y el XML del anexo (salto de página, título y tabla) se
+arma de una vez como texto y se inserta en el document.xml de la carta ya
+generada: no se crean filas ni celdas con python-docx, así que un
+historial de miles de filas se agrega en milisegundos y sirve con
+cualquier motor.
+
+    df = leer_tabla(texto_pegado)      # o leer_archivo(archivo, nombre)
+    contenido = agregar_a_docx(contenido, df)
+
+El anexo no depende de los estilos del template (los templates no traen
+"Heading 1" ni estilos de tabla): título, bordes y letra van en el XML.
+"""
+import io
+import re
+import zipfile
+
+import pandas as pd
+
+from cartas.formato import fechas_excel, formatear_montos, formatear_numeros_kwh
+
+TITULO = "Anexo - Datos Adicionales"
+FUENTE = "Arial"
+TAMANO_LETRA = 9  # pt
+MAX_FILAS = 20000
+
+# Palabras del encabezado que indican el formato de la columna. Las de kWh se
+# revisan primero: "Consumo total (kWh)" es un consumo, no un monto
+COLUMNAS_KWH = ("kwh", "consumo", "lectura")
+COLUMNAS_MONTO = ("monto", "valor", "cargo", "pago", "importe", "$")
+
+ANCHO = 9000  # twips entre márgenes si la sección no trae tamaño de página
+
+_DOCUMENTO = "word/document.xml"
+_ANCHO_PAGINA = re.compile(r'<w:pgSz\b[^>]*\bw:w="(\d+)"')
+_MARGEN_IZQUIERDO = re.compile(r'<w:pgMar\b[^>]*\bw:(?:left|start)="(\d+)"')
+_MARGEN_DERECHO = re.compile(r'<w:pgMar\b[^>]*\bw:(?:right|end)="(\d+)"')
+
+# Caracteres que no pueden ir en el XML
+_INVALIDOS = "[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]"
+
+
+# ================= LECTURA =================
+def _limpiar(df):
+    """Todo como texto, sin filas ni columnas vacías y con las fechas de Excel como dd/mm/aaaa"""
+    df = df.fillna("").astype(str)
+    df.columns = [str(columna).strip() for columna in df.columns]
+    for columna in df.columns:
+        df[columna] = fechas_excel(df[columna].str.strip())
+    df = df.loc[(df != "").any(axis=1), [c for c in df.columns if not c.startswith("Unnamed:") or (df[c] != "").any()]]
+    if len(df) > MAX_FILAS:
+        raise ValueError(f"La tabla tiene {len(df)} filas; el máximo es {MAX_FILAS}")
+    return df.reset_index(drop=True)
+
+
+def leer_tabla(texto):
+    """Tabla pegada desde Excel (columnas separadas por TAB, primera fila de encabezados)"""
+    df = pd.read_csv(io.StringIO(texto.strip("\r\n")), sep="\t", dtype=str, keep_default_na=False)
+    return _limpiar(df)
+
+
+def leer_archivo(archivo, nombre):
+    """Tabla desde un .xlsx (primera hoja) o un .csv / .tsv / .txt"""
+    contenido = archivo.read() if hasattr(archivo, "read") else archivo
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        # pandas necesita openpyxl para leer .xlsx
+        df = pd.read_excel(io.BytesIO(contenido), dtype=str)
+        # Excel entrega los decimales con punto ("1200.5"), que se leería como miles: montos y kWh van enteros
+        for columna in df.columns:
+            if formato_columna(str(columna)):
+                decimales = df[columna].str.fullmatch(r"-?[0-9]+\.[0-9]+", na=False)
+                if decimales.any():
+                    enteros = pd.to_numeric(df.loc[decimales, columna]).round().astype("int64").astype(str)
+                    df.loc[decimales, columna] = enteros
+    else:
+        try:
+            texto = contenido.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            # CSV exportado desde Excel en Windows
+            texto = contenido.decode("latin-1")
+        df = pd.read_csv(io.StringIO(texto), dtype=str, sep=None, engine="python", keep_default_na=False)
+    return _limpiar(df)
+
+
+# ================= FORMATO =================
+def formato_columna(columna):
+    """Formato de la columna según su encabezado: "monto", "kwh" o None"""
+    nombre = columna.lower()
+    if any(palabra in nombre for palabra in COLUMNAS_KWH):
+        return "kwh"
+    if any(palabra in nombre for palabra in COLUMNAS_MONTO):
+        return "monto"
+    return None
+
+
+def formatear_tabla(df):
+    """Copia de la tabla con montos ($45.000) y kWh (6.500) formateados por columna"""
+    df = df.copy()
+    for columna in df.columns:
+        formato = formato_columna(columna)
+        if formato == "monto":
+            df[columna] = formatear_montos(df[columna])
+        elif formato == "kwh":
+            df[columna] = formatear_numeros_kwh(df[columna])
+    return df
+
+
+# ================= XML =================
+def _celdas(serie, propiedades_run):
+    """XML <w:tc> de cada valor de la columna, armado para toda la columna a la vez"""
+    escapados = (
+        serie.astype(str)
+        .str.replace(_INVALIDOS, "", regex=True)
+        .str.replace("&", "&amp;", regex=False)
+        .str.replace("<", "&lt;", regex=False)
+        .str.replace(">", "&gt;", regex=False)
+        .str.replace("\r\n", "\n", regex=False)
+        .str.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">', regex=False)
+    )
+    inicio = f'<w:tc><w:p><w:pPr><w:spacing w:before="0" w:after="0"/></w:pPr><w:r>{propiedades_run}<w:t xml:space="preserve">'
+    return (inicio + escapados + "</w:t></w:r></w:p></w:tc>").tolist()
+
+
+def _cierre_cuerpo(documento):
+    """Posición donde va el anexo en document.xml: antes del <w:sectPr> final del cuerpo o de </w:body>"""
+    fin = documento.rfind(b"</w:body>")
+    if fin < 0:
+        raise ValueError("document.xml sin <w:body>")
+    seccion = documento.rfind(b"<w:sectPr", 0, fin)
+    # Un <w:sectPr> dentro del último párrafo es de otra sección, no el del cuerpo
+    ultimo_bloque = max(documento.rfind(marca, 0, fin) for marca in (b"</w:p>", b"<w:p/>", b"</w:tbl>", b"</w:sdt>"))
+    return seccion if seccion > ultimo_bloque else fin
+
+
+def _ancho_util(seccion):
+    """Ancho entre márgenes del <w:sectPr> del cuerpo, en twips"""
+    pagina = _ANCHO_PAGINA.search(seccion)
+    if pagina is None:
+        return ANCHO
+    izquierda = _MARGEN_IZQUIERDO.search(seccion)
+    derecha = _MARGEN_DERECHO.search(seccion)
+    ancho = int(pagina.group(1)) - int(izquierda.group(1) if izquierda else 0) - int(derecha.group(1) if derecha else 0)
+    return ancho if ancho > 0 else ANCHO
+
+
+def anexo_xml(df, ancho=ANCHO):
+    """XML del anexo (salto de página, título y tabla), listo para ir dentro de <w:body>"""
+    tamano = f'<w:sz w:val="{2 * TAMANO_LETRA}"/><w:szCs w:val="{2 * TAMANO_LETRA}"/>'
+    fuente = f'<w:rFonts w:ascii="{FUENTE}" w:hAnsi="{FUENTE}" w:cs="{FUENTE}"/>'
+    run_dato = f"<w:rPr>{fuente}{tamano}</w:rPr>"
+    run_encabezado = f"<w:rPr>{fuente}<w:b/>{tamano}</w:rPr>"
+
+    columnas = len(df.columns)
+    ancho_columna = max(ancho // max(columnas, 1), 1)
+    grilla = f'<w:gridCol w:w="{ancho_columna}"/>' * columnas
+    encabezados = _celdas(pd.Series([str(c) for c in df.columns], dtype=object), run_encabezado)
+    cuerpo = [_celdas(df[columna], run_dato) for columna in df.columns]
+    filas = "".join(f"<w:tr>{''.join(celdas)}</w:tr>" for celdas in zip(*cuerpo))
+
+    borde = 'w:val="single" w:sz="4" w:space="0" w:color="808080"'
+    return (
+        '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+        f'<w:p><w:pPr><w:spacing w:after="120"/></w:pPr><w:r><w:rPr>{fuente}<w:b/>'
+        f'<w:sz w:val="24"/><w:szCs w:val="24"/></w:rPr><w:t>{TITULO}</w:t></w:r></w:p>'
+        "<w:tbl><w:tblPr>"
+        '<w:tblW w:w="0" w:type="auto"/>'
+        f"<w:tblBorders><w:top {borde}/><w:left {borde}/><w:bottom {borde}/><w:right {borde}/>"
+        f"<w:insideH {borde}/><w:insideV {borde}/></w:tblBorders>"
+        '<w:tblCellMar><w:left w:w="70" w:type="dxa"/><w:right w:w="70" w:type="dxa"/></w:tblCellMar>'
+        "</w:tblPr>"
+        f"<w:tblGrid>{grilla}</w:tblGrid>"
+        # La fila de encabezados se repite en cada página
+        f"<w:tr><w:trPr><w:tblHeader/></w:trPr>{''.join(encabezados)}</w:tr>"
+        f"{filas}</w:tbl>"
+    )
+
+
+def insertar(documento, df):
+    """document.xml (bytes) con el anexo al final del cuerpo; montos y kWh quedan formateados"""
+    if not len(df.columns):
+        return documento
+    corte = _cierre_cuerpo(documento)
+    fin = documento.rfind(b"</w:body>")
+    xml = anexo_xml(formatear_tabla(df), _ancho_util(documento[corte:fin].decode("utf-8")))
+    return documento[:corte] + xml.encode("utf-8") + documento[corte:]
+
+
+# ================= DOCX =================
+def agregar_a_docx(contenido, df):
+    """El .docx (bytes) con el anexo agregado; las demás partes del paquete se copian tal cual"""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(contenido)) as entrada, zipfile.ZipFile(salida, "w") as zf:
+        for info in entrada.infolist():
+            datos = entrada.read(info)
+            if info.filename == _DOCUMENTO:
+                datos = insertar(datos, df)
+            zf.writestr(info, datos, compress_type=info.compress_type)
+    return salida.getvalue()
+
+
+def agregar_anexo(doc, df):
+    """
+    Document de python-docx con el anexo agregado. Se guarda y se vuelve a
+    abrir: mover miles de filas dentro del árbol de lxml es mucho más lento.
+    """
+    from docx import Document
+
+    if not len(df.columns):
+        return doc
+    salida = io.BytesIO()
+    doc.save(salida)
+    return Document(io.BytesIO(agregar_a_docx(salida.getvalue(), df)))
@@ -0,0 +1,40 @@
+"""
+Tiempos de arranque de la app.
+
+La app marca cada etapa de su primera ejecución en el proceso (imports,
+primer render, primera carta) y el reporte se escribe una sola vez en
+stderr, para ver cuánto espera el usuario cuando se levanta una instancia
+nueva. Las etapas se miden desde que se importa este módulo.
+"""
+import sys
+import time
+
+_inicio = time.perf_counter()
+_marcas = []  # (etapa, segundos desde el inicio)
+_informadas = set()
+
+
+def marcar(etapa):
+    """Registra el momento de 'etapa' (solo la primera vez en el proceso)"""
+    if all(nombre != etapa for nombre, _ in _marcas):
+        _marcas.append((etapa, time.perf_counter() - _inicio))
+
+
+def reporte():
+    """Lista de (etapa, ms desde el inicio, ms desde la etapa anterior)"""
+    filas = []
+    anterior = 0.0
+    for etapa, segundos in _marcas:
+        filas.append((etapa, round(1000 * segundos, 1), round(1000 * (segundos - anterior), 1)))
+        anterior = segundos
+    return filas
+
+
+def informar(hasta):
+    """Escribe el reporte en stderr la primera vez que se llega a la etapa 'hasta'"""
+    if hasta in _informadas:
+        return
+    _informadas.add(hasta)
+    marcar(hasta)
+    lineas = [f"  {etapa:<28} {total:>8.1f} ms  (+{delta:.1f})" for etapa, total, delta in reporte()]
+    print("⏱️ Arranque de la app:\n" + "\n".join(lineas), file=sys.stderr, flush=True)
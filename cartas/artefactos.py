@@ -0,0 +1,146 @@
+"""
+Cartas generadas, guardadas en memoria.
+
+Las cartas quedan en una caché LRU compartida por todas las sesiones (la
+app corre en un solo proceso). La sesión guarda solo el id de su carta y
+el botón de descarga recibe los bytes desde aquí, sin volver a abrir
+'output/' en cada rerun. Cuando se pasa de MAX_BYTES se expulsan las
+cartas usadas hace más tiempo.
+
+La copia en 'output/' es opcional y viene apagada (GUARDAR_EN_DISCO): la
+carta de la app se descarga desde la memoria y queda en el índice sin
+archivo. Si se activa, solo se lee cuando la carta ya salió de la caché.
+Se escribe en un temporal que recién al estar completo toma su nombre, así
+que nadie ve una carta a medio escribir; si el nombre ya existe (misma
+carta en el mismo segundo) se le agrega _2, _3, ... en vez de pisar la otra.
+"""
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+DIRECTORIO_SALIDA = "output"
+GUARDAR_EN_DISCO = False
+MAX_BYTES = 64 * 1024 * 1024  # ~2.000 cartas de 30 KB
+
+_artefactos = OrderedDict()  # id -> (nombre, bytes)
+_bytes = 0
+_expulsados = 0
+_lock = threading.Lock()
+
+
+def _agregar(artefacto_id, nombre, contenido):
+    global _bytes, _expulsados
+    with _lock:
+        anterior = _artefactos.pop(artefacto_id, None)
+        if anterior is not None:
+            _bytes -= len(anterior[1])
+        _artefactos[artefacto_id] = (nombre, contenido)
+        _bytes += len(contenido)
+        # La carta recién agregada nunca se expulsa, aunque sola supere el límite
+        while _bytes > MAX_BYTES and len(_artefactos) > 1:
+            _, (_, expulsado) = _artefactos.popitem(last=False)
+            _bytes -= len(expulsado)
+            _expulsados += 1
+
+
+def _temporal(directorio, contenido):
+    """Escribe 'contenido' en un temporal oculto de 'directorio' y devuelve su ruta"""
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(contenido)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return temporal
+
+
+def escribir(ruta, contenido):
+    """Reemplaza 'ruta' con 'contenido' de una vez: se lee el archivo anterior o el nuevo, nunca uno a medias"""
+    if isinstance(contenido, str):
+        contenido = contenido.encode("utf-8")
+    temporal = _temporal(os.path.dirname(ruta) or ".", contenido)
+    try:
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def _escribir_nuevo(nombre, contenido):
+    """
+    Escribe la carta en DIRECTORIO_SALIDA sin pisar otra con el mismo nombre.
+    Devuelve la ruta final.
+    """
+    temporal = _temporal(DIRECTORIO_SALIDA, contenido)
+    base, extension = os.path.splitext(nombre)
+    try:
+        for intento in range(1, 1000):
+            ruta = os.path.join(DIRECTORIO_SALIDA, nombre if intento == 1 else f"{base}_{intento}{extension}")
+            try:
+                # link() falla si el nombre ya existe: tomar el nombre y escribir es un solo paso
+                os.link(temporal, ruta)
+                return ruta
+            except FileExistsError:
+                continue
+            except OSError:
+                # Volumen sin enlaces duros: se reserva el nombre vacío y se reemplaza por la carta
+                try:
+                    os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                except FileExistsError:
+                    continue
+                os.replace(temporal, ruta)
+                return ruta
+        raise FileExistsError(f"No hay nombre libre para {nombre} en {DIRECTORIO_SALIDA}")
+    finally:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+
+
+def guardar(nombre, contenido, en_disco=None):
+    """
+    Guarda la carta en la caché (y en 'output/' si corresponde).
+    Devuelve (id del artefacto, ruta en disco o None); el nombre en disco
+    puede llevar un sufijo si ya había una carta con ese nombre.
+    """
+    artefacto_id = uuid.uuid4().hex
+
+    ruta = None
+    if GUARDAR_EN_DISCO if en_disco is None else en_disco:
+        ruta = _escribir_nuevo(nombre, contenido)
+        nombre = os.path.basename(ruta)
+    _agregar(artefacto_id, nombre, contenido)
+    return artefacto_id, ruta
+
+
+def obtener(artefacto_id, ruta=None):
+    """
+    (nombre, bytes) de la carta, o None si ya no está.
+    Si salió de la caché pero quedó en disco se relee desde 'ruta'.
+    """
+    with _lock:
+        artefacto = _artefactos.get(artefacto_id)
+        if artefacto is not None:
+            _artefactos.move_to_end(artefacto_id)
+            return artefacto
+
+    if artefacto_id and ruta and os.path.exists(ruta):
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+        _agregar(artefacto_id, os.path.basename(ruta), contenido)
+        return os.path.basename(ruta), contenido
+    return None
+
+
+def estadisticas():
+    with _lock:
+        return {"cartas": len(_artefactos), "bytes": _bytes, "expulsadas": _expulsados}
+
+
+def limpiar():
+    global _bytes
+    with _lock:
+        _artefactos.clear()
+        _bytes = 0
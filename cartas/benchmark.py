@@ -0,0 +1,380 @@
+"""
+Benchmark de la generación de cartas.
+
+Genera cada tipo de carta de CATEGORIAS["Cobros"] desde los templates reales
+de 'templates/' con datos sintéticos (todos los campos llenos) y mide:
+
+- carga del template en frío, por motor;
+- tiempo por etapa de una carta con caché caliente: carga (template desde
+  la caché), datos (normalización, validación y reemplazos), reemplazo
+  (edición del XML; en "docx-parrafo" incluye rearmar el párrafo en Arial 10
+  con las reglas de negrita) y guardado (XML y zip del .docx);
+- p50/p95 de una carta completa con generar_carta();
+- cartas por segundo del lote con varias cantidades de procesos;
+- memoria máxima (RSS) del proceso y de los workers.
+
+El resultado se guarda en JSON. Con --comparar se imprime la diferencia
+contra una corrida anterior:
+
+    python -m cartas benchmark -o antes.json
+    python -m cartas benchmark -o despues.json --comparar antes.json
+"""
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from cartas import ooxml, planes, plantillas, procesos, renders
+from cartas.generador import MOTOR, _preparar, generar_carta, normalizar_datos, reemplazar_en_documento
+from cartas.manifiesto import cargar_manifiesto
+from cartas.plantillas import clonar_template, ruta_template
+from cartas.registro import CATEGORIAS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+VERSION = 1
+
+# ================= PARÁMETROS POR DEFECTO =================
+REPETICIONES = 30  # cartas por tipo y motor
+REPETICIONES_CARGA = 3  # cargas en frío por tipo y motor
+CARTAS_LOTE = 260  # 20 de cada tipo
+PROCESOS_LOTE = (1, 2, 4)
+
+# motor del benchmark -> (motor de generar_carta, modo de reemplazo)
+MOTORES = {
+    "plan": ("plan", "runs"),
+    "ooxml": ("ooxml", "runs"),
+    "docx": ("docx", "runs"),
+    "docx-parrafo": ("docx", "parrafo"),
+}
+
+# Fecha fija: las cartas de dos corridas son iguales
+HOY = datetime(2026, 1, 15, 10, 30, tzinfo=timezone(timedelta(hours=-3)))
+
+# ================= DATOS SINTÉTICOS =================
+DATOS_COMUNES = {
+    "comuna": "valparaíso",
+    "tratamiento": "Señora",
+    "nombre_cliente": "maría josé pérez soto",
+    "direccion": "avenida pedro montt 725, depto 34",
+    "numero_cliente": "6255126",
+    "tipo_caso": "SEC",
+    "caso_sec_numero": "1234567",
+    "zona": "Centro",
+    "canal_ingreso": "Call Center",
+}
+
+DATOS_POR_TIPO = {
+    "apertura_casa_nolu": {
+        "periodo_inicio": "marzo", "periodo_fin": "agosto", "anio_inicio": "2024", "anio_fin": "2025",
+        "numero_medidor": "E044124", "fecha_lectura": "08082025", "lectura_kwh": "20041",
+        "consumo_total": "756", "fecha_inicio_periodo": "11032025", "fecha_fin_periodo": "08082025",
+        "consumo_provisorio": "184", "monto_ajuste": "39112", "meses_historial": "24",
+    },
+    "carta_aporte_lectura": {"fecha_requerimiento": "24112025"},
+    "atencion_emergencia_halu": {
+        "fecha_solicitud_formulario": "03102025", "nombre_solicitante": "mariana espinoza osorio",
+        "tratamiento_solicitante": "Señora", "monto_emergencia": "24903",
+        "numero_boleta_emergencia": "460506214", "fecha_emision_boleta": "15102025", "nota_credito": "6669093",
+    },
+    "aumento_consumo_halu_sinvisita": {"meses_historial": "18", "monto_rebaja": "80058"},
+    "aumento_consumo_nolu_sinvisita": {"meses_historial": "6"},
+    "error_lectura_halu": {
+        "dia_inicio": "06", "dia_fin": "12", "fecha_boleta": "20122025", "tipo_doc": "boleta",
+        "numero_boleta": "123456", "consumo_kwh": "350", "monto_boleta": "45000",
+    },
+    "error_lectura_nolu": {
+        "dia_inicio": "10", "dia_fin": "15", "fecha_factura": "15122025", "monto_factura": "36745",
+    },
+    "error_lectura_regularizado_sgte_lectura": {"dia_inicio": "13", "dia_fin": "18", "meses_historial": "10"},
+    "facturaciones_normalizadas": {"motivo_reclamo": "cobro excesivo", "dia_inicio": "3", "dia_fin": "9"},
+}
+
+
+def tipos_benchmark():
+    """Tipos de carta de Cobros que tienen template"""
+    return [tipo for tipo in CATEGORIAS["Cobros"] if os.path.exists(ruta_template(tipo))]
+
+
+def datos_sinteticos(tipo_carta, numero=0):
+    """Datos completos para 'tipo_carta'; 'numero' cambia el GR"""
+    return {
+        **DATOS_COMUNES,
+        **DATOS_POR_TIPO.get(tipo_carta, {}),
+        "tipo_carta": tipo_carta,
+        "gr_numero": str(15600000 + numero),
+    }
+
+
+# ================= MEDICIÓN =================
+def _percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _resumen(segundos):
+    """p50, p95, media y máximo en milisegundos"""
+    return {
+        "p50_ms": round(1000 * _percentil(segundos, 50), 3),
+        "p95_ms": round(1000 * _percentil(segundos, 95), 3),
+        "media_ms": round(1000 * sum(segundos) / len(segundos), 3),
+        "max_ms": round(1000 * max(segundos), 3),
+    }
+
+
+def _limpiar_caches():
+    plantillas.limpiar_cache()
+    ooxml.limpiar_cache()
+    planes.limpiar_cache()
+
+
+def _cargar_en_frio(motor, path):
+    if motor == "plan":
+        planes.precargar(path)
+    elif motor == "ooxml":
+        ooxml.precargar(path)
+    else:
+        plantillas.template_original(path)
+        cargar_manifiesto(path)
+
+
+def _etapas_docx(tipo_carta, datos, modo):
+    path = ruta_template(tipo_carta)
+    t0 = time.perf_counter()
+    doc = clonar_template(path)
+    t1 = time.perf_counter()
+    datos, hoy, reemplazos = _preparar(tipo_carta, datos, HOY)
+    t2 = time.perf_counter()
+    reemplazar_en_documento(doc, path, reemplazos, datos, hoy, modo=modo)
+    t3 = time.perf_counter()
+    doc.save(io.BytesIO())
+    t4 = time.perf_counter()
+    return {"carga": t1 - t0, "datos": t2 - t1, "reemplazo": t3 - t2, "guardado": t4 - t3}
+
+
+def _etapas_ooxml(tipo_carta, datos):
+    t0 = time.perf_counter()
+    miembros, partes = ooxml.plantilla(ruta_template(tipo_carta))
+    t1 = time.perf_counter()
+    _, _, reemplazos = _preparar(tipo_carta, datos, HOY)
+    t2 = time.perf_counter()
+    editadas = ooxml.aplicar(partes, reemplazos)
+    t3 = time.perf_counter()
+    ooxml.armar_docx(miembros, {nombre: ooxml.serializar(raiz) for nombre, raiz in editadas.items()})
+    t4 = time.perf_counter()
+    return {"carga": t1 - t0, "datos": t2 - t1, "reemplazo": t3 - t2, "guardado": t4 - t3}
+
+
+def _etapas_plan(tipo_carta, datos):
+    t0 = time.perf_counter()
+    _, _, reemplazos = _preparar(tipo_carta, datos, HOY)
+    valores = {clave: str(valor) for clave, valor in reemplazos.items()}
+    t1 = time.perf_counter()
+    obtenido = planes.obtener_plan(ruta_template(tipo_carta), valores)
+    if obtenido is None:
+        raise RuntimeError(f"{tipo_carta}: el template no tiene plan")
+    miembros, plan = obtenido
+    t2 = time.perf_counter()
+    nuevos = planes.rellenar(plan, valores)
+    t3 = time.perf_counter()
+    ooxml.armar_docx(miembros, nuevos)
+    t4 = time.perf_counter()
+    return {"carga": t2 - t1, "datos": t1 - t0, "reemplazo": t3 - t2, "guardado": t4 - t3}
+
+
+def _etapas(motor, tipo_carta, datos):
+    if motor == "plan":
+        return _etapas_plan(tipo_carta, datos)
+    if motor == "ooxml":
+        return _etapas_ooxml(tipo_carta, datos)
+    return _etapas_docx(tipo_carta, datos, MOTORES[motor][1])
+
+
+def medir_motor(motor, tipos, repeticiones=REPETICIONES, repeticiones_carga=REPETICIONES_CARGA):
+    """
+    Carga en frío, etapas y carta completa de cada tipo con un motor.
+    Devuelve {"por_tipo": {...}, "etapas": {...}, "carta": {...}}.
+    """
+    motor_carta, modo = MOTORES[motor]
+    por_tipo = {}
+    todas_etapas = {}
+    todas_cartas = []
+    for tipo_carta in tipos:
+        path = ruta_template(tipo_carta)
+        cargas = []
+        for _ in range(repeticiones_carga):
+            _limpiar_caches()
+            t0 = time.perf_counter()
+            _cargar_en_frio(motor, path)
+            cargas.append(time.perf_counter() - t0)
+
+        # Primera carta fuera de la medición (planes de otros juegos de claves, imports),
+        # con un GR que no se repite para que las medidas no salgan de la caché de cartas
+        generar_carta(tipo_carta, datos_sinteticos(tipo_carta, -1), hoy=HOY, motor=motor_carta, modo=modo)
+
+        etapas = {}
+        cartas = []
+        for i in range(repeticiones):
+            for etapa, segundos in _etapas(motor, tipo_carta, datos_sinteticos(tipo_carta, i)).items():
+                etapas.setdefault(etapa, []).append(segundos)
+            datos = datos_sinteticos(tipo_carta, i)
+            t0 = time.perf_counter()
+            contenido = generar_carta(tipo_carta, datos, hoy=HOY, motor=motor_carta, modo=modo)
+            cartas.append(time.perf_counter() - t0)
+
+        por_tipo[tipo_carta] = {
+            "carga_en_frio": _resumen(cargas),
+            "etapas": {etapa: _resumen(valores) for etapa, valores in etapas.items()},
+            "carta": _resumen(cartas),
+            "bytes": len(contenido),
+        }
+        for etapa, valores in etapas.items():
+            todas_etapas.setdefault(etapa, []).extend(valores)
+        todas_cartas.extend(cartas)
+
+    return {
+        "por_tipo": por_tipo,
+        "etapas": {etapa: _resumen(valores) for etapa, valores in todas_etapas.items()},
+        "carta": _resumen(todas_cartas),
+    }
+
+
+def medir_lote(tipos, cantidades=PROCESOS_LOTE, cartas=CARTAS_LOTE):
+    """
+    Cartas por segundo de generar_en_paralelo() (motor configurado en
+    cartas.generador) con cada cantidad de procesos. El arranque del pool
+    se mide aparte.
+    """
+    # Como las filas de cartas.lote: los workers reciben los datos ya normalizados
+    filas = [(i, normalizar_datos(datos_sinteticos(tipos[i % len(tipos)], i))) for i in range(cartas)]
+    resultados = []
+    for cantidad in cantidades:
+        renders.limpiar()
+        t0 = time.perf_counter()
+        if cantidad > 1:
+            procesos.calentar_pool(cantidad)
+        arranque = time.perf_counter() - t0
+        try:
+            t0 = time.perf_counter()
+            generadas = procesos.generar_en_paralelo(filas, HOY, procesos=cantidad)
+            errores = sum(1 for _, _, _, error in generadas if error)
+            segundos = time.perf_counter() - t0
+        finally:
+            procesos.cerrar_pool(esperar=True)
+        resultados.append({
+            "procesos": cantidad,
+            "cartas": cartas,
+            "errores": errores,
+            "arranque_s": round(arranque, 3),
+            "segundos": round(segundos, 3),
+            "cartas_por_segundo": round(cartas / segundos, 1),
+        })
+    return resultados
+
+
+def rss_maximo_mb():
+    """Memoria máxima (RSS) de este proceso y de los workers ya terminados, en MB"""
+    if resource is None:
+        return {"proceso": None, "workers": None}
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    unidad = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "proceso": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unidad, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unidad, 1),
+    }
+
+
+def ejecutar(motores=tuple(MOTORES), repeticiones=REPETICIONES, cantidades=PROCESOS_LOTE,
+             cartas_lote=CARTAS_LOTE, progreso=None):
+    """Corre el benchmark completo y devuelve el resultado (serializable a JSON)"""
+    avisar = progreso or (lambda mensaje: None)
+    tipos = tipos_benchmark()
+    resultado = {
+        "version": VERSION,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "tipos": tipos,
+        "repeticiones": repeticiones,
+        "motores": {},
+    }
+    for motor in motores:
+        avisar(f"motor {motor}")
+        resultado["motores"][motor] = medir_motor(motor, tipos, repeticiones)
+    if cantidades:
+        avisar(f"lote de {cartas_lote} cartas (motor {MOTOR})")
+        resultado["lote"] = {"motor": MOTOR, "resultados": medir_lote(tipos, cantidades, cartas_lote)}
+    resultado["rss_max_mb"] = rss_maximo_mb()
+    return resultado
+
+
+# ================= REPORTE =================
+def reporte(resultado):
+    """Líneas de texto con el resumen de una corrida"""
+    lineas = [f"{len(resultado['tipos'])} tipos, {resultado['repeticiones']} cartas por tipo"]
+    for motor, medido in resultado["motores"].items():
+        carta = medido["carta"]
+        etapas = "  ".join(f"{etapa} {valores['p50_ms']:.2f}" for etapa, valores in medido["etapas"].items())
+        lineas.append(f"  {motor:<13} carta p50 {carta['p50_ms']:>7.2f} ms  p95 {carta['p95_ms']:>7.2f} ms  |  {etapas}")
+    if "lote" in resultado:
+        lineas.append(f"Lote (motor {resultado['lote']['motor']}):")
+        for fila in resultado["lote"]["resultados"]:
+            lineas.append(
+                f"  {fila['procesos']:>2} procesos  {fila['cartas_por_segundo']:>8.1f} cartas/s"
+                f"  (arranque {fila['arranque_s']:.2f} s, {fila['errores']} errores)"
+            )
+    rss = resultado["rss_max_mb"]
+    lineas.append(f"RSS máximo: proceso {rss['proceso']} MB, workers {rss['workers']} MB")
+    return lineas
+
+
+def comparar(anterior, actual):
+    """Líneas con la variación de p50/p95 por motor y del lote entre dos corridas"""
+    def variacion(antes, despues):
+        return f"{antes:>8.2f} → {despues:>8.2f} ({(despues - antes) / antes * 100:+.0f}%)" if antes else "-"
+
+    lineas = []
+    for motor, medido in actual["motores"].items():
+        previo = anterior.get("motores", {}).get(motor)
+        if previo is None:
+            continue
+        for medida in ("p50_ms", "p95_ms"):
+            lineas.append(f"  {motor:<13} {medida:<7} {variacion(previo['carta'][medida], medido['carta'][medida])}")
+    previos = {fila["procesos"]: fila for fila in anterior.get("lote", {}).get("resultados", [])}
+    for fila in actual.get("lote", {}).get("resultados", []):
+        previo = previos.get(fila["procesos"])
+        if previo is not None:
+            lineas.append(
+                f"  lote {fila['procesos']:>2} procesos cartas/s "
+                f"{variacion(previo['cartas_por_segundo'], fila['cartas_por_segundo'])}"
+            )
+    return lineas
+
+
+def main(args):
+    resultado = ejecutar(
+        motores=args.motores or tuple(MOTORES),
+        repeticiones=max(1, args.repeticiones or REPETICIONES),
+        cantidades=args.procesos if args.procesos is not None else PROCESOS_LOTE,
+        cartas_lote=args.cartas or CARTAS_LOTE,
+        progreso=lambda mensaje: print(f"… {mensaje}", file=sys.stderr, flush=True),
+    )
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    print("\n".join(reporte(resultado)))
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"Comparado con {args.comparar} ({anterior.get('fecha', '?')}):")
+        print("\n".join(comparar(anterior, resultado)))
+    print(f"Resultado en {args.salida}")
@@ -0,0 +1,32 @@
+"""
+Datos fijos de las cartas: gerentes, meses y canales de ingreso.
+Los tipos de carta y sus categorías están en cartas.registro.
+"""
+
+# ================= GERENTES POR ZONA =================
+GERENTES = {
+    "Norte": "Christian Alberto Gómez Díaz",
+    "Centro": "Alex Andrés González Villablanca",
+    "Sur": "Christian Enrique Araya Silva"
+}
+
+# ================= MESES =================
+MESES = ["", "enero", "febrero", "marzo", "abril", "mayo", "junio",
+         "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+
+# ================= CANALES CON GÉNERO =================
+CANALES_MASCULINO = ["Call Center", "Correo Electrónico"]
+CANALES_FEMENINO = ["Oficina Comercial", "Página Web", "App CGE 1Click"]
+CANALES_EXTERNOS = ["Portal SEC", "Portal SERNAC"]  # Sin "nuestro/nuestra"
+
+# Opciones del selector "Canal de ingreso del reclamo"
+CANALES_INGRESO = [
+    "Oficina Comercial",
+    "WhatsApp",
+    "App CGE 1Click",
+    "Call Center",
+    "Correo Electrónico",
+    "Página Web",
+    "Portal SEC",
+    "Portal SERNAC"
+]
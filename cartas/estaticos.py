@@ -0,0 +1,60 @@
+"""
+HTML y CSS fijos de la app.
+
+Se construyen una sola vez al importar el módulo y no en cada rerun del
+script.
+"""
+
+ENCABEZADO_HTML = """
+<div style='background:linear-gradient(90deg,#1e40af,#0ea5e9);
+padding:25px;border-radius:12px;margin-bottom:25px;box-shadow:0 4px 6px rgba(0,0,0,0.1)'>
+<h1 style='color:white;margin:0;font-size:2.2em'>⚡ AUTOMATIZADOR DE CARTAS </h1>
+<p style='color:#e0f2fe;margin:8px 0 0 0;font-size:1.1em'>Sistema de Generación Automática de Respuestas</p>
+</div>
+"""
+
+# Botón "REINICIAR FORMULARIO": rectangular, blanco con borde negro
+ESTILO_BOTON_REINICIAR = """
+<style>
+div[data-testid="stButton"] button[kind="secondary"] {
+    background-color: white !important;
+    background: white !important;
+    color: black !important;
+    border: 2px solid #000000 !important;
+    font-weight: 700 !important;
+    font-size: 0.9rem !important;
+    border-radius: 8px !important;
+    padding: 12px 8px !important;
+    box-shadow: 0 2px 6px rgba(0, 0, 0, 0.2) !important;
+    transition: all 0.3s !important;
+    width: 100% !important;
+    height: 60px !important;
+    display: flex !important;
+    align-items: center !important;
+    justify-content: center !important;
+    text-align: center !important;
+    white-space: normal !important;
+    line-height: 1.2 !important;
+}
+div[data-testid="stButton"] button[kind="secondary"]:hover {
+    background-color: #f0f0f0 !important;
+    background: #f0f0f0 !important;
+    box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3) !important;
+    transform: scale(1.02) !important;
+    border-color: #000000 !important;
+    color: black !important;
+}
+div[data-testid="stButton"] button[kind="secondary"]:active {
+    transform: scale(0.98) !important;
+    background-color: #e0e0e0 !important;
+}
+</style>
+"""
+
+PIE_HTML = """
+<div style='text-align:center;padding:20px;color:#64748b;font-size:0.9em'>
+    <p style='margin:5px 0'>⚡ <strong>Automatizador de Cartas</strong></p>
+    <p style='margin:5px 0'>Desarrollado por <a href='https://ciberbyte.vercel.app/' target='_blank' style='color:#0ea5e9; text-decoration:none; font-weight:bold;'>CiberByte</a> <span style='color:#94a3b8'>/</span> <a href='https://wa.me/56979693753?text=Hola%20Javier,%20consulta%20sobre%20el%20Automatizador%20de%20Cartas' target='_blank' style='color:#1e40af; text-decoration:none; font-weight:600;'>Javier Ruiz Arismendi <svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="#25D366" style="vertical-align: middle; margin-left: 3px;"><path d="M17.472 14.382c-.297-.149-1.758-.867-2.03-.967-.273-.099-.471-.148-.67.15-.197.297-.767.966-.94 1.164-.173.199-.347.223-.644.075-.297-.15-1.255-.463-2.39-1.475-.883-.788-1.48-1.761-1.653-2.059-.173-.297-.018-.458.13-.606.134-.133.298-.347.446-.52.149-.174.198-.298.298-.497.099-.198.05-.371-.025-.52-.075-.149-.669-1.612-.916-2.207-.242-.579-.487-.5-.669-.51-.173-.008-.371-.01-.57-.01-.198 0-.52.074-.792.372-.272.297-1.04 1.016-1.04 2.479 0 1.462 1.065 2.875 1.213 3.074.149.198 2.096 3.2 5.077 4.487.709.306 1.262.489 1.694.625.712.227 1.36.195 1.871.118.571-.085 1.758-.719 2.006-1.413.248-.694.248-1.289.173-1.413-.074-.124-.272-.198-.57-.347m-5.421 7.403h-.004a9.87 9.87 0 01-5.031-1.378l-.361-.214-3.741.982.998-3.648-.235-.374a9.86 9.86 0 01-1.51-5.26c.001-5.45 4.436-9.884 9.888-9.884 2.64 0 5.122 1.03 6.988 2.898a9.825 9.825 0 012.893 6.994c-.003 5.45-4.437 9.884-9.885 9.884m8.413-18.297A11.815 11.815 0 0012.05 0C5.495 0 .16 5.335.157 11.892c0 2.096.547 4.142 1.588 5.945L.057 24l6.305-1.654a11.882 11.882 0 005.683 1.448h.005c6.554 0 11.89-5.335 11.893-11.893a11.821 11.821 0 00-3.48-8.413Z"/></svg></a></p>
+    <p style='margin:5px 0'>© 2025 - Sistema de Generación Automática</p>
+</div>
+"""
@@ -0,0 +1,161 @@
+"""
+Formateo de los datos ingresados (montos, kWh, fechas y nombres).
+"""
+
+# Fecha de Excel leída como texto ("2025-01-31 00:00:00"); con FECHA_EXCEL_DMY queda "31/01/2025"
+FECHA_EXCEL = r"^(\d{4})-(\d{2})-(\d{2})(?: 00:00:00)?$"
+FECHA_EXCEL_DMY = r"\3/\2/\1"
+
+
+def formatear_monto(valor):
+    """Formatea monto con $ y puntos de miles"""
+    try:
+        valor_limpio = str(valor).replace('$', '').replace('.', '').replace(',', '').strip()
+        if valor_limpio:
+            numero = int(valor_limpio)
+            return f"${numero:,}".replace(',', '.')
+        return valor
+    except:
+        return valor
+
+
+def formatear_numero_kwh(valor):
+    """
+    Formatea número con puntos de miles (sin $)
+    6500 → 6.500
+    """
+    try:
+        valor_limpio = str(valor).replace('.', '').replace(',', '').strip()
+        if valor_limpio:
+            numero = int(valor_limpio)
+            return f"{numero:,}".replace(',', '.')
+        return valor
+    except:
+        return valor
+
+
+def capitalizar_texto(texto):
+    """
+    Capitaliza la primera letra de cada palabra
+    eduardo lópez → Eduardo López
+    """
+    if texto:
+        return texto.title()
+    return texto
+
+
+def formatear_fecha(fecha_input):
+    """
+    Formatea fecha de DDMMYYYY a DD/MM/YYYY
+    20022025 → 20/02/2025
+    También acepta ya formateadas: 20/02/2025 → 20/02/2025
+    """
+    if not fecha_input:
+        return fecha_input
+    
+    # Limpiar entrada (quitar espacios, guiones, puntos, barras)
+    fecha_limpia = str(fecha_input).replace('/', '').replace('-', '').replace('.', '').replace(' ', '').strip()
+    
+    # Si tiene exactamente 8 dígitos, formatear
+    if len(fecha_limpia) == 8 and fecha_limpia.isdigit():
+        dia = fecha_limpia[0:2]
+        mes = fecha_limpia[2:4]
+        anio = fecha_limpia[4:8]
+        
+        # Validación básica
+        try:
+            dia_int = int(dia)
+            mes_int = int(mes)
+            anio_int = int(anio)
+            
+            if 1 <= dia_int <= 31 and 1 <= mes_int <= 12 and 2000 <= anio_int <= 2100:
+                return f"{dia}/{mes}/{anio}"
+        except:
+            pass
+    
+    # Si ya está formateada o no es válida, devolver tal cual
+    return fecha_input
+
+
+# ================= POR COLUMNAS =================
+# Las mismas reglas sobre una columna completa (pandas.Series de texto), para
+# los lotes. Las filas con caracteres fuera de ASCII (dígitos de otros
+# alfabetos, "_" entre dígitos...) se resuelven con la versión por valor, así
+# que el resultado es siempre el mismo. Las celdas vacías no se procesan.
+
+def _llenas(serie, funcion):
+    llenas = serie != ""
+    if llenas.all():
+        return funcion(serie)
+    salida = serie.copy()
+    if llenas.any():
+        salida[llenas] = funcion(serie[llenas])
+    return salida
+
+
+def _por_valor(serie, resultado, mascara, funcion):
+    if mascara.any():
+        resultado = resultado.copy()
+        resultado[mascara] = serie[mascara].map(funcion)
+    return resultado
+
+
+def _miles(limpio, prefijo):
+    """Números enteros ASCII con signo opcional → prefijo + puntos de miles"""
+    negativo = limpio.str.startswith("-")
+    digitos = limpio.str.lstrip("+-").str.lstrip("0").replace("", "0")
+    # Grupos de tres desde la derecha (con cortes, sin expresiones regulares)
+    resultado = digitos.str.slice(-3)
+    for hasta in range(-3, -int(digitos.str.len().max() or 0), -3):
+        grupo = digitos.str.slice(hasta - 3, hasta)
+        resultado = (grupo + ".").where(grupo != "", "") + resultado
+    signo = negativo & (digitos != "0")
+    return prefijo + resultado.mask(signo, "-" + resultado)
+
+
+def _numeros(serie, quitar, prefijo, funcion):
+    texto = serie.astype(str)
+    limpio = texto.str.replace(quitar, "", regex=True).str.strip()
+    numero = limpio.str.fullmatch(r"[+-]?[0-9]+", na=False)
+    resultado = serie.where(~numero, _miles(limpio.where(numero, "0"), prefijo))
+    otros = ~numero & (limpio != "") & ~(limpio.str.isascii() & ~limpio.str.contains("_", regex=False))
+    return _por_valor(serie, resultado, otros, funcion)
+
+
+def formatear_montos(serie):
+    """formatear_monto() de toda una columna"""
+    return _llenas(serie, lambda llenas: _numeros(llenas, r"[$.,]", "$", formatear_monto))
+
+
+def formatear_numeros_kwh(serie):
+    """formatear_numero_kwh() de toda una columna"""
+    return _llenas(serie, lambda llenas: _numeros(llenas, r"[.,]", "", formatear_numero_kwh))
+
+
+def formatear_fechas(serie):
+    """formatear_fecha() de toda una columna"""
+    return _llenas(serie, _fechas)
+
+
+def fechas_excel(serie):
+    """Las fechas de Excel leídas como texto ("2025-11-24 00:00:00") como dd/mm/aaaa; lo demás igual"""
+    return serie.str.replace(FECHA_EXCEL, FECHA_EXCEL_DMY, regex=True)
+
+
+def _fechas(serie):
+    limpia = serie.astype(str).str.replace(r"[/\-. ]", "", regex=True).str.strip()
+    dia, mes, anio = limpia.str.slice(0, 2), limpia.str.slice(2, 4), limpia.str.slice(4, 8)
+    # Con ocho dígitos ASCII los rangos se pueden comparar como texto
+    valida = (
+        limpia.str.fullmatch(r"[0-9]{8}", na=False)
+        & dia.between("01", "31") & mes.between("01", "12") & anio.between("2000", "2100")
+    )
+    resultado = serie.where(~valida, dia + "/" + mes + "/" + anio)
+    # Ocho "dígitos" que no son 0-9 (isdigit() también acepta otros alfabetos)
+    otros = ~valida & ~limpia.str.isascii()
+    return _por_valor(serie, resultado, otros, formatear_fecha)
+
+
+def capitalizar_textos(serie):
+    """capitalizar_texto() de toda una columna"""
+    return _llenas(serie, lambda llenas: llenas.str.title())
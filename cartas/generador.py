@@ -0,0 +1,291 @@
+"""
+Generación de una carta a partir de un diccionario de datos.
+
+    from cartas.generador import generar_carta
+    contenido = generar_carta("error_lectura_halu", {"gr_numero": "15624563", ...})
+
+
+'datos' usa los mismos nombres que el formulario de la app (comuna,
+nombre_cliente, gr_numero, zona, canal_ingreso...) más los campos propios
+de cada tipo de carta. Los valores pueden venir sin formatear: los montos,
+kWh, fechas y nombres se normalizan aquí, igual que en el formulario.
+"""
+import io
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from cartas.constantes import CANALES_INGRESO, GERENTES
+from cartas import metricas, ooxml, planes, registro, renders
+from cartas.manifiesto import cargar_manifiesto, claves_presentes, parrafos_afectados
+from cartas.plantillas import clonar_template, ruta_template
+from cartas.reemplazos import compilar_reemplazos, texto_parrafo
+
+# ================= MODO DE REEMPLAZO =================
+# "runs": edita solo los runs que contienen marcadores y conserva el formato del template
+# "parrafo": reconstruye cada párrafo modificado en Arial 10 y aplica las reglas de negrita
+MODO_REEMPLAZO = "runs"
+
+# ================= MOTOR =================
+# "plan": une los trozos precompilados del template (cartas.planes); sin plan usa "ooxml"
+# "ooxml": edita document.xml, encabezados y pies directo en el zip del template (cartas.ooxml)
+# "docx": modelo de objetos de python-docx; se usa siempre con el modo "parrafo"
+# El anexo se agrega al .docx ya generado (cartas.anexo), con cualquier motor
+MOTOR = "plan"
+
+_W_TC = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tc"
+
+CAMPOS_REQUERIDOS = {
+    "nombre_cliente": "Nombre cliente",
+    "gr_numero": "N° GR",
+    "direccion": "Dirección",
+    "comuna": "Comuna",
+    "numero_cliente": "Número cliente",
+    "tratamiento": "Tratamiento",
+}
+
+def fecha_chile():
+    """Fecha y hora actual en Chile continental"""
+    return datetime.now(timezone(timedelta(hours=-3)))
+
+
+def campos_faltantes(datos):
+    """Etiquetas de los campos obligatorios que vienen vacíos"""
+    return [etiqueta for campo, etiqueta in CAMPOS_REQUERIDOS.items() if not datos.get(campo)]
+
+
+def fechas_invalidas(datos):
+    """Problemas de los campos de fecha que no quedaron como fecha (ver registro.FECHAS_FORMATEADAS)"""
+    return [
+        f"{campo} no es una fecha válida: '{datos[campo]}'"
+        for campo, formato in registro.FORMATOS_CAMPOS.items()
+        if formato in registro.FECHAS_FORMATEADAS and datos.get(campo)
+        and not re.fullmatch(registro.FECHAS_FORMATEADAS[formato], datos[campo])
+    ]
+
+
+def validar(tipo_carta, datos):
+    """Lista de problemas que impiden generar la carta (vacía si está todo bien)"""
+    errores = []
+    if tipo_carta not in registro.TIPOS_CARTA:
+        errores.append(f"tipo_carta desconocido: '{tipo_carta}'")
+    elif not os.path.exists(ruta_template(tipo_carta)):
+        errores.append(f"No se encontró el template: {ruta_template(tipo_carta)}")
+    faltantes = campos_faltantes(datos)
+    if faltantes:
+        errores.append(f"Faltan campos obligatorios: {', '.join(faltantes)}")
+    if datos.get("zona") not in GERENTES:
+        errores.append(f"zona inválida: '{datos.get('zona', '')}' (use {', '.join(GERENTES)})")
+    if datos.get("canal_ingreso") not in CANALES_INGRESO:
+        errores.append(f"canal_ingreso inválido: '{datos.get('canal_ingreso', '')}'")
+    return errores
+
+
+def normalizar_datos(datos):
+    """Copia de 'datos' como texto, con montos, kWh, fechas y nombres formateados"""
+    d = {campo: ("" if valor is None else str(valor).strip()) for campo, valor in datos.items()}
+    # Formatos de los campos comunes y de todas las cartas (cartas.registro)
+    for campo, formato in registro.FORMATOS_CAMPOS.items():
+        d[campo] = registro.formatear(formato, d.get(campo, ""))
+    return d
+
+
+def construir_reemplazos(tipo_carta, datos, hoy):
+    """Diccionario marcador del template → texto final, para datos ya normalizados (ver cartas.registro)"""
+    return registro.construir_reemplazos(tipo_carta, datos, hoy)
+
+
+def _reconstruir_parrafo(paragraph, texto_nuevo, datos, hoy):
+    """Modo "parrafo": un solo run Arial 10 con las reglas de negrita de siempre"""
+    from docx.shared import Pt
+
+    paragraph.clear()
+    run = paragraph.add_run(texto_nuevo)
+    run.font.name = 'Arial'
+    run.font.size = Pt(10)
+
+    comuna = datos.get("comuna", "")
+    # SOLO estas palabras van en negrita (SIN fecha, SIN DGR, SIN cuerpo de carta)
+    palabras_con_negrita = [
+        datos.get("tratamiento", ""),
+        datos.get("nombre_cliente", ""),
+        datos.get("direccion", ""),
+        "Número de cliente:",
+        "Ref.: Reclamo N°",
+        GERENTES.get(datos.get("zona"), ""),
+        "COMPAÑÍA GENERAL DE ELECTRICIDAD S.A."
+    ]
+
+    # Aplica negrita SOLO si coincide Y NO es fecha ni DGR
+    es_fecha = (f"{comuna}," in texto_nuevo and "de" in texto_nuevo and str(hoy.year) in texto_nuevo)
+    es_dgr = ("DGR N°" in texto_nuevo and str(hoy.year) in texto_nuevo)
+
+    # NO aplicar negrita si el texto es muy largo (más de 100 caracteres = cuerpo de carta)
+    es_cuerpo_carta = len(texto_nuevo) > 100
+
+    if any(x in texto_nuevo for x in palabras_con_negrita) and not es_fecha and not es_dgr and not es_cuerpo_carta:
+        run.font.bold = True
+    else:
+        run.font.bold = False
+
+    # Excepción: Si el párrafo es SOLO la comuna (una línea), SÍ va en negrita
+    if texto_nuevo.strip() == comuna:
+        run.font.bold = True
+
+
+def renderizar(template_path, reemplazos, datos, hoy, modo=None, marcar=None):
+    """Clona el template y le aplica los reemplazos; devuelve el Document"""
+    doc = clonar_template(template_path)
+    reemplazar_en_documento(doc, template_path, reemplazos, datos, hoy, modo=modo, marcar=marcar)
+    return doc
+
+
+def reemplazar_en_documento(doc, template_path, reemplazos, datos, hoy, modo=None, marcar=None):
+    """
+    Aplica los reemplazos sobre 'doc', un clon del template de 'template_path'.
+    'marcar(etapa)' se llama al terminar cada etapa (ver cartas.metricas).
+    """
+    marcar = marcar or _sin_marca
+    # Solo se visitan los párrafos donde el índice del template ubica alguna clave
+    # (cuerpo, tablas, cuadros de texto, encabezados y pies, en una sola lista)
+    manifiesto = cargar_manifiesto(template_path)
+    claves = claves_presentes(manifiesto, reemplazos)
+    parrafos = parrafos_afectados(doc, manifiesto, claves)
+
+    # Un solo patrón con todas las claves: una pasada por párrafo
+    aplicar_reemplazos = compilar_reemplazos({k: reemplazos[k] for k in claves})
+    marcar("carga")
+
+    if (modo or MODO_REEMPLAZO) == "runs":
+        # Se editan solo los runs con marcadores: el formato es el del template
+        for p in parrafos:
+            aplicar_reemplazos.en_runs(p)
+    else:
+        from docx.shared import Pt
+        from docx.text.paragraph import Paragraph
+
+        for p in parrafos:
+            texto = texto_parrafo(p)
+            texto_nuevo = aplicar_reemplazos(texto)
+            if texto_nuevo == texto:
+                continue
+            paragraph = Paragraph(p, None)
+            if next(p.iterancestors(_W_TC), None) is None:
+                _reconstruir_parrafo(paragraph, texto_nuevo, datos, hoy)
+            else:
+                # En las celdas de tabla: Arial 10 sin reglas de negrita
+                paragraph.clear()
+                r = paragraph.add_run(texto_nuevo)
+                r.font.name = 'Arial'
+                r.font.size = Pt(10)
+    marcar("parrafos")
+
+
+def _sin_marca(etapa):
+    pass
+
+
+def nombre_archivo(tipo_carta, gr_numero, ahora=None):
+    """Nombre del .docx generado: Carta_<tipo>_<GR>_<timestamp>.docx"""
+    timestamp = (ahora or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    return f"Carta_{tipo_carta}_{gr_numero}_{timestamp}.docx"
+
+
+def agregar_anexo(contenido, df):
+    """El .docx (bytes) con una página final con la tabla de datos adicionales (ver cartas.anexo)"""
+    # pandas solo se carga si la carta lleva anexo
+    from cartas import anexo
+
+    return anexo.agregar_a_docx(contenido, df)
+
+
+def _preparar(tipo_carta, datos, hoy, normalizado=False):
+    """
+    Normaliza y valida; devuelve (datos, hoy, reemplazos) o lanza ValueError.
+    Con 'normalizado' los datos ya vienen normalizados y validados (por
+    ejemplo las filas de cartas.lote.revisar_planilla): no se vuelven a
+    normalizar y solo se revisan las fechas, que la normalización deja
+    tal cual si no las puede leer.
+    """
+    if normalizado:
+        problemas = fechas_invalidas(datos)
+    else:
+        datos = normalizar_datos(datos)
+        problemas = validar(tipo_carta, datos)
+    if problemas:
+        raise ValueError("; ".join(problemas))
+
+    hoy = hoy or fecha_chile()
+    return datos, hoy, construir_reemplazos(tipo_carta, datos, hoy)
+
+
+def generar_documento(tipo_carta, datos, hoy=None, anexo=None, modo=None, marcar=None):
+    """
+    Valida, normaliza y renderiza la carta; devuelve el Document.
+    Lanza ValueError si faltan datos o el tipo de carta no existe.
+    """
+    marcar = marcar or _sin_marca
+    datos, hoy, reemplazos = _preparar(tipo_carta, datos, hoy)
+    marcar("reemplazos")
+    doc = renderizar(ruta_template(tipo_carta), reemplazos, datos, hoy, modo=modo, marcar=marcar)
+    if anexo is not None:
+        from cartas.anexo import agregar_anexo as agregar_anexo_documento
+
+        doc = agregar_anexo_documento(doc, anexo)
+        marcar("anexo")
+    return doc
+
+
+def generar_carta(tipo_carta, datos, hoy=None, anexo=None, modo=None, motor=None, cronometro=None, normalizado=False):
+    """
+    Genera la carta y devuelve el contenido del .docx en bytes.
+    Los tiempos por etapa quedan en cartas.metricas; si se pasa un
+    Cronometro, registrarlo queda a cargo de quien llama. Con 'normalizado'
+    los datos no se vuelven a normalizar ni validar (ver _preparar).
+    """
+    propio = cronometro is None
+    if propio:
+        cronometro = metricas.Cronometro(tipo_carta)
+    try:
+        contenido = _generar(tipo_carta, datos, hoy, anexo, modo, motor or MOTOR, cronometro.marcar, normalizado)
+    except Exception:
+        if propio:
+            cronometro.registrar(ok=False)
+        raise
+    if propio:
+        cronometro.registrar()
+    return contenido
+
+
+def _generar(tipo_carta, datos, hoy, anexo, modo, motor, marcar, normalizado=False):
+    modo = modo or MODO_REEMPLAZO
+    path = ruta_template(tipo_carta)
+    datos, hoy, reemplazos = _preparar(tipo_carta, datos, hoy, normalizado)
+    marcar("reemplazos")
+
+    # La misma carta (template, datos y fecha) ya generada sale de la caché;
+    # el anexo se agrega después, así que no cambia la clave
+    clave = renders.clave(path, reemplazos, hoy, motor, modo)
+    contenido = renders.obtener(clave)
+    if contenido is not None:
+        marcar("cache")
+    else:
+        contenido = _renderizar_contenido(path, reemplazos, datos, hoy, modo, motor, marcar)
+        renders.guardar(clave, contenido)
+
+    if anexo is not None:
+        contenido = agregar_anexo(contenido, anexo)
+        marcar("anexo")
+    return contenido
+
+
+def _renderizar_contenido(path, reemplazos, datos, hoy, modo, motor, marcar):
+    if motor in ("plan", "ooxml") and modo == "runs":
+        if motor == "plan":
+            return planes.renderizar(path, reemplazos, marcar)
+        return ooxml.renderizar(path, reemplazos, marcar)
+    doc = renderizar(path, reemplazos, datos, hoy, modo=modo, marcar=marcar)
+    salida = io.BytesIO()
+    doc.save(salida)
+    marcar("guardado")
+    return salida.getvalue()
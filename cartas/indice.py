@@ -0,0 +1,356 @@
+"""
+Índice SQLite de las cartas generadas y retención de 'output/'.
+
+Cada carta se registra al generarse con su GR, cliente, tipo, zona, canal,
+los datos ingresados, dónde quedó el archivo y el sha256 del contenido.
+El registro es de solo agregar: los triggers rechazan borrados y cambios,
+salvo la ubicación del archivo (ruta y estado) que mueve la retención.
+buscar() encuentra las cartas por GR, número de cliente y rango de fechas
+usando índices, y leer() devuelve el archivo ya generado para volver a
+descargarlo sin generarlo de nuevo.
+
+Los totales del pie de página salen de una tabla de contadores que se
+actualiza en la misma transacción, así que leerlos no recorre 'output/'.
+La primera vez que se crea el índice se importan las cartas que ya
+estaban en la carpeta.
+
+La retención archiva (output/archivo/AAAA-MM/) o borra las cartas con más
+de DIAS_RETENCION días. Corre sola en un thread aparte como máximo una vez
+por hora al registrar cartas (sin demorar la carta que se está guardando),
+o a mano con:
+
+    python -m cartas retencion --dias 365 --accion archivar
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+from cartas.artefactos import DIRECTORIO_SALIDA
+
+RUTA_INDICE = os.path.join(DIRECTORIO_SALIDA, "indice.sqlite3")
+DIRECTORIO_ARCHIVO = os.path.join(DIRECTORIO_SALIDA, "archivo")
+
+# ================= RETENCIÓN =================
+DIAS_RETENCION = 365
+ACCION_RETENCION = "archivar"  # "archivar" o "borrar"
+INTERVALO_RETENCION = 3600  # segundos entre pasadas automáticas
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cartas (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    ruta TEXT,
+    tipo_carta TEXT NOT NULL DEFAULT '',
+    gr_numero TEXT NOT NULL DEFAULT '',
+    bytes INTEGER NOT NULL DEFAULT 0,
+    creada REAL NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'activa',
+    numero_cliente TEXT NOT NULL DEFAULT '',
+    zona TEXT NOT NULL DEFAULT '',
+    canal_ingreso TEXT NOT NULL DEFAULT '',
+    datos TEXT NOT NULL DEFAULT '{}',
+    sha256 TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS contadores (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+# Columnas agregadas después de la primera versión del índice
+_COLUMNAS_NUEVAS = {
+    "numero_cliente": "TEXT NOT NULL DEFAULT ''",
+    "zona": "TEXT NOT NULL DEFAULT ''",
+    "canal_ingreso": "TEXT NOT NULL DEFAULT ''",
+    "datos": "TEXT NOT NULL DEFAULT '{}'",
+    "sha256": "TEXT NOT NULL DEFAULT ''",
+}
+
+_INDICES = """
+CREATE INDEX IF NOT EXISTS cartas_en_disco ON cartas (creada) WHERE estado = 'activa' AND ruta IS NOT NULL;
+CREATE INDEX IF NOT EXISTS cartas_gr ON cartas (gr_numero, creada);
+CREATE INDEX IF NOT EXISTS cartas_cliente ON cartas (numero_cliente, creada);
+CREATE INDEX IF NOT EXISTS cartas_creada ON cartas (creada);
+CREATE INDEX IF NOT EXISTS cartas_ruta ON cartas (ruta) WHERE ruta IS NOT NULL;
+CREATE INDEX IF NOT EXISTS cartas_sha256 ON cartas (sha256) WHERE sha256 != '';
+CREATE TRIGGER IF NOT EXISTS cartas_sin_borrar BEFORE DELETE ON cartas
+BEGIN
+    SELECT RAISE(ABORT, 'El registro de cartas no admite borrados');
+END;
+CREATE TRIGGER IF NOT EXISTS cartas_solo_ubicacion
+BEFORE UPDATE OF nombre, tipo_carta, gr_numero, bytes, creada, numero_cliente, zona, canal_ingreso, datos, sha256
+ON cartas
+BEGIN
+    SELECT RAISE(ABORT, 'De una carta registrada solo cambia la ubicación (ruta, estado)');
+END;
+"""
+
+_CAMPOS_BUSQUEDA = (
+    "id", "nombre", "ruta", "tipo_carta", "gr_numero", "numero_cliente", "zona",
+    "canal_ingreso", "bytes", "creada", "estado", "sha256",
+)
+
+# Carta_<tipo>_<gr>_<AAAAMMDD>_<HHMMSS>.docx (los nombres antiguos no traen el tipo)
+_NOMBRE_CARTA = re.compile(r"^Carta_(?:(?P<tipo>.+)_)?(?P<gr>[^_]+)_\d{8}_\d{6}(?:_\d+)?\.docx$")
+
+_conexion = None
+_ruta_conexion = None
+_lock = threading.Lock()
+_lock_retencion = threading.Lock()  # una sola pasada de retención a la vez
+_ultima_retencion = 0.0
+
+
+def _conectar():
+    """Conexión única del proceso (se usa siempre bajo _lock)"""
+    global _conexion, _ruta_conexion
+    if _conexion is None or _ruta_conexion != RUTA_INDICE:
+        os.makedirs(os.path.dirname(RUTA_INDICE) or ".", exist_ok=True)
+        nueva = not os.path.exists(RUTA_INDICE)
+        _conexion = sqlite3.connect(RUTA_INDICE, timeout=10, check_same_thread=False, isolation_level=None)
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.executescript(_ESQUEMA)
+        existentes = {fila[1] for fila in _conexion.execute("PRAGMA table_info(cartas)")}
+        for columna, definicion in _COLUMNAS_NUEVAS.items():
+            if columna not in existentes:
+                _conexion.execute(f"ALTER TABLE cartas ADD COLUMN {columna} {definicion}")
+        _conexion.executescript(_INDICES)
+        _ruta_conexion = RUTA_INDICE
+        if nueva:
+            _importar_existentes(_conexion)
+    return _conexion
+
+
+def _sumar(conexion, clave, cantidad):
+    conexion.execute(
+        "INSERT INTO contadores (clave, valor) VALUES (?, ?) "
+        "ON CONFLICT (clave) DO UPDATE SET valor = valor + excluded.valor",
+        (clave, cantidad),
+    )
+
+
+def _importar_existentes(conexion):
+    """Registra las cartas que ya estaban en 'output/' (solo al crear el índice)"""
+    filas = []
+    for entrada in os.scandir(DIRECTORIO_SALIDA):
+        if not entrada.is_file() or not entrada.name.endswith(".docx"):
+            continue
+        coincide = _NOMBRE_CARTA.match(entrada.name)
+        estado = entrada.stat()
+        filas.append((
+            entrada.name,
+            os.path.join(DIRECTORIO_SALIDA, entrada.name),
+            (coincide and coincide.group("tipo")) or "",
+            coincide.group("gr") if coincide else "",
+            estado.st_size,
+            estado.st_mtime,
+        ))
+    conexion.execute("BEGIN")
+    conexion.executemany(
+        "INSERT INTO cartas (nombre, ruta, tipo_carta, gr_numero, bytes, creada) VALUES (?, ?, ?, ?, ?, ?)", filas
+    )
+    _sumar(conexion, "generadas", len(filas))
+    _sumar(conexion, "en_disco", len(filas))
+    conexion.execute("COMMIT")
+
+
+def registrar(nombre, ruta, tipo_carta="", datos=None, contenido=b"", creada=None):
+    """
+    Agrega una carta al índice con los datos ingresados y el sha256 del
+    contenido; 'ruta' es None si no se guardó en disco. Devuelve el id.
+    """
+    datos = datos or {}
+    fila = (
+        nombre, ruta, tipo_carta,
+        str(datos.get("gr_numero", "")), str(datos.get("numero_cliente", "")),
+        str(datos.get("zona", "")), str(datos.get("canal_ingreso", "")),
+        json.dumps(datos, ensure_ascii=False, sort_keys=True, default=str),
+        len(contenido), hashlib.sha256(contenido).hexdigest() if contenido else "",
+        creada or time.time(),
+    )
+    with _lock:
+        conexion = _conectar()
+        conexion.execute("BEGIN")
+        carta_id = conexion.execute(
+            "INSERT INTO cartas (nombre, ruta, tipo_carta, gr_numero, numero_cliente, zona, canal_ingreso, "
+            "datos, bytes, sha256, creada) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            fila,
+        ).lastrowid
+        _sumar(conexion, "generadas", 1)
+        if ruta:
+            _sumar(conexion, "en_disco", 1)
+        conexion.execute("COMMIT")
+
+    if time.time() - _ultima_retencion > INTERVALO_RETENCION:
+        _retencion_en_segundo_plano()
+    return carta_id
+
+
+def buscar(texto=None, gr_numero=None, numero_cliente=None, desde=None, hasta=None, limite=20):
+    """
+    Cartas registradas, de la más nueva a la más antigua. 'texto' busca
+    el valor como GR o como número de cliente; 'desde' y 'hasta' son
+    timestamps. Devuelve una lista de diccionarios (sin los datos ingresados).
+    """
+    condiciones = []
+    parametros = []
+    if texto:
+        condiciones.append("(gr_numero = ? OR numero_cliente = ?)")
+        parametros += [texto.strip(), texto.strip()]
+    if gr_numero:
+        condiciones.append("gr_numero = ?")
+        parametros.append(gr_numero)
+    if numero_cliente:
+        condiciones.append("numero_cliente = ?")
+        parametros.append(numero_cliente)
+    if desde is not None:
+        condiciones.append("creada >= ?")
+        parametros.append(desde)
+    if hasta is not None:
+        condiciones.append("creada < ?")
+        parametros.append(hasta)
+    consulta = f"SELECT {', '.join(_CAMPOS_BUSQUEDA)} FROM cartas"
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += " ORDER BY creada DESC LIMIT ?"
+    with _lock:
+        filas = _conectar().execute(consulta, (*parametros, limite)).fetchall()
+    return [dict(zip(_CAMPOS_BUSQUEDA, fila)) for fila in filas]
+
+
+def buscar_contenido(sha256):
+    """La carta activa más reciente con ese contenido que sigue en disco, o None"""
+    with _lock:
+        # Una archivada tiene ruta (en DIRECTORIO_ARCHIVO), pero no se reutiliza como carta nueva
+        fila = _conectar().execute(
+            f"SELECT {', '.join(_CAMPOS_BUSQUEDA)} FROM cartas "
+            "WHERE sha256 = ? AND sha256 != '' AND estado = 'activa' AND ruta IS NOT NULL ORDER BY creada DESC LIMIT 1",
+            (sha256,),
+        ).fetchone()
+    if fila is None or not os.path.exists(fila[_CAMPOS_BUSQUEDA.index("ruta")]):
+        return None
+    return dict(zip(_CAMPOS_BUSQUEDA, fila))
+
+
+def datos_ingresados(carta_id):
+    """Datos con que se generó la carta (diccionario vacío si no se conocen)"""
+    with _lock:
+        fila = _conectar().execute("SELECT datos FROM cartas WHERE id = ?", (carta_id,)).fetchone()
+    return json.loads(fila[0]) if fila else {}
+
+
+def leer(carta_id):
+    """
+    Contenido del .docx ya generado, o None si no está en disco o cambió
+    después de registrarse (otro sha256).
+    """
+    with _lock:
+        fila = _conectar().execute("SELECT ruta, sha256 FROM cartas WHERE id = ?", (carta_id,)).fetchone()
+    if not fila or not fila[0]:
+        return None
+    ruta, sha256 = fila
+    try:
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+    except OSError:
+        return None
+    if sha256 and hashlib.sha256(contenido).hexdigest() != sha256:
+        return None
+    return contenido
+
+
+def contadores():
+    """
+    Totales del índice: {'generadas', 'en_disco', 'archivadas'}. Las
+    archivadas siguen en disco (en output/archivo) y cuentan en 'en_disco'.
+    """
+    with _lock:
+        valores = dict(_conectar().execute("SELECT clave, valor FROM contadores"))
+    return {clave: valores.get(clave, 0) for clave in ("generadas", "en_disco", "archivadas")}
+
+
+def _mover(viejas, accion):
+    """Archiva o borra los archivos; devuelve los cambios (estado, ruta nueva, ruta anterior) para el índice"""
+    cambios = []
+    for ruta, creada in viejas:
+        if accion == "borrar":
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            cambios.append(("borrada", None, ruta))
+        else:
+            destino_dir = os.path.join(DIRECTORIO_ARCHIVO, time.strftime("%Y-%m", time.localtime(creada)))
+            destino = os.path.join(destino_dir, os.path.basename(ruta))
+            os.makedirs(destino_dir, exist_ok=True)
+            try:
+                shutil.move(ruta, destino)
+            except FileNotFoundError:
+                destino = None
+            cambios.append(("archivada", destino, ruta))
+    return cambios
+
+
+def aplicar_retencion(dias=None, accion=None, ahora=None):
+    """
+    Archiva o borra las cartas en disco con más de 'dias' días.
+    Devuelve cuántas se procesaron.
+    """
+    global _ultima_retencion
+    dias = DIAS_RETENCION if dias is None else dias
+    accion = accion or ACCION_RETENCION
+    if accion not in ("archivar", "borrar"):
+        raise ValueError(f"Acción de retención desconocida: {accion}")
+    ahora = ahora or time.time()
+    limite = ahora - dias * 86400
+
+    with _lock_retencion:
+        with _lock:
+            _ultima_retencion = ahora
+            # Un archivo por vez aunque lo compartan varias cartas (la misma carta pedida de nuevo)
+            viejas = _conectar().execute(
+                "SELECT ruta, MIN(creada) FROM cartas WHERE estado = 'activa' AND ruta IS NOT NULL AND creada < ? "
+                "GROUP BY ruta",
+                (limite,),
+            ).fetchall()
+
+        # Los archivos se mueven sin tomar _lock: el índice sigue atendiendo mientras tanto
+        cambios = _mover(viejas, accion)
+        if not cambios:
+            return 0
+
+        # Las archivadas siguen en disco; solo dejan de contar las borradas o las que ya no estaban
+        actualizar = "UPDATE cartas SET estado = ?, ruta = ? WHERE ruta = ? AND estado = 'activa'"
+        with _lock:
+            conexion = _conectar()
+            conexion.execute("BEGIN")
+            fuera_de_disco = conexion.executemany(actualizar, [c for c in cambios if c[1] is None]).rowcount
+            archivadas = conexion.executemany(actualizar, [c for c in cambios if c[1] is not None]).rowcount
+            fuera_de_disco, archivadas = max(fuera_de_disco, 0), max(archivadas, 0)
+            _sumar(conexion, "en_disco", -fuera_de_disco)
+            _sumar(conexion, "archivadas", archivadas)
+            conexion.execute("COMMIT")
+    return fuera_de_disco + archivadas
+
+
+def _retencion_en_segundo_plano():
+    """Lanza aplicar_retencion() en un thread, salvo que ya haya una pasada en curso"""
+    global _ultima_retencion
+    with _lock:
+        if time.time() - _ultima_retencion <= INTERVALO_RETENCION:
+            return
+        # Marcada antes de lanzar: los registros que siguen no lanzan otra
+        _ultima_retencion = time.time()
+    threading.Thread(target=aplicar_retencion, name="retencion", daemon=True).start()
+
+
+def cerrar():
+    global _conexion
+    with _lock:
+        if _conexion is not None:
+            _conexion.close()
+        _conexion = None
@@ -0,0 +1,229 @@
+"""
+Generación de cartas por lote desde una planilla CSV o Excel.
+
+Cada fila es un reclamo: tipo_carta más los mismos campos del formulario
+(gr_numero, nombre_cliente, direccion, comuna, zona, canal_ingreso...) y
+los campos propios de su tipo de carta. Se devuelve un .zip con todas las
+cartas y un reporte con el error de cada fila que no se pudo generar.
+Las cartas se generan en paralelo con cartas.procesos.
+
+Antes de generar, revisar_planilla() normaliza y valida la planilla por
+columnas (los mismos formatos y las mismas reglas que cartas.generador
+aplica carta por carta) y revisa que cada N° GR aparezca una sola vez.
+Todo problema, de la revisión o de la generación, queda en un solo reporte.
+"""
+import io
+import os
+import zipfile
+
+import pandas as pd
+
+from cartas.constantes import CANALES_INGRESO, GERENTES
+from cartas.formato import fechas_excel
+from cartas.generador import CAMPOS_REQUERIDOS, fecha_chile
+from cartas.plantillas import ruta_template
+from cartas.procesos import generar_en_paralelo
+from cartas.registro import CAMPOS_CARTAS, FECHAS_FORMATEADAS, FORMATOS_CAMPOS, TIPOS_CARTA, formatear_columna
+
+# Columnas de la planilla de ejemplo: las del formulario común y los campos de cada carta
+COLUMNAS_PLANILLA = [
+    "tipo_carta", "gr_numero", "tratamiento", "nombre_cliente", "direccion", "comuna",
+    "numero_cliente", "zona", "canal_ingreso", "tipo_caso", "caso_sec_numero",
+] + CAMPOS_CARTAS
+
+# Encabezados alternativos aceptados en la planilla
+ALIAS_COLUMNAS = {
+    "gr": "gr_numero",
+    "n° gr": "gr_numero",
+    "reclamo": "gr_numero",
+    "cliente": "nombre_cliente",
+    "nombre": "nombre_cliente",
+    "dirección": "direccion",
+    "numero cliente": "numero_cliente",
+    "número cliente": "numero_cliente",
+    "n° cliente": "numero_cliente",
+    "formalidad": "tratamiento",
+    "canal": "canal_ingreso",
+    "tipo": "tipo_carta",
+    "carta": "tipo_carta",
+}
+
+
+def _normalizar_columna(nombre):
+    nombre = str(nombre).strip().lower()
+    return ALIAS_COLUMNAS.get(nombre, nombre.replace(" ", "_"))
+
+
+def leer_planilla(archivo, nombre):
+    """
+    Lee un .csv (separador , ; o TAB) o .xlsx como texto.
+    Las columnas quedan con los nombres que usa cartas.generador.
+    """
+    contenido = archivo.read() if hasattr(archivo, "read") else archivo
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        # pandas necesita openpyxl para leer .xlsx
+        df = pd.read_excel(io.BytesIO(contenido), dtype=str)
+    else:
+        try:
+            df = pd.read_csv(io.BytesIO(contenido), dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            # CSV exportado desde Excel en Windows
+            df = pd.read_csv(io.BytesIO(contenido), dtype=str, sep=None, engine="python", encoding="latin-1")
+    df = df.fillna("")
+    df.columns = [_normalizar_columna(columna) for columna in df.columns]
+    return df
+
+
+def planilla_ejemplo():
+    """CSV vacío con todas las columnas que entiende el lote"""
+    return (",".join(COLUMNAS_PLANILLA) + "\n").encode("utf-8-sig")
+
+
+# ================= REVISIÓN PREVIA =================
+def normalizar_planilla(df):
+    """Copia de la planilla como texto, con cada columna formateada (ver cartas.registro)"""
+    df = df.fillna("").astype(str).apply(lambda columna: columna.str.strip())
+    for columna in ("tipo_carta", *CAMPOS_REQUERIDOS, "zona", "canal_ingreso"):
+        if columna not in df:
+            df[columna] = ""
+    for campo, formato in FORMATOS_CAMPOS.items():
+        if campo in df:
+            if formato in FECHAS_FORMATEADAS:
+                # Celdas de fecha de un .xlsx: llegan como "2025-11-24 00:00:00"
+                df[campo] = fechas_excel(df[campo])
+            df[campo] = formatear_columna(formato, df[campo])
+    return df
+
+
+def _agregar(textos, mascara, texto, separador):
+    """Agrega 'texto' (str o Series) a las filas de 'mascara', separado de lo que ya tenían"""
+    nuevos = (textos + separador).where(textos != "", "") + texto
+    return nuevos.where(mascara, textos)
+
+
+def _problemas(df, filas):
+    """Texto con los problemas de cada fila (vacío si está bien), los mismos de generador.validar()"""
+    vacio = pd.Series("", index=df.index)
+    problemas = vacio
+
+    tipo = df["tipo_carta"]
+    conocido = tipo.isin(TIPOS_CARTA)
+    problemas = _agregar(problemas, ~conocido, "tipo_carta desconocido: '" + tipo + "'", "; ")
+    # Un os.path.exists() por tipo de carta, no por fila
+    rutas = {tipo_carta: ruta_template(tipo_carta) for tipo_carta in tipo[conocido].unique()}
+    sin_template = conocido & tipo.map({t: not os.path.exists(r) for t, r in rutas.items()}).fillna(False).astype(bool)
+    problemas = _agregar(problemas, sin_template, "No se encontró el template: " + tipo.map(rutas).fillna(""), "; ")
+
+    faltantes = vacio
+    for campo, etiqueta in CAMPOS_REQUERIDOS.items():
+        faltantes = _agregar(faltantes, df[campo] == "", etiqueta, ", ")
+    problemas = _agregar(problemas, faltantes != "", "Faltan campos obligatorios: " + faltantes, "; ")
+
+    # Una fecha que no quedó como dd/mm/aaaa no se pudo leer
+    for campo, formato in FORMATOS_CAMPOS.items():
+        if campo in df and formato in FECHAS_FORMATEADAS:
+            valor = df[campo]
+            invalida = (valor != "") & ~valor.str.fullmatch(FECHAS_FORMATEADAS[formato], na=False)
+            if invalida.any():
+                problemas = _agregar(problemas, invalida, f"{campo} no es una fecha válida: '" + valor + "'", "; ")
+
+    zona_invalida = f"' (use {', '.join(GERENTES)})"
+    problemas = _agregar(problemas, ~df["zona"].isin(GERENTES), "zona inválida: '" + df["zona"] + zona_invalida, "; ")
+    problemas = _agregar(
+        problemas, ~df["canal_ingreso"].isin(CANALES_INGRESO),
+        "canal_ingreso inválido: '" + df["canal_ingreso"] + "'", "; ",
+    )
+
+    # Un reclamo, una carta: el mismo N° GR en otra fila es un error desde la segunda vez
+    gr = df["gr_numero"]
+    repetido = (gr != "") & gr.duplicated()
+    if repetido.any():
+        primera = filas.groupby(gr).transform("first").astype(str)
+        problemas = _agregar(problemas, repetido, "N° GR repetido (ya está en la fila " + primera + ")", "; ")
+    return problemas
+
+
+def _registros(df):
+    """Filas como diccionarios solo con las celdas llenas (más rápido que to_dict y menos para enviar a los workers)"""
+    columnas = list(df.columns)
+    valores = [df[columna].tolist() for columna in columnas]
+    return [
+        {columna: valor for columna, valor in zip(columnas, fila) if valor}
+        for fila in zip(*valores)
+    ]
+
+
+def revisar_planilla(df):
+    """
+    Normaliza y valida toda la planilla sin generar nada.
+    Devuelve ([(número de fila, datos), ...] de las filas válidas, errores):
+    cada error es {"fila", "gr_numero", "tipo_carta", "etapa", "error"}.
+    """
+    df = normalizar_planilla(df)
+    # Número de fila tal como se ve en Excel (la fila 1 es el encabezado)
+    filas = pd.Series(range(2, len(df) + 2), index=df.index)
+    problemas = _problemas(df, filas)
+    con_error = problemas != ""
+
+    errores = pd.DataFrame({
+        "fila": filas[con_error],
+        "gr_numero": df["gr_numero"][con_error],
+        "tipo_carta": df["tipo_carta"][con_error],
+        "etapa": "revisión",
+        "error": problemas[con_error],
+    }).to_dict("records")
+    validas = list(zip(filas[~con_error].tolist(), _registros(df[~con_error])))
+    return validas, errores
+
+
+# ================= GENERACIÓN =================
+def generar_lote(df, progreso=None, procesos=None, tamano_bloque=None):
+    """
+    Genera una carta por fila, repartiendo el trabajo en 'procesos' workers
+    (ver cartas.procesos). Toda la planilla se revisa antes de generar
+    (revisar_planilla). Devuelve (bytes del .zip, reporte de errores por
+    fila, cantidad generada). 'progreso(hechas, total)' se llama después
+    de cada carta; si levanta una excepción el lote se corta ahí.
+    """
+    hoy = fecha_chile()
+    validas, errores = revisar_planilla(df)
+
+    por_fila = dict(validas)
+    total = len(validas)
+    generadas = 0
+    nombres_usados = set()
+    buffer = io.BytesIO()
+
+    # Los .docx ya vienen comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        resultados = generar_en_paralelo(validas, hoy, procesos=procesos, tamano_bloque=tamano_bloque)
+        try:
+            for hechas, (numero_fila, nombre, contenido, error) in enumerate(resultados, start=1):
+                if error is not None:
+                    errores.append({
+                        "fila": numero_fila, "gr_numero": por_fila[numero_fila]["gr_numero"],
+                        "tipo_carta": por_fila[numero_fila]["tipo_carta"], "etapa": "generación", "error": error,
+                    })
+                else:
+                    if nombre in nombres_usados:
+                        nombre = nombre.replace(".docx", f"_fila{numero_fila}.docx")
+                    nombres_usados.add(nombre)
+                    zf.writestr(nombre, contenido)
+                    generadas += 1
+                if progreso:
+                    progreso(hechas, total)
+        finally:
+            # Si 'progreso' corta el lote (cartas.trabajos al cancelar) no se envían más bloques
+            resultados.close()
+
+        errores.sort(key=lambda error: error["fila"])
+        if errores:
+            zf.writestr("errores.csv", reporte_errores(errores))
+
+    return buffer.getvalue(), errores, generadas
+
+
+def reporte_errores(errores):
+    """CSV con el reporte de errores (fila, gr_numero, tipo_carta, etapa, error)"""
+    columnas = ["fila", "gr_numero", "tipo_carta", "etapa", "error"]
+    return pd.DataFrame(errores, columns=columnas).to_csv(index=False).encode("utf-8-sig")
@@ -0,0 +1,208 @@
+"""
+Índice de marcadores por template.
+
+Cada template se escanea una sola vez para saber en qué párrafos aparece
+cada marcador ([Dirección], DGR N.º XXXXXXX /[202X], [24]...). Un párrafo
+se ubica por su parte (cuerpo, encabezado o pie) y su posición entre todos
+los <w:p> de esa parte, así que tablas anidadas y cuadros de texto entran
+en la misma pasada que el resto del texto.
+El resultado se guarda junto al template como '<tipo>.manifest.json' y se
+reutiliza mientras el .docx y el catálogo de marcadores no cambien, así que
+ni la app ni los procesos de lote vuelven a escanear al arrancar.
+
+Regenerar todos los índices e imprimir el reporte:
+
+    python -m cartas.manifiesto [tipo_carta ...]
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+
+from cartas.artefactos import escribir
+from cartas.plantillas import DIRECTORIO_TEMPLATES, firma_archivo, template_original
+from cartas.reemplazos import texto_parrafo
+from cartas.registro import MARCADORES_COMUNES, MARCADORES_POR_TIPO
+
+VERSION = 2
+
+# Partes con texto de la carta (las mismas que edita cartas.ooxml)
+PARTES_CON_TEXTO = re.compile(r"^/word/(document|header\d*|footer\d*)\.xml$")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P = _W + "p"
+_W_R = _W + "r"
+_W_T = _W + "t"
+
+# ================= CATÁLOGO DE MARCADORES =================
+# Textos de los templates que se reemplazan al generar la carta, tal como
+# los declara cartas.registro (los marcadores de sus reglas de reemplazo).
+TODOS_LOS_MARCADORES = frozenset(MARCADORES_COMUNES).union(*MARCADORES_POR_TIPO.values())
+
+# Si cambia el catálogo, los índices guardados quedan obsoletos
+_HASH_CATALOGO = hashlib.sha256(
+    json.dumps(sorted(TODOS_LOS_MARCADORES), ensure_ascii=False).encode("utf-8")
+).hexdigest()
+
+# ruta template -> (firma del archivo, manifiesto)
+_cache = {}
+
+
+def ruta_manifiesto(path_template):
+    """Ruta del índice guardado junto al template"""
+    return os.path.splitext(path_template)[0] + ".manifest.json"
+
+
+def _tipo_de(path_template):
+    return os.path.splitext(os.path.basename(path_template))[0]
+
+
+def partes_con_texto(doc):
+    """{nombre de la parte: elemento raíz} del cuerpo, encabezados y pies del documento"""
+    return {
+        str(parte.partname).lstrip("/"): parte._element
+        for parte in doc.part.package.iter_parts()
+        if PARTES_CON_TEXTO.match(parte.partname) and hasattr(parte, "_element")
+    }
+
+
+def recorrer_parrafos(doc):
+    """
+    Todos los <w:p> del documento, una pasada por parte: ((parte, índice), párrafo).
+    Incluye tablas (también anidadas), cuadros de texto, encabezados y pies.
+    """
+    for nombre, raiz in partes_con_texto(doc).items():
+        for i, p in enumerate(raiz.iter(_W_P)):
+            yield (nombre, i), p
+
+
+def construir_manifiesto(doc, tipo_carta, sha256):
+    """Escanea el documento y registra dónde aparece cada marcador del catálogo"""
+    parrafos = {}
+    divididos = set()
+
+    for ubicacion, p in recorrer_parrafos(doc):
+        texto = texto_parrafo(p)
+        if not texto:
+            continue
+        textos_runs = None
+        for marcador in TODOS_LOS_MARCADORES:
+            if marcador in texto:
+                parrafos.setdefault(marcador, []).append(list(ubicacion))
+                if textos_runs is None:
+                    textos_runs = ["".join(t.text or "" for t in r.iter(_W_T)) for r in p.iter(_W_R)]
+                if not any(marcador in t for t in textos_runs):
+                    divididos.add(marcador)
+
+    esperados = MARCADORES_COMUNES + MARCADORES_POR_TIPO.get(tipo_carta, ())
+    return {
+        "version": VERSION,
+        "catalogo": _HASH_CATALOGO,
+        "sha256": sha256,
+        "tipo_carta": tipo_carta,
+        "parrafos": parrafos,
+        "divididos": sorted(divididos),
+        "no_encontrados": [m for m in esperados if m not in parrafos],
+    }
+
+
+def _vigente(manifiesto, sha256):
+    return (
+        isinstance(manifiesto, dict)
+        and manifiesto.get("version") == VERSION
+        and manifiesto.get("catalogo") == _HASH_CATALOGO
+        and manifiesto.get("sha256") == sha256
+    )
+
+
+def cargar_manifiesto(path_template, forzar=False):
+    """
+    Devuelve el índice del template: primero desde memoria, luego desde
+    el archivo junto al template y, si falta o está obsoleto, escaneando.
+    """
+    firma = firma_archivo(path_template)
+    entrada = _cache.get(path_template)
+    if entrada is not None and entrada[0] == firma and not forzar:
+        return entrada[1]
+
+    with open(path_template, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    manifiesto = None
+    ruta = ruta_manifiesto(path_template)
+    if not forzar and os.path.exists(ruta):
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                manifiesto = json.load(f)
+        except (OSError, ValueError):
+            manifiesto = None
+
+    if not _vigente(manifiesto, sha256):
+        manifiesto = construir_manifiesto(template_original(path_template), _tipo_de(path_template), sha256)
+        try:
+            escribir(ruta, json.dumps(manifiesto, ensure_ascii=False, indent=1))
+        except OSError:
+            # Volumen de solo lectura: el índice queda solo en memoria
+            pass
+
+    _cache[path_template] = (firma, manifiesto)
+    return manifiesto
+
+
+def claves_presentes(manifiesto, claves):
+    """
+    Subconjunto de las claves que aparecen en el template.
+    Si alguna clave no está en el catálogo se devuelven todas.
+    """
+    if any(clave not in TODOS_LOS_MARCADORES for clave in claves):
+        return list(claves)
+    return [clave for clave in claves if clave in manifiesto["parrafos"]]
+
+
+def parrafos_afectados(doc, manifiesto, claves):
+    """
+    Elementos <w:p> del documento donde aparece alguna de las claves, en
+    orden. Si alguna clave no está en el catálogo se devuelven todos.
+    """
+    if any(clave not in TODOS_LOS_MARCADORES for clave in claves):
+        return [p for _, p in recorrer_parrafos(doc)]
+
+    ubicaciones = sorted({tuple(u) for clave in claves for u in manifiesto["parrafos"].get(clave, ())})
+    if not ubicaciones:
+        return []
+    partes = partes_con_texto(doc)
+    # Cada parte con marcadores se recorre una sola vez
+    por_parte = {}
+    afectados = []
+    for nombre, i in ubicaciones:
+        if nombre not in por_parte:
+            por_parte[nombre] = list(partes[nombre].iter(_W_P))
+        afectados.append(por_parte[nombre][i])
+    return afectados
+
+
+def reporte(manifiesto):
+    """Resumen legible del índice de un template"""
+    lineas = [
+        f"{manifiesto['tipo_carta']}: {len(manifiesto['parrafos'])} marcadores encontrados"
+    ]
+    if manifiesto["divididos"]:
+        lineas.append("  Divididos entre varios runs: " + ", ".join(manifiesto["divididos"]))
+    if manifiesto["no_encontrados"]:
+        lineas.append("  No encontrados en el template: " + ", ".join(manifiesto["no_encontrados"]))
+    return "\n".join(lineas)
+
+
+def main(argv=None):
+    tipos = argv if argv else [
+        _tipo_de(path) for path in sorted(glob.glob(os.path.join(DIRECTORIO_TEMPLATES, "*.docx")))
+    ]
+    for tipo in tipos:
+        path = os.path.join(DIRECTORIO_TEMPLATES, f"{tipo}.docx")
+        print(reporte(cargar_manifiesto(path, forzar=True)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,217 @@
+"""
+Tiempos de generación por tipo de carta y por etapa.
+
+Cada carta se mide por etapas con un Cronometro:
+
+    carga       abrir el template (desde la caché) y ubicar los marcadores
+    reemplazos  normalizar, validar y armar el diccionario de reemplazos
+    parrafos    pasada por los párrafos (cuerpo, tablas, cuadros de texto, encabezados y pies)
+    guardado    XML y zip del .docx
+    cache       la carta ya estaba generada (cartas.renders): en su lugar las etapas anteriores
+    anexo       tabla de datos adicionales, agregada al .docx ya generado
+    descarga    dejar la carta lista para descargar (caché, disco e índice)
+
+Por tipo de carta se guardan las últimas VENTANA mediciones de cada etapa
+(p50/p95/p99) y de resultados (tasa de error), más contadores acumulados.
+Se leen con resumen(), en formato de texto de Prometheus con prometheus(),
+o se reciben carta por carta registrando una función con agregar_sink().
+"""
+import math
+import threading
+import time
+from collections import deque
+
+VENTANA = 1000  # mediciones por tipo de carta y etapa
+
+# Puerto del endpoint /metrics de la app (None: no se levanta)
+PUERTO_METRICAS = None
+
+CUANTILES = (0.5, 0.95, 0.99)
+TIPO_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+# tipo_carta -> {"etapas": {etapa: deque}, "resultados": deque, "cartas": n, "errores": n,
+#                 "acumulado": {etapa: [segundos, mediciones]}}
+_tipos = {}
+_sinks = []
+_lock = threading.Lock()
+_servidor = None
+
+
+class Cronometro:
+    """Tiempos de las etapas de una carta; cada marcar() cierra la etapa en curso"""
+
+    def __init__(self, tipo_carta=""):
+        self.tipo_carta = tipo_carta
+        self.etapas = {}
+        self._ultimo = time.perf_counter()
+
+    def marcar(self, etapa):
+        ahora = time.perf_counter()
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + ahora - self._ultimo
+        self._ultimo = ahora
+
+    def registrar(self, ok=True):
+        registrar(self.tipo_carta, self.etapas, ok)
+
+
+def _entrada(tipo_carta):
+    entrada = _tipos.get(tipo_carta)
+    if entrada is None:
+        entrada = {"etapas": {}, "resultados": deque(maxlen=VENTANA), "cartas": 0, "errores": 0, "acumulado": {}}
+        _tipos[tipo_carta] = entrada
+    return entrada
+
+
+def registrar(tipo_carta, etapas, ok=True):
+    """Registra una carta: {etapa: segundos} y si se generó bien"""
+    etapas = {**etapas, "total": sum(etapas.values())}
+    with _lock:
+        entrada = _entrada(tipo_carta)
+        for etapa, segundos in etapas.items():
+            entrada["etapas"].setdefault(etapa, deque(maxlen=VENTANA)).append(segundos)
+            acumulado = entrada["acumulado"].setdefault(etapa, [0.0, 0])
+            acumulado[0] += segundos
+            acumulado[1] += 1
+        entrada["resultados"].append(ok)
+        entrada["cartas"] += 1
+        if not ok:
+            entrada["errores"] += 1
+        sinks = list(_sinks)
+
+    for sink in sinks:
+        try:
+            sink(tipo_carta, etapas, ok)
+        except Exception:
+            # Un sink con problemas no puede hacer fallar la carta
+            pass
+
+
+def agregar_sink(funcion):
+    """Llama a funcion(tipo_carta, {etapa: segundos}, ok) después de cada carta"""
+    with _lock:
+        if funcion not in _sinks:
+            _sinks.append(funcion)
+
+
+def quitar_sink(funcion):
+    with _lock:
+        if funcion in _sinks:
+            _sinks.remove(funcion)
+
+
+def _percentil(ordenados, q):
+    return ordenados[max(0, math.ceil(q * len(ordenados)) - 1)]
+
+
+def _cuantiles(muestras):
+    ordenados = sorted(muestras)
+    return {f"p{round(100 * q)}_ms": round(1000 * _percentil(ordenados, q), 2) for q in CUANTILES}
+
+
+def resumen():
+    """
+    Ventana actual por tipo de carta:
+    {tipo: {"cartas", "errores", "tasa_error", "etapas": {etapa: {"p50_ms", "p95_ms", "p99_ms", "n"}}}}
+    """
+    with _lock:
+        copia = {
+            tipo: (entrada["cartas"], entrada["errores"], list(entrada["resultados"]),
+                   {etapa: list(muestras) for etapa, muestras in entrada["etapas"].items()})
+            for tipo, entrada in _tipos.items()
+        }
+    salida = {}
+    for tipo, (cartas, errores, resultados, etapas) in copia.items():
+        salida[tipo] = {
+            "cartas": cartas,
+            "errores": errores,
+            "tasa_error": round(resultados.count(False) / len(resultados), 4) if resultados else 0.0,
+            "etapas": {etapa: {**_cuantiles(muestras), "n": len(muestras)} for etapa, muestras in etapas.items()},
+        }
+    return salida
+
+
+def total(etapa="total"):
+    """Cuantiles de una etapa con las ventanas de todos los tipos juntas (None sin datos)"""
+    with _lock:
+        muestras = [s for entrada in _tipos.values() for s in entrada["etapas"].get(etapa, ())]
+    return _cuantiles(muestras) if muestras else None
+
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus():
+    """Métricas en el formato de texto de Prometheus (0.0.4)"""
+    with _lock:
+        copia = {
+            tipo: (entrada["cartas"], entrada["errores"], {e: tuple(a) for e, a in entrada["acumulado"].items()},
+                   {etapa: list(muestras) for etapa, muestras in entrada["etapas"].items()})
+            for tipo, entrada in _tipos.items()
+        }
+    lineas = [
+        "# HELP cartas_generadas_total Cartas generadas (con o sin error).",
+        "# TYPE cartas_generadas_total counter",
+    ]
+    lineas += [f'cartas_generadas_total{{tipo_carta="{_etiqueta(tipo)}"}} {c[0]}' for tipo, c in copia.items()]
+    lineas += [
+        "# HELP cartas_errores_total Cartas que no se pudieron generar.",
+        "# TYPE cartas_errores_total counter",
+    ]
+    lineas += [f'cartas_errores_total{{tipo_carta="{_etiqueta(tipo)}"}} {c[1]}' for tipo, c in copia.items()]
+    lineas += [
+        f"# HELP cartas_etapa_segundos Tiempo por etapa (cuantiles de las últimas {VENTANA} cartas).",
+        "# TYPE cartas_etapa_segundos summary",
+    ]
+    for tipo, (_, _, acumulado, etapas) in copia.items():
+        for etapa, muestras in etapas.items():
+            etiquetas = f'tipo_carta="{_etiqueta(tipo)}",etapa="{_etiqueta(etapa)}"'
+            ordenados = sorted(muestras)
+            for q in CUANTILES:
+                lineas.append(f'cartas_etapa_segundos{{{etiquetas},quantile="{q}"}} {_percentil(ordenados, q):.6f}')
+            suma, mediciones = acumulado[etapa]
+            lineas.append(f"cartas_etapa_segundos_sum{{{etiquetas}}} {suma:.6f}")
+            lineas.append(f"cartas_etapa_segundos_count{{{etiquetas}}} {mediciones}")
+    return "\n".join(lineas) + "\n"
+
+
+def limpiar():
+    with _lock:
+        _tipos.clear()
+
+
+# ================= ENDPOINT /metrics =================
+def exponer(puerto=None, host="127.0.0.1"):
+    """
+    Levanta (una sola vez por proceso) un servidor con /metrics en un thread
+    aparte. Sin puerto ni PUERTO_METRICAS no hace nada.
+    """
+    global _servidor
+    puerto = puerto or PUERTO_METRICAS
+    if _servidor is not None or not puerto:
+        return _servidor
+
+    # http.server solo se importa si se expone el endpoint
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ManejadorMetricas(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            contenido = prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_PROMETHEUS)
+            self.send_header("Content-Length", str(len(contenido)))
+            self.end_headers()
+            self.wfile.write(contenido)
+
+        def log_message(self, formato, *args):
+            pass
+
+    with _lock:
+        if _servidor is None:
+            _servidor = ThreadingHTTPServer((host, puerto), ManejadorMetricas)
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name="metricas", daemon=True).start()
+    return _servidor
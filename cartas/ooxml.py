@@ -0,0 +1,203 @@
+"""
+Motor directo sobre el zip del .docx, sin el modelo de objetos de python-docx.
+
+El template se abre una sola vez: document.xml, los encabezados y los pies
+se parsean con lxml y se anotan los párrafos que tienen marcadores del
+catálogo. El resto de los miembros del zip (estilos, imágenes, fuentes...)
+se guarda tal como viene, ya comprimido, y se copia byte a byte a cada
+carta. Por carta solo se clonan y se vuelven a comprimir las partes que
+cambian.
+
+Los reemplazos son los mismos Reemplazador.en_runs() del motor python-docx,
+así que el resultado es el mismo. No cubre el modo "parrafo": para eso
+cartas.generador usa python-docx.
+"""
+import copy
+import re
+import struct
+import zipfile
+import zlib
+
+from lxml import etree
+
+from cartas.manifiesto import TODOS_LOS_MARCADORES
+from cartas.plantillas import LocksPorRuta, firma_archivo
+from cartas.reemplazos import compilar_patron, compilar_reemplazos, texto_parrafo
+
+# Partes donde se buscan marcadores
+PARTES_EDITABLES = re.compile(r"^word/(document|header\d*|footer\d*)\.xml$")
+
+_W_P = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+
+_CABECERA_LOCAL = struct.Struct("<4s5H3L2H")
+_CABECERA_CENTRAL = struct.Struct("<4s6H3L5H2L")
+_FIN_DIRECTORIO = struct.Struct("<4s4H2LH")
+
+# Bits de flag que se conservan: opciones de deflate (1, 2) y nombre UTF-8 (11)
+_FLAGS_CONSERVADOS = 0x0806
+
+# ruta -> (firma, miembros, partes)
+#   miembros: [(nombre, método, crc, bytes comprimidos, tamaño, hora DOS, fecha DOS, flags)]
+#   partes: {nombre: (raíz lxml, índices de párrafos con marcadores)}
+_cache = {}
+_lock_ruta = LocksPorRuta()
+
+
+def leer_miembros(path):
+    """
+    Miembros del zip con sus datos comprimidos, sin descomprimirlos, y el
+    XML de las partes editables: ([miembro, ...], {nombre: bytes}).
+    """
+    miembros = []
+    textos = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            f.seek(info.header_offset)
+            cabecera = _CABECERA_LOCAL.unpack(f.read(_CABECERA_LOCAL.size))
+            if cabecera[0] != b"PK\x03\x04":
+                raise zipfile.BadZipFile(f"Cabecera inválida en {info.filename}")
+            f.seek(info.header_offset + _CABECERA_LOCAL.size + cabecera[9] + cabecera[10])
+            comprimidos = f.read(info.compress_size)
+            hora = (info.date_time[3] << 11) | (info.date_time[4] << 5) | (info.date_time[5] // 2)
+            fecha = ((info.date_time[0] - 1980) << 9) | (info.date_time[1] << 5) | info.date_time[2]
+            miembros.append((
+                info.filename, info.compress_type, info.CRC, comprimidos,
+                info.file_size, hora, fecha, info.flag_bits & _FLAGS_CONSERVADOS,
+            ))
+            if PARTES_EDITABLES.match(info.filename):
+                textos[info.filename] = zf.read(info)
+    return miembros, textos
+
+
+def _cargar(path):
+    firma = firma_archivo(path)
+    entrada = _cache.get(path)
+    if entrada is not None and entrada[0] == firma:
+        return entrada
+    with _lock_ruta(path):
+        entrada = _cache.get(path)
+        if entrada is None or entrada[0] != firma:
+            miembros, textos = leer_miembros(path)
+            patron = compilar_patron(TODOS_LOS_MARCADORES)
+            partes = {}
+            for nombre, contenido in textos.items():
+                raiz = etree.fromstring(contenido)
+                indices = [
+                    i for i, p in enumerate(raiz.iter(_W_P))
+                    if patron.search(texto_parrafo(p))
+                ]
+                partes[nombre] = (raiz, indices)
+            entrada = (firma, miembros, partes)
+            _cache[path] = entrada
+    return entrada
+
+
+def precargar(path):
+    """Lee y prepara el template (por ejemplo al iniciar un worker)"""
+    _cargar(path)
+
+
+def _comprimir(contenido):
+    compresor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compresor.compress(contenido) + compresor.flush()
+
+
+def _escribir_zip(miembros):
+    """Arma el zip con datos ya comprimidos (sin pasar por zipfile)"""
+    salida = bytearray()
+    central = bytearray()
+    for nombre, metodo, crc, comprimidos, tamano, hora, fecha, flags in miembros:
+        nombre_bytes = nombre.encode("utf-8" if flags & 0x800 else "cp437")
+        desplazamiento = len(salida)
+        salida += _CABECERA_LOCAL.pack(
+            b"PK\x03\x04", 20, flags, metodo, hora, fecha, crc, len(comprimidos), tamano, len(nombre_bytes), 0
+        )
+        salida += nombre_bytes
+        salida += comprimidos
+        central += _CABECERA_CENTRAL.pack(
+            b"PK\x01\x02", 20, 20, flags, metodo, hora, fecha, crc, len(comprimidos), tamano,
+            len(nombre_bytes), 0, 0, 0, 0, 0, desplazamiento,
+        )
+        central += nombre_bytes
+    inicio_central = len(salida)
+    salida += central
+    salida += _FIN_DIRECTORIO.pack(
+        b"PK\x05\x06", 0, 0, len(miembros), len(miembros), len(central), inicio_central, 0
+    )
+    return bytes(salida)
+
+
+def plantilla(path):
+    """(miembros del zip, partes editables parseadas) del template, desde la caché"""
+    _, miembros, partes = _cargar(path)
+    return miembros, partes
+
+
+def aplicar(partes, reemplazos):
+    """
+    Clona las partes con marcadores y les aplica los reemplazos.
+    Devuelve {nombre: raíz editada} solo de las partes que cambiaron.
+    """
+    aplicar_reemplazos = compilar_reemplazos(reemplazos)
+    # Con claves fuera del catálogo no sirve el índice: se revisan todos los párrafos
+    todos = any(clave not in TODOS_LOS_MARCADORES for clave in reemplazos)
+
+    editadas = {}
+    for nombre, (raiz, indices) in partes.items():
+        if not indices and not todos:
+            continue
+        copia = copy.deepcopy(raiz)
+        parrafos = list(copia.iter(_W_P))
+        cambios = False
+        for i in (range(len(parrafos)) if todos else indices):
+            cambios = aplicar_reemplazos.en_runs(parrafos[i]) or cambios
+        if cambios:
+            editadas[nombre] = copia
+    return editadas
+
+
+def serializar(raiz):
+    """XML de una parte, con la misma declaración que escribe python-docx"""
+    return etree.tostring(raiz, encoding="UTF-8", xml_declaration=True, standalone=True)
+
+
+def armar_docx(miembros, nuevos):
+    """
+    .docx con los miembros del template copiados byte a byte, salvo los
+    de 'nuevos' ({nombre: contenido XML}) que se comprimen de nuevo.
+    """
+    salida = []
+    for miembro in miembros:
+        contenido = nuevos.get(miembro[0])
+        if contenido is None:
+            salida.append(miembro)
+        else:
+            nombre, _, _, _, _, hora, fecha, flags = miembro
+            salida.append((
+                nombre, zipfile.ZIP_DEFLATED, zlib.crc32(contenido), _comprimir(contenido),
+                len(contenido), hora, fecha, flags & 0x800,
+            ))
+    return _escribir_zip(salida)
+
+
+def renderizar(template_path, reemplazos, marcar=None):
+    """
+    Aplica los reemplazos al template y devuelve el .docx en bytes.
+    'marcar(etapa)' se llama al terminar cada etapa (ver cartas.metricas).
+    """
+    marcar = marcar or _sin_marca
+    miembros, partes = plantilla(template_path)
+    marcar("carga")
+    editadas = aplicar(partes, reemplazos)
+    marcar("parrafos")
+    contenido = armar_docx(miembros, {nombre: serializar(raiz) for nombre, raiz in editadas.items()})
+    marcar("guardado")
+    return contenido
+
+
+def _sin_marca(etapa):
+    pass
+
+
+def limpiar_cache():
+    _cache.clear()
@@ -0,0 +1,219 @@
+"""
+Planes compilados de los templates: la vía más rápida para lotes y el servicio.
+
+Un plan es el XML de cada parte editable cortado en trozos fijos y huecos
+con nombre (el marcador del catálogo que va en cada hueco). Generar una
+carta es unir los trozos con los valores escapados y armar el zip: no se
+parsea ni se busca nada.
+
+    python -m cartas planes                  # compila todos los templates
+    python -m cartas planes normal_avance
+
+El plan del juego completo de marcadores de cada tipo de carta se guarda
+en templates/<tipo>.plan.json. Si falta o no corresponde al template
+(otro sha256, otra versión) se vuelve a compilar. Una carta con otro juego
+de claves (campos opcionales vacíos) compila su propio plan en memoria la
+primera vez. Cuando no se puede usar un plan la carta se genera con
+cartas.ooxml.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+
+from cartas import ooxml
+from cartas.artefactos import escribir
+from cartas.manifiesto import MARCADORES_COMUNES, MARCADORES_POR_TIPO
+from cartas.plantillas import DIRECTORIO_TEMPLATES, LocksPorRuta, firma_archivo
+
+VERSION = 1
+
+# Planes en memoria por template (juegos de claves distintos); más allá se usa cartas.ooxml
+MAX_PLANES = 32
+
+# Marcas de hueco: caracteres de uso privado que no aparecen en los templates
+_INICIO = "\ue000"
+_FIN = "\ue001"
+_HUECO = re.compile(_INICIO + r"(\d+)" + _FIN)
+
+# Valores que no se pueden pegar tal cual en el XML (controles inválidos o las marcas)
+_NO_PLANIFICABLE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ue000\ue001\ufffe\uffff]")
+
+_W_T = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# ruta -> (firma, sha256, miembros del zip, {frozenset(claves): plan})
+_cache = {}
+# Compilar el plan de un template no frena las cartas de los demás
+_lock_ruta = LocksPorRuta()
+
+
+def ruta_plan(path_template):
+    """Ruta del plan guardado junto al template"""
+    return os.path.splitext(path_template)[0] + ".plan.json"
+
+
+def _tipo_de(path_template):
+    return os.path.splitext(os.path.basename(path_template))[0]
+
+
+def claves_completas(tipo_carta):
+    """Marcadores del catálogo para un tipo de carta (el plan que se guarda en disco)"""
+    return frozenset(MARCADORES_COMUNES).union(MARCADORES_POR_TIPO.get(tipo_carta, ()))
+
+
+def compilar(path_template, claves):
+    """
+    Plan del template para un juego de claves, o None si el template ya
+    contiene las marcas de hueco.
+    """
+    claves = sorted(claves)
+    _, partes = ooxml.plantilla(path_template)
+    if any(_INICIO in ooxml.serializar(raiz).decode("utf-8") for raiz, _ in partes.values()):
+        return None
+
+    # El mismo reemplazo por runs de cartas.ooxml, con una marca numerada en vez del valor
+    marcas = {clave: f"{_INICIO}{i}{_FIN}" for i, clave in enumerate(claves)}
+    compiladas = {}
+    for nombre, raiz in ooxml.aplicar(partes, marcas).items():
+        for t in raiz.iter(_W_T):
+            # El valor puede empezar o terminar en espacio: se conserva siempre
+            if t.text and _INICIO in t.text:
+                t.set(_XML_SPACE, "preserve")
+        cortes = _HUECO.split(ooxml.serializar(raiz).decode("utf-8"))
+        compiladas[nombre] = {
+            "trozos": cortes[0::2],
+            "huecos": [claves[int(i)] for i in cortes[1::2]],
+        }
+    return {"version": VERSION, "claves": claves, "partes": compiladas}
+
+
+def _leer_guardado(path_template, sha256):
+    try:
+        with open(ruta_plan(path_template), encoding="utf-8") as f:
+            plan = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(plan, dict) or plan.get("version") != VERSION or plan.get("sha256") != sha256:
+        return None
+    return plan
+
+
+def _guardar(path_template, sha256, plan):
+    try:
+        # Los workers que arrancan a la vez leen el plan anterior o el nuevo, nunca uno a medias
+        escribir(ruta_plan(path_template), json.dumps(
+            {**plan, "sha256": sha256, "tipo_carta": _tipo_de(path_template)}, ensure_ascii=False
+        ))
+    except OSError:
+        # Volumen de solo lectura: el plan queda solo en memoria
+        pass
+
+
+def _entrada(path_template):
+    firma = firma_archivo(path_template)
+    entrada = _cache.get(path_template)
+    if entrada is None or entrada[0] != firma:
+        with open(path_template, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        miembros, _ = ooxml.leer_miembros(path_template)
+        planes = {}
+        guardado = _leer_guardado(path_template, sha256)
+        if guardado is not None:
+            planes[frozenset(guardado["claves"])] = guardado
+        entrada = (firma, sha256, miembros, planes)
+        _cache[path_template] = entrada
+    return entrada
+
+
+def obtener_plan(path_template, claves):
+    """(miembros del zip, plan) para el juego de claves, o None si no hay plan posible"""
+    juego = frozenset(claves)
+    # Lo habitual: el plan ya está compilado y se lee sin tomar el lock
+    entrada = _cache.get(path_template)
+    if entrada is not None and juego in entrada[3] and entrada[0] == firma_archivo(path_template):
+        plan = entrada[3][juego]
+        return None if plan is None else (entrada[2], plan)
+
+    with _lock_ruta(path_template):
+        _, sha256, miembros, planes = _entrada(path_template)
+        if juego in planes:
+            plan = planes[juego]
+        elif len(planes) >= MAX_PLANES:
+            return None
+        else:
+            plan = compilar(path_template, juego)
+            planes[juego] = plan
+            if plan is not None and juego == claves_completas(_tipo_de(path_template)):
+                _guardar(path_template, sha256, plan)
+    return None if plan is None else (miembros, plan)
+
+
+def precargar(path_template):
+    """Carga (o compila) el plan completo del template, por ejemplo al iniciar un worker"""
+    obtener_plan(path_template, claves_completas(_tipo_de(path_template)))
+
+
+def _escapar(valor):
+    # Igual que lxml al serializar el texto de un elemento
+    return valor.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\r", "&#13;")
+
+
+def renderizar(path_template, reemplazos, marcar=None):
+    """
+    Genera el .docx en bytes desde el plan; sin plan usa cartas.ooxml.
+    'marcar(etapa)' se llama al terminar cada etapa (ver cartas.metricas).
+    """
+    valores = {clave: str(valor) for clave, valor in reemplazos.items()}
+    obtenido = None
+    if not any(_NO_PLANIFICABLE.search(valor) for valor in valores.values()):
+        obtenido = obtener_plan(path_template, valores)
+    if obtenido is None:
+        return ooxml.renderizar(path_template, reemplazos, marcar)
+
+    marcar = marcar or _sin_marca
+    marcar("carga")
+    miembros, plan = obtenido
+    nuevos = rellenar(plan, valores)
+    marcar("parrafos")
+    contenido = ooxml.armar_docx(miembros, nuevos)
+    marcar("guardado")
+    return contenido
+
+
+def _sin_marca(etapa):
+    pass
+
+
+def rellenar(plan, valores):
+    """XML de cada parte del plan con los valores (texto) en sus huecos: {nombre: bytes}"""
+    nuevos = {}
+    for nombre, parte in plan["partes"].items():
+        trozos = parte["trozos"]
+        unidos = [None] * (2 * len(trozos) - 1)
+        unidos[0::2] = trozos
+        unidos[1::2] = [_escapar(valores[clave]) for clave in parte["huecos"]]
+        nuevos[nombre] = "".join(unidos).encode("utf-8")
+    return nuevos
+
+
+def limpiar_cache():
+    _cache.clear()
+
+
+def main(argv=None):
+    tipos = argv if argv else [
+        _tipo_de(path) for path in sorted(glob.glob(os.path.join(DIRECTORIO_TEMPLATES, "*.docx")))
+    ]
+    for tipo in tipos:
+        path = os.path.join(DIRECTORIO_TEMPLATES, f"{tipo}.docx")
+        with open(path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        plan = compilar(path, claves_completas(tipo))
+        if plan is None:
+            print(f"{tipo}: el template contiene marcas reservadas, se generará con cartas.ooxml")
+            continue
+        _guardar(path, sha256, plan)
+        huecos = sum(len(parte["huecos"]) for parte in plan["partes"].values())
+        print(f"{tipo}: {huecos} huecos en {len(plan['partes'])} partes → {ruta_plan(path)}")
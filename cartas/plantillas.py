@@ -0,0 +1,141 @@
+"""
+Caché de templates .docx compartida por todo el proceso.
+
+Cada template se parsea una sola vez y cada carta trabaja sobre un clon.
+La entrada se descarta cuando cambia la fecha de modificación o el tamaño
+del archivo, así que editar un template en 'templates/' basta para que
+la siguiente carta lo use.
+
+Las sesiones de Streamlit y los trabajos corren en threads del mismo
+proceso: leer la caché no toma ningún lock, y cargar un template toma
+solo el lock de ese archivo (LocksPorRuta), para que lo parsee una sola
+sesión sin frenar a las que usan otros templates.
+"""
+import copy
+import hashlib
+import os
+import threading
+
+DIRECTORIO_TEMPLATES = "templates"
+
+# Partes que el generador solo lee: los clones las comparten con el original
+# en vez de copiarlas (estilos y numeración son lo más pesado del paquete)
+PARTES_COMPARTIDAS = (
+    "/docProps/core.xml",
+    "/word/settings.xml",
+    "/word/styles.xml",
+    "/word/numbering.xml",
+)
+
+# ruta -> (firma del archivo, Document original, elementos compartidos)
+_cache = {}
+
+# ruta -> (firma del archivo, sha256 del contenido)
+_hashes = {}
+
+# (mtime de la carpeta, cantidad de templates)
+_conteo = (None, 0)
+
+
+class LocksPorRuta:
+    """Un lock por archivo, creado la primera vez que se pide"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+
+_lock_ruta = LocksPorRuta()
+_lock_hash = LocksPorRuta()
+
+
+def ruta_template(tipo_carta):
+    """Ruta del template .docx de un tipo de carta"""
+    return os.path.join(DIRECTORIO_TEMPLATES, f"{tipo_carta}.docx")
+
+
+def firma_archivo(path):
+    """Firma barata (mtime, tamaño) para detectar cambios en un archivo"""
+    estado = os.stat(path)
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def hash_template(path):
+    """sha256 del contenido del template (se recalcula solo si cambia la firma)"""
+    firma = firma_archivo(path)
+    entrada = _hashes.get(path)
+    if entrada is None or entrada[0] != firma:
+        with _lock_hash(path):
+            entrada = _hashes.get(path)
+            if entrada is None or entrada[0] != firma:
+                with open(path, "rb") as f:
+                    entrada = (firma, hashlib.sha256(f.read()).hexdigest())
+                _hashes[path] = entrada
+    return entrada[1]
+
+
+def _cargar(path):
+    firma = firma_archivo(path)
+    entrada = _cache.get(path)
+    if entrada is not None and entrada[0] == firma:
+        return entrada
+    with _lock_ruta(path):
+        # Otra sesión pudo cargarlo mientras se esperaba el lock
+        entrada = _cache.get(path)
+        if entrada is None or entrada[0] != firma:
+            # python-docx se importa con el primer template, no al arrancar la app
+            from docx import Document
+
+            doc = Document(path)
+            compartidos = [
+                parte._element
+                for parte in doc.part.package.iter_parts()
+                if parte.partname in PARTES_COMPARTIDAS and hasattr(parte, "_element")
+            ]
+            entrada = (firma, doc, compartidos)
+            _cache[path] = entrada
+    return entrada
+
+
+def template_original(path):
+    """
+    Devuelve el Document cacheado del template, SOLO para lectura.
+    Para generar una carta usar clonar_template().
+    """
+    return _cargar(path)[1]
+
+
+def clonar_template(path):
+    """
+    Devuelve una copia editable del template.
+    El original parseado queda en caché y nunca se modifica.
+    """
+    _, doc, compartidos = _cargar(path)
+    memo = {id(elemento): elemento for elemento in compartidos}
+    copia = copy.deepcopy(doc, memo)
+    # Si el original ya había resuelto su cuerpo (al escanear el manifiesto), la copia
+    # heredaría un cuerpo suelto, fuera de su propio XML: se vuelve a resolver al usarlo
+    copia._Document__body = None
+    return copia
+
+
+def contar_templates():
+    """
+    Cantidad de templates .docx. Solo se vuelve a listar la carpeta
+    cuando cambia su fecha de modificación (agregar, borrar o renombrar).
+    """
+    global _conteo
+    mtime = os.stat(DIRECTORIO_TEMPLATES).st_mtime_ns
+    if _conteo[0] != mtime:
+        _conteo = (mtime, sum(1 for f in os.listdir(DIRECTORIO_TEMPLATES) if f.endswith(".docx")))
+    return _conteo[1]
+
+
+def limpiar_cache():
+    """Descarta todos los templates parseados"""
+    _cache.clear()
+    _hashes.clear()
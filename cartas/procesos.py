@@ -0,0 +1,193 @@
+"""
+Generación de cartas en paralelo con un pool de procesos.
+
+python-docx es Python puro y retiene el GIL mientras parsea y guarda,
+así que un solo proceso usa un solo núcleo. El lote se reparte en
+bloques de filas entre varios procesos; cada worker parsea los templates
+una sola vez al arrancar (caché de cartas.plantillas) y los resultados
+vuelven en el mismo orden de las filas.
+
+El pool se crea la primera vez y lo comparten todos los lotes: cada lote
+tiene a lo más 'procesos' bloques enviados a la vez, así que dos lotes con
+distinta cantidad de procesos pueden correr juntos. El pool solo crece
+(se recrea más grande) cuando ningún lote lo está usando.
+"""
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cartas import metricas, ooxml, planes
+from cartas.generador import MOTOR, generar_carta, nombre_archivo
+from cartas.manifiesto import cargar_manifiesto
+from cartas.plantillas import ruta_template, template_original
+from cartas.registro import TIPOS_CARTA
+
+# Valores por defecto; generar_en_paralelo() acepta otros por llamada
+PROCESOS = os.cpu_count() or 1
+TAMANO_BLOQUE = 20
+
+_pool = None
+_procesos_pool = 0
+_lotes_en_curso = 0
+_lock_pool = threading.Lock()
+
+
+def _iniciar_worker():
+    """Precarga de templates e índices: se hace una vez por worker, no por carta"""
+    for tipo_carta in TIPOS_CARTA:
+        path = ruta_template(tipo_carta)
+        if os.path.exists(path):
+            if MOTOR == "plan":
+                planes.precargar(path)
+            elif MOTOR == "ooxml":
+                ooxml.precargar(path)
+            else:
+                template_original(path)
+                cargar_manifiesto(path)
+
+
+def generar_una(numero_fila, datos, hoy, cronometro=None):
+    """
+    Genera la carta de una fila ya validada y normalizada (por
+    cartas.lote.revisar_planilla o cartas.servicio): no se vuelve a
+    normalizar en el worker.
+    Devuelve (numero_fila, nombre de archivo, bytes del .docx, error).
+    """
+    try:
+        tipo_carta = datos["tipo_carta"]
+        contenido = generar_carta(tipo_carta, datos, hoy=hoy, cronometro=cronometro, normalizado=True)
+        return numero_fila, nombre_archivo(tipo_carta, datos["gr_numero"], hoy), contenido, None
+    except Exception as e:
+        return numero_fila, None, None, str(e)
+
+
+def generar_medida(numero_fila, datos, hoy):
+    """
+    generar_una() sin registrar la medición en el worker: devuelve
+    (resultado, (tipo_carta, {etapa: segundos}, ok)) para registrarla con
+    metricas.registrar() en el proceso que atiende.
+    """
+    cronometro = metricas.Cronometro(datos.get("tipo_carta", ""))
+    resultado = generar_una(numero_fila, datos, hoy, cronometro)
+    return resultado, (cronometro.tipo_carta, cronometro.etapas, resultado[3] is None)
+
+
+def _generar_bloque(bloque, hoy):
+    return [generar_medida(numero_fila, datos, hoy) for numero_fila, datos in bloque]
+
+
+def _entregar(medidos):
+    for resultado, medicion in medidos:
+        metricas.registrar(*medicion)
+        yield resultado
+
+
+def obtener_pool(procesos=None):
+    """
+    Pool compartido con al menos 'procesos' workers. Si hace falta uno más
+    grande se recrea, pero solo con ningún lote en curso: si no, se sigue
+    usando el actual. Los workers se inician a medida que llegan tareas;
+    ver calentar_pool().
+    """
+    with _lock_pool:
+        return _asegurar_pool(procesos)
+
+
+def _asegurar_pool(procesos):
+    global _pool, _procesos_pool
+    procesos = max(1, int(procesos or PROCESOS))
+    if _pool is None or (_procesos_pool < procesos and _lotes_en_curso == 0):
+        if _pool is not None:
+            # Sin cancelar: lo ya enviado (por ejemplo desde cartas.servicio) termina igual
+            _pool.shutdown(wait=False)
+        # "spawn": la app corre en varios threads y fork no es seguro ahí
+        _pool = ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_worker,
+        )
+        _procesos_pool = procesos
+    return _pool
+
+
+def calentar_pool(procesos=None):
+    """Arranca todos los workers del pool para que la primera carta no espere la precarga"""
+    procesos = max(1, int(procesos or PROCESOS))
+    pool = obtener_pool(procesos)
+    for futuro in [pool.submit(os.getpid) for _ in range(procesos)]:
+        futuro.result()
+    return pool
+
+
+def _tomar_pool(procesos):
+    global _lotes_en_curso
+    with _lock_pool:
+        pool = _asegurar_pool(procesos)
+        _lotes_en_curso += 1
+    return pool
+
+
+def _soltar_pool():
+    global _lotes_en_curso
+    with _lock_pool:
+        _lotes_en_curso -= 1
+
+
+def _en_orden(pool, bloques, hoy, en_vuelo):
+    """Resultados de los bloques en orden, con a lo más 'en_vuelo' bloques enviados al pool"""
+    pendientes = deque()
+    try:
+        for bloque in bloques:
+            pendientes.append(pool.submit(_generar_bloque, bloque, hoy))
+            if len(pendientes) >= en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+    finally:
+        # Lote abandonado o con error: lo que no empezó no se genera
+        for futuro in pendientes:
+            futuro.cancel()
+
+
+def _descartar_pool(esperar=False):
+    global _pool
+    with _lock_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=esperar, cancel_futures=True)
+        _pool = None
+
+
+def cerrar_pool(esperar=False):
+    """Termina los workers (por ejemplo al salir de un script); con 'esperar' hasta que salgan"""
+    _descartar_pool(esperar)
+
+
+def generar_en_paralelo(filas, hoy, procesos=None, tamano_bloque=None):
+    """
+    Genera las cartas de 'filas' (lista de (numero_fila, datos)) y entrega
+    los resultados de generar_una() en el mismo orden de entrada.
+    Con un solo proceso o un solo bloque se genera en este mismo proceso.
+    """
+    procesos = max(1, int(procesos or PROCESOS))
+    tamano_bloque = max(1, int(tamano_bloque or TAMANO_BLOQUE))
+    bloques = [filas[i:i + tamano_bloque] for i in range(0, len(filas), tamano_bloque)]
+
+    if procesos == 1 or len(bloques) <= 1:
+        for bloque in bloques:
+            yield from _entregar(_generar_bloque(bloque, hoy))
+        return
+
+    pool = _tomar_pool(procesos)
+    try:
+        # Las mediciones vuelven con los resultados y se registran en este proceso
+        for medidos in _en_orden(pool, bloques, hoy, procesos):
+            yield from _entregar(medidos)
+    except BrokenProcessPool:
+        # Un worker murió: el próximo lote arranca un pool nuevo
+        _descartar_pool()
+        raise
+    finally:
+        _soltar_pool()
@@ -0,0 +1,162 @@
+"""
+Sustitución de marcadores en una sola pasada.
+
+Todas las claves de 'reemplazos' se compilan en una única expresión
+regular (alternancia ordenada de la clave más larga a la más corta), así
+que cada texto se recorre una sola vez de izquierda a derecha con
+semántica "la coincidencia más a la izquierda y, entre ellas, la más
+larga". Un valor ya insertado nunca vuelve a ser reemplazado por otra clave.
+
+Hay dos formas de aplicar el resultado a un párrafo:
+- Reemplazador(texto): devuelve el texto nuevo (el llamador reconstruye el párrafo).
+- Reemplazador.en_runs(parrafo): edita solo los <w:t> que contienen el
+  marcador y conserva el formato que trae el template en cada run.
+"""
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+from lxml import etree
+
+# Nombres calificados como los de docx.oxml.ns.qn(), sin importar python-docx.
+# Las búsquedas usan lxml directo: sirven para los elementos de python-docx
+# y para los de cartas.ooxml por igual.
+_NS_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W = "{%s}" % _NS_W
+_W_T = _W + "t"
+_W_BR = _W + "br"
+_W_RPR = _W + "rPr"
+_W_HIGHLIGHT = _W + "highlight"
+
+_RUNS = etree.XPath("./w:r | ./w:hyperlink/w:r", namespaces={"w": _NS_W})
+_CONTENIDO_RUN = etree.XPath("w:br | w:cr | w:noBreakHyphen | w:ptab | w:t | w:tab", namespaces={"w": _NS_W})
+
+# Texto equivalente de lo que no es <w:t> (igual que str() en python-docx)
+_TEXTO_ESPECIAL = {_W + "cr": "\n", _W + "noBreakHyphen": "-", _W + "ptab": "\t", _W + "tab": "\t"}
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+
+@lru_cache(maxsize=512)
+def _patron(claves):
+    ordenadas = sorted(claves, key=lambda clave: (-len(clave), clave))
+    return re.compile("|".join(re.escape(clave) for clave in ordenadas))
+
+
+def compilar_patron(claves):
+    """
+    Expresión regular que reconoce cualquiera de las claves.
+    Se compila una vez por conjunto de claves y queda en caché.
+    """
+    return _patron(frozenset(claves))
+
+
+def _segmentos(p):
+    """
+    Texto del párrafo dividido en segmentos (elemento <w:t> o None, texto).
+    Tabs y saltos de línea aportan su carácter pero no son editables;
+    el texto unido es igual a paragraph.text.
+    """
+    segmentos = []
+    for r in _RUNS(p):
+        for hijo in _CONTENIDO_RUN(r):
+            if hijo.tag == _W_T:
+                segmentos.append((hijo, hijo.text or ""))
+            elif hijo.tag == _W_BR:
+                # Los saltos de página o columna no aportan texto
+                segmentos.append((None, "\n" if hijo.get(_W + "type", "textWrapping") == "textWrapping" else ""))
+            else:
+                segmentos.append((None, _TEXTO_ESPECIAL[hijo.tag]))
+    return segmentos
+
+
+def texto_parrafo(p):
+    """Texto de un <w:p> (igual a paragraph.text)"""
+    return "".join(texto for _, texto in _segmentos(p))
+
+
+def _asignar_texto(t, texto):
+    t.text = texto
+    if texto != texto.strip():
+        t.set(_XML_SPACE, "preserve")
+
+
+def _quitar_resaltado(t):
+    # El resaltado marca el campo a completar en el template, no es formato de la carta
+    rpr = t.getparent().find(_W_RPR)
+    if rpr is not None:
+        for resaltado in rpr.findall(_W_HIGHLIGHT):
+            rpr.remove(resaltado)
+
+
+class Reemplazador:
+    """Reemplazos compilados para una carta"""
+
+    def __init__(self, reemplazos):
+        self.valores = {clave: str(valor) for clave, valor in reemplazos.items()}
+        self.patron = compilar_patron(self.valores) if self.valores else None
+
+    def _sustituir(self, coincidencia):
+        return self.valores[coincidencia.group(0)]
+
+    def __call__(self, texto):
+        if self.patron is None:
+            return texto
+        return self.patron.sub(self._sustituir, texto)
+
+    def en_runs(self, parrafo):
+        """
+        Reemplaza dentro de los runs del párrafo (Paragraph de python-docx
+        o elemento <w:p>) sin reconstruirlo.
+        El valor queda en el run donde empieza el marcador (con su formato);
+        el resto del marcador se borra de los runs siguientes.
+        Devuelve True si hubo algún cambio.
+        """
+        if self.patron is None:
+            return False
+
+        segmentos = _segmentos(getattr(parrafo, "_p", parrafo))
+        textos = [texto for _, texto in segmentos]
+        coincidencias = list(self.patron.finditer("".join(textos)))
+        if not coincidencias:
+            return False
+
+        inicios = []
+        posicion = 0
+        for texto in textos:
+            inicios.append(posicion)
+            posicion += len(texto)
+
+        nuevos = list(textos)
+        receptores = set()
+        # De derecha a izquierda: los offsets de las coincidencias anteriores siguen válidos
+        for coincidencia in reversed(coincidencias):
+            inicio, fin = coincidencia.span()
+            a = bisect_right(inicios, inicio) - 1
+            b = bisect_right(inicios, fin - 1) - 1
+            if any(segmentos[k][0] is None for k in range(a, b + 1)):
+                # El marcador cruza un tab o salto de línea: se deja como está
+                continue
+            valor = self.valores[coincidencia.group(0)]
+            if a == b:
+                nuevos[a] = nuevos[a][:inicio - inicios[a]] + valor + nuevos[a][fin - inicios[a]:]
+            else:
+                nuevos[a] = nuevos[a][:inicio - inicios[a]] + valor
+                for k in range(a + 1, b):
+                    nuevos[k] = ""
+                nuevos[b] = nuevos[b][fin - inicios[b]:]
+            receptores.add(a)
+
+        for (t, texto), nuevo in zip(segmentos, nuevos):
+            if nuevo != texto:
+                _asignar_texto(t, nuevo)
+        for k in receptores:
+            _quitar_resaltado(segmentos[k][0])
+        return True
+
+
+def compilar_reemplazos(reemplazos):
+    """
+    Devuelve un Reemplazador: aplicar(texto) sustituye todas las claves
+    en una pasada y aplicar.en_runs(parrafo) edita el párrafo en el lugar.
+    """
+    return Reemplazador(reemplazos)
@@ -0,0 +1,544 @@
+"""
+Registro de los tipos de carta: un solo lugar con los campos, el formulario
+y los reemplazos de cada carta.
+
+Cada entrada de CARTAS declara:
+
+    categoria, nombre   dónde y cómo aparece en el selector de la app
+    formulario          título del expander y si parte abierto (None: sin campos propios)
+    secciones           bloques del formulario: título, subtítulo, columnas de campos, nota y texto
+    campos              etiqueta, placeholder, ayuda, valor inicial, opciones y formato de cada campo
+    reemplazos          (marcadores, plantilla, opciones): el texto de la plantilla va en cada marcador
+
+Las plantillas usan los nombres de los campos entre llaves, con un filtro
+opcional ("{monto_factura:kwh}"), y también los valores derivados de
+DERIVADOS (fecha_completa, estimado, canal...). Una regla se aplica solo
+si todos los valores que usa (o los de "requiere") tienen texto; con
+"siempre" se aplica igual. Los reemplazos comunes van antes que los de
+cada carta y una regla posterior pisa el valor de un marcador anterior.
+
+El registro se valida y se compila una vez al importar el módulo: un campo
+o filtro desconocido, un campo con formatos distintos entre cartas o una
+categoría fuera de ORDEN_CATEGORIAS es un error de arranque.
+"""
+from string import Formatter
+
+from cartas.constantes import CANALES_EXTERNOS, CANALES_MASCULINO, GERENTES, MESES
+from cartas.formato import (
+    capitalizar_texto, capitalizar_textos, formatear_fecha, formatear_fechas, formatear_monto, formatear_montos,
+    formatear_numero_kwh, formatear_numeros_kwh,
+)
+
+ORDEN_CATEGORIAS = ("Cobros", "DAR (Artefacto Dañado)", "Técnico Comercial")
+
+# ================= FORMATOS Y FILTROS =================
+# formato de un campo -> función que normaliza lo ingresado
+FORMATOS = {
+    "fecha": formatear_fecha,
+    # Fecha con puntos: dd.mm.yyyy
+    "fecha_puntos": lambda valor: (formatear_fecha(valor) or "").replace("/", "."),
+    "monto": formatear_monto,
+    "kwh": formatear_numero_kwh,
+    "nombre": capitalizar_texto,
+}
+
+# Los mismos formatos sobre una columna completa (pandas.Series), para los lotes
+FORMATOS_COLUMNA = {
+    "fecha": formatear_fechas,
+    "fecha_puntos": lambda serie: formatear_fechas(serie).str.replace("/", ".", regex=False),
+    "monto": formatear_montos,
+    "kwh": formatear_numeros_kwh,
+    "nombre": capitalizar_textos,
+}
+
+# Cómo queda una fecha ya formateada: otro texto en un campo de fecha es una fecha que no se pudo leer
+FECHAS_FORMATEADAS = {
+    "fecha": r"[0-9]{2}/[0-9]{2}/[0-9]{4}",
+    "fecha_puntos": r"[0-9]{2}\.[0-9]{2}\.[0-9]{4}",
+}
+
+# filtro de una plantilla ("{campo:filtro}") -> función sobre el valor ya normalizado
+FILTROS = {
+    # Número con puntos, SIN signo $
+    "kwh": lambda valor: formatear_numero_kwh(valor.replace("$", "")),
+}
+
+# ================= CAMPOS COMUNES =================
+# Campos del formulario común (cliente y reclamo); los de 'formato' se normalizan
+CAMPOS_COMUNES = {
+    "tratamiento": None,
+    "nombre_cliente": "nombre",
+    "direccion": "nombre",
+    "comuna": "nombre",
+    "numero_cliente": None,
+    "gr_numero": None,
+    "zona": None,
+    "canal_ingreso": None,
+    "tipo_caso": None,
+    "caso_sec_numero": None,
+}
+
+
+# ================= VALORES DERIVADOS =================
+def _texto_canal(canal_ingreso):
+    if canal_ingreso == "WhatsApp":
+        return "WhatsApp"
+    elif canal_ingreso in CANALES_EXTERNOS:
+        # Canales externos: solo el nombre (el template ya tiene "a través de")
+        return canal_ingreso
+    elif canal_ingreso in CANALES_MASCULINO:
+        return f"nuestro {canal_ingreso}"
+    return f"nuestra {canal_ingreso}"
+
+
+def _periodo_sin_acceso(v, hoy):
+    if v["anio_inicio"] == v["anio_fin"]:
+        # Mismo año: "marzo a agosto del 2025"
+        return f"{v['periodo_inicio']} a {v['periodo_fin']} del {v['anio_fin']}"
+    # Años diferentes: "marzo del 2024 a agosto del 2025"
+    return f"{v['periodo_inicio']} del {v['anio_inicio']} a {v['periodo_fin']} del {v['anio_fin']}"
+
+
+def _solicitante(v, hoy):
+    # "el Sr." o "la Sra." según el tratamiento de quien solicitó (no el del cliente)
+    if v["tratamiento_solicitante"] == "Señor":
+        return f"el Sr. {v['nombre_solicitante']}"
+    return f"la Sra. {v['nombre_solicitante']}"
+
+
+# nombre -> función(valores, hoy); se calculan solo si una regla los usa
+DERIVADOS = {
+    "fecha_completa": lambda v, hoy: f"{v['comuna']}, {hoy.day} de {MESES[hoy.month]} de {hoy.year}",
+    "anio": lambda v, hoy: str(hoy.year),
+    "estimado": lambda v, hoy: "Estimado" if v["tratamiento"] == "Señor" else "Estimada",
+    "primer_nombre": lambda v, hoy: v["nombre_cliente"].split()[0] if v["nombre_cliente"] else "Cliente",
+    "canal": lambda v, hoy: _texto_canal(v["canal_ingreso"]),
+    "gerente": lambda v, hoy: GERENTES.get(v["zona"], ""),
+    "periodo_sin_acceso": _periodo_sin_acceso,
+    "solicitante": _solicitante,
+}
+
+# ================= REEMPLAZOS COMUNES =================
+REEMPLAZOS_COMUNES = [
+    (("Valparaiso, 16 de diciembre de [202X]", "Valparaíso, 16 de diciembre de [202X]"), "{fecha_completa}", {"siempre": True}),
+    (("Valparaiso", "Valparaíso", "[Comuna]"), "{comuna}", {"siempre": True}),
+    ("DGR N.º XXXXXXX /[202X]", "DGR N° {gr_numero} /{anio}", {"siempre": True}),
+    # Variantes de Ref.: Reclamo; "Reclamo N° XXXXXXX" agrega "Ref.:" si falta
+    (("Ref.: Reclamo N° 15965848", "Ref.: Reclamo N° XXXXXXX", "Reclamo N° XXXXXXX"),
+     "Ref.: Reclamo N° {gr_numero}", {"siempre": True}),
+    ("Número de cliente: 15965848", "Número de cliente: {numero_cliente}", {"siempre": True}),
+    ("[Señor(a)]", "{tratamiento}", {"siempre": True}),
+    ("[Nombre y apellido reclamante]", "{nombre_cliente}", {"siempre": True}),
+    ("[Dirección]", "{direccion}", {"siempre": True}),
+    ("[Estimado(a) Nombre,]", "{estimado} {primer_nombre},", {"siempre": True}),
+    ("[(Ej: nuestra Oficina Comercial / WhatsApp / App CGE 1Click / Call Center / Correo Electrónico / Página Web).]",
+     "{canal}.", {"siempre": True}),
+    ("[Nombre y apellido Gerente Comercial]", "{gerente}", {"siempre": True}),
+    # Caso SEC/SERNAC (opcional): reemplaza COMPLETAMENTE la línea de Reclamo
+    (("Ref.: Reclamo N° XXXXXXX", "Reclamo N° XXXXXXX"),
+     "Ref.: Caso {tipo_caso} N° {caso_sec_numero}, Reclamo N° {gr_numero}",
+     {"requiere": ("caso_sec_numero", "tipo_caso")}),
+]
+
+# ================= CARTAS =================
+_MESES_HISTORIAL = {
+    "etiqueta": "Meses de historial:", "placeholder": "24", "valor": "24",
+    "ayuda": "Cantidad de meses del historial de consumo",
+}
+
+CARTAS = {
+    "apertura_casa_nolu": {
+        "categoria": "Cobros",
+        "nombre": "Apertura Casa Cerrada NOLU",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - APERTURA CASA CERRADA NOLU", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Periodo sin acceso al medidor",
+             "columnas": [["periodo_inicio"], ["anio_inicio"], ["periodo_fin"], ["anio_fin"]]},
+            {"titulo": "🔢 Número de medidor", "columnas": [["numero_medidor"]]},
+            {"titulo": "📊 Datos de lectura y consumo",
+             "columnas": [["fecha_lectura", "lectura_kwh"], ["consumo_total", "consumo_provisorio"],
+                          ["fecha_inicio_periodo", "fecha_fin_periodo"]]},
+            {"titulo": "💰 Reversa de Electricidad", "columnas": [["monto_ajuste"]]},
+            {"titulo": "📅 Historial de consumos (BO)", "columnas": [["meses_historial"]]},
+        ],
+        "campos": {
+            "periodo_inicio": {"etiqueta": "Mes inicio sin acceso:", "placeholder": "marzo",
+                               "ayuda": "Ejemplo: marzo, abril, mayo..."},
+            "anio_inicio": {"etiqueta": "Año inicio:", "placeholder": "2024", "valor": "2024",
+                            "ayuda": "Año en que comenzó el periodo sin acceso"},
+            "periodo_fin": {"etiqueta": "Mes fin sin acceso:", "placeholder": "agosto",
+                            "ayuda": "Ejemplo: agosto, septiembre..."},
+            "anio_fin": {"etiqueta": "Año fin:", "placeholder": "2025", "valor": "2025",
+                         "ayuda": "Año en que se accedió al medidor"},
+            "numero_medidor": {"etiqueta": "N° Medidor:", "placeholder": "E044124",
+                               "ayuda": "Número del medidor eléctrico"},
+            "fecha_lectura": {"etiqueta": "Fecha de acceso al medidor:", "placeholder": "08082025 o 08/08/2025",
+                              "ayuda": "Fecha en que se logró acceder al medidor", "formato": "fecha"},
+            "lectura_kwh": {"etiqueta": "Lectura registrada (kWh):", "placeholder": "20041",
+                            "ayuda": "Lectura total registrada en el medidor", "formato": "kwh"},
+            "consumo_total": {"etiqueta": "Consumo total (kWh):", "placeholder": "756",
+                              "ayuda": "Consumo total del periodo", "formato": "kwh"},
+            "consumo_provisorio": {"etiqueta": "Consumo provisorio (kWh):", "placeholder": "184",
+                                   "ayuda": "Consumos provisorios descontados", "formato": "kwh"},
+            "fecha_inicio_periodo": {"etiqueta": "Fecha inicio periodo apertura:",
+                                     "placeholder": "11032025 o 11/03/2025", "formato": "fecha"},
+            "fecha_fin_periodo": {"etiqueta": "Fecha fin periodo apertura:",
+                                  "placeholder": "08082025 o 08/08/2025", "formato": "fecha"},
+            "monto_ajuste": {"etiqueta": "Monto reversa:", "placeholder": "39112",
+                             "ayuda": "Monto de la reversa de electricidad", "formato": "monto"},
+            "meses_historial": {**_MESES_HISTORIAL, "ayuda": "Cantidad de meses del historial (ejemplo: 24)"},
+        },
+        "reemplazos": [
+            ("[marzo a agosto del 2025]", "{periodo_sin_acceso}",
+             {"requiere": ("periodo_inicio", "periodo_fin", "anio_inicio", "anio_fin")}),
+            ("[E044124]", "{numero_medidor}"),
+            ("[08/08/2025]", "{fecha_lectura}"),
+            (("[20.041]", "[20041]"), "{lectura_kwh}"),
+            ("[756]", "{consumo_total}"),
+            ("[11/03/2025 a 08/08/2025]", "{fecha_inicio_periodo} a {fecha_fin_periodo}"),
+            ("[184]", "{consumo_provisorio}"),
+            ("[$39.112]", "{monto_ajuste}"),
+            ("[24]", "{meses_historial}"),
+        ],
+    },
+    "carta_aporte_lectura": {
+        "categoria": "Cobros",
+        "nombre": "Aporte Lectura",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - APORTE LECTURA", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Fecha del requerimiento", "columnas": [["fecha_requerimiento"]],
+             "nota": "ℹ️ El N° de requerimiento se copiará automáticamente del N° GR"},
+        ],
+        "campos": {
+            "fecha_requerimiento": {"etiqueta": "Fecha del requerimiento:", "placeholder": "24112025 o 24/11/2025",
+                                    "ayuda": "Fecha en que se efectuó el requerimiento", "formato": "fecha"},
+        },
+        "reemplazos": [
+            # N° de requerimiento (igual que GR)
+            ("[15939748]", "{gr_numero}", {"siempre": True}),
+            ("[24/11/2025]", "{fecha_requerimiento}"),
+        ],
+    },
+    "atencion_emergencia_halu": {
+        "categoria": "Cobros",
+        "nombre": "Atención de Emergencias HALU",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - ATENCIÓN EMERGENCIAS FORMULARIO 21", "abierto": True},
+        "secciones": [
+            {"titulo": "📋 Datos de Formulario 21", "subtitulo": "👤 Persona que solicitó atención emergencias",
+             "columnas": [["tratamiento_solicitante", "nombre_solicitante"], ["fecha_solicitud_formulario"]]},
+            {"titulo": "💰 Monto de Atención de Emergencias",
+             "columnas": [["monto_emergencia"], ["fecha_emision_boleta"]]},
+            {"titulo": "📄 N° Boleta donde se facturó monto de atención de emergencias",
+             "columnas": [["numero_boleta_emergencia"]]},
+            {"titulo": "📋 Numero de Nota de crédito", "columnas": [["nota_credito"]]},
+        ],
+        "campos": {
+            "tratamiento_solicitante": {
+                "etiqueta": "Formalidad (Señor o Señora):", "opciones": ["", "Señor", "Señora"],
+                "ayuda": "Tratamiento de quien solicitó la emergencia (puede ser distinto a quien va dirigida la carta)",
+            },
+            "nombre_solicitante": {"etiqueta": "Nombre completo:", "placeholder": "Mariana Lidia Espinoza Osorio",
+                                   "ayuda": "Nombre completo de quien solicitó la atención", "formato": "nombre"},
+            "fecha_solicitud_formulario": {
+                "etiqueta": "Fecha de solicitud en formulario:", "placeholder": "03102025 o 03/10/2025",
+                "ayuda": "Fecha en que se solicitó la atención en el formulario 21", "formato": "fecha",
+            },
+            "monto_emergencia": {"etiqueta": "Monto:", "placeholder": "24903",
+                                 "ayuda": "Monto de la atención de emergencia", "formato": "monto"},
+            "fecha_emision_boleta": {"etiqueta": "Fecha de emisión boleta:", "placeholder": "15102025 o 15/10/2025",
+                                     "ayuda": "Fecha de emisión de la boleta", "formato": "fecha"},
+            "numero_boleta_emergencia": {"etiqueta": "N° Boleta:", "placeholder": "460506214",
+                                         "ayuda": "Número de la boleta donde se facturó la emergencia"},
+            "nota_credito": {"etiqueta": "N° Nota de crédito:", "placeholder": "6669093",
+                             "ayuda": "Número de la nota de crédito"},
+        },
+        "reemplazos": [
+            ("[03/10/2025]", "{fecha_solicitud_formulario}"),
+            ("[Mariana Lidia Espinoza Osorio]", "{nombre_solicitante}",
+             {"requiere": ("nombre_solicitante", "tratamiento_solicitante")}),
+            ("[el(a) Sr(a). XXXXXX XXXXXX]", "{solicitante}",
+             {"requiere": ("nombre_solicitante", "tratamiento_solicitante")}),
+            ("[$24.903]", "{monto_emergencia}"),
+            ("[460506214]", "{numero_boleta_emergencia}"),
+            ("[15/10/2025]", "{fecha_emision_boleta}"),
+            ("[6669093]", "{nota_credito}"),
+        ],
+    },
+    "aumento_consumo_halu_sinvisita": {
+        "categoria": "Cobros",
+        "nombre": "Aumento Consumo HALU Sin visita técnica",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - AUMENTO CONSUMO SIN VISITA", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Historial de consumos", "columnas": [["meses_historial"]]},
+            {"titulo": "💰 Rebaja aplicada", "columnas": [["monto_rebaja"]]},
+        ],
+        "campos": {
+            "meses_historial": _MESES_HISTORIAL,
+            "monto_rebaja": {"etiqueta": "Monto de rebaja:", "placeholder": "80058",
+                             "ayuda": "Monto de la rebaja aplicada por promedio histórico", "formato": "monto"},
+        },
+        "reemplazos": [
+            ("[24]", "{meses_historial}"),
+            ("[$80.058]", "{monto_rebaja}"),
+        ],
+    },
+    "aumento_consumo_nolu_sinvisita": {
+        "categoria": "Cobros",
+        "nombre": "Aumento Consumo NOLU Sin visita técnica",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - AUMENTO CONSUMO NOLU SIN VISITA", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Historial de consumos", "columnas": [["meses_historial"]]},
+        ],
+        "campos": {"meses_historial": _MESES_HISTORIAL},
+        "reemplazos": [("[24]", "{meses_historial}")],
+    },
+    "carta_compromiso": {
+        "categoria": "Cobros",
+        "nombre": "Carta Compromiso 10 días",
+        "formulario": None,
+    },
+    "carta_compromiso_i5": {
+        "categoria": "Cobros",
+        "nombre": "Carta Compromiso con I5",
+        "formulario": None,
+    },
+    "carta_falta_info": {
+        "categoria": "Cobros",
+        "nombre": "Carta falta información reclamo",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - CARTA FALTA INFO", "abierto": True},
+        "secciones": [
+            {"nota": "ℹ️ El N° de reclamo ingresado se copiará automáticamente del N° GR",
+             "texto": "Esta carta no requiere campos adicionales"},
+        ],
+        "reemplazos": [
+            # N° de reclamo ingresado (igual que GR)
+            ("[15939815]", "{gr_numero}", {"siempre": True}),
+        ],
+    },
+    "error_lectura_halu": {
+        "categoria": "Cobros",
+        "nombre": "Error de Lectura HALU",
+        "formulario": {"titulo": "📊 DATOS ADICIONALES DE FACTURACIÓN (Opcional)", "abierto": False},
+        "secciones": [
+            {"columnas": [["fecha_boleta", "tipo_doc", "numero_boleta"], ["consumo_kwh", "monto_boleta"],
+                          ["dia_inicio", "dia_fin"]]},
+        ],
+        "campos": {
+            "fecha_boleta": {"etiqueta": "Fecha boleta:", "placeholder": "20122025 o 20/12/2025",
+                             "ayuda": "Formato: DDMMYYYY (ej: 20122025) o DD/MM/YYYY", "formato": "fecha"},
+            "tipo_doc": {"etiqueta": "Tipo documento:", "opciones": ["boleta", "factura"]},
+            "numero_boleta": {"etiqueta": "N° Boleta/Factura:", "placeholder": "123456",
+                              "ayuda": "Número de la boleta o factura generada"},
+            "consumo_kwh": {"etiqueta": "Consumo kWh:", "placeholder": "350"},
+            "monto_boleta": {"etiqueta": "Monto:", "placeholder": "45000", "formato": "monto"},
+            "dia_inicio": {"etiqueta": "Día inicio lectura:", "placeholder": "06"},
+            "dia_fin": {"etiqueta": "Día fin lectura:", "placeholder": "12"},
+        },
+        "reemplazos": [
+            ("[XXXXXX y XXXXXX.]", "{dia_inicio} y {dia_fin}."),
+            (("[XXXXXX y XXXXXX]", "XXXXXX y XXXXXX"), "{dia_inicio} y {dia_fin}"),
+            ("[día/mes/año]", "{fecha_boleta}"),
+            ("[boleta/factura]", "{tipo_doc}"),
+            ("[XXXXXX]", "{numero_boleta}"),
+            ("XXX kWh", "{consumo_kwh} kWh"),
+            ("[$ XX.XXX]", "{monto_boleta}"),
+        ],
+    },
+    "error_lectura_nolu": {
+        "categoria": "Cobros",
+        "nombre": "Error de Lectura NOLU",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - ERROR LECTURA NOLU", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Rango de días de lectura", "columnas": [["dia_inicio"], ["dia_fin"]]},
+            {"titulo": "📊 Datos de facturación", "columnas": [["fecha_factura"], ["monto_factura"]]},
+        ],
+        "campos": {
+            "dia_inicio": {"etiqueta": "Día inicio:", "placeholder": "10", "ayuda": "Día de inicio del rango"},
+            "dia_fin": {"etiqueta": "Día fin:", "placeholder": "15", "ayuda": "Día de fin del rango"},
+            "fecha_factura": {"etiqueta": "Fecha factura:", "placeholder": "15122025 o 15.12.2025",
+                              "ayuda": "Fecha de la factura (se formateará con puntos: dd.mm.yyyy)",
+                              "formato": "fecha_puntos"},
+            "monto_factura": {"etiqueta": "Monto factura:", "placeholder": "36745",
+                              "ayuda": "Monto de la factura", "formato": "kwh"},
+        },
+        "reemplazos": [
+            ("[10 y 15]", "{dia_inicio} y {dia_fin}"),
+            ("[15.12.2025]", "{fecha_factura}"),
+            # Lectura kWh (SIN signo $, solo número con puntos)
+            (("[$65.000]", "[36.745]"), "{monto_factura:kwh}"),
+        ],
+    },
+    "error_lectura_regularizado_sgte_lectura": {
+        "categoria": "Cobros",
+        "nombre": "Error Lectura Regularizado Siguiente Lectura HALU",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - ERROR LECTURA REGULARIZADO", "abierto": True},
+        "secciones": [
+            {"titulo": "📅 Rango de días de lectura", "columnas": [["dia_inicio"], ["dia_fin"]]},
+            {"titulo": "📅 Historial de consumos (BO)", "columnas": [["meses_historial"]]},
+        ],
+        "campos": {
+            "dia_inicio": {"etiqueta": "Día inicio:", "placeholder": "13", "ayuda": "Día de inicio del rango"},
+            "dia_fin": {"etiqueta": "Día fin:", "placeholder": "18", "ayuda": "Día de fin del rango"},
+            "meses_historial": {**_MESES_HISTORIAL, "ayuda": "Cantidad de meses del historial"},
+        },
+        "reemplazos": [
+            ("[13 y 18]", "{dia_inicio} y {dia_fin}"),
+            ("[24]", "{meses_historial}"),
+        ],
+    },
+    "facturaciones_normalizadas": {
+        "categoria": "Cobros",
+        "nombre": "Facturaciones Normalizadas",
+        "formulario": {"titulo": "📊 DATOS ESPECÍFICOS - FACTURACIONES NORMALIZADAS", "abierto": True},
+        "secciones": [
+            {"titulo": "📝 Motivo del reclamo", "columnas": [["motivo_reclamo"]]},
+            {"titulo": "📅 Rango de días de lectura", "columnas": [["dia_inicio"], ["dia_fin"]]},
+        ],
+        "campos": {
+            "motivo_reclamo": {"etiqueta": "Motivo del reclamo:", "placeholder": "error en la lectura",
+                               "ayuda": "Ejemplo: error en la lectura, aumento consumo, servicio no facturado, etc."},
+            "dia_inicio": {"etiqueta": "Día inicio:", "placeholder": "15",
+                           "ayuda": "Día de inicio del rango de lectura"},
+            "dia_fin": {"etiqueta": "Día fin:", "placeholder": "20", "ayuda": "Día de fin del rango de lectura"},
+        },
+        "reemplazos": [
+            ("[error en la lectura]", "{motivo_reclamo}"),
+            ("[15 y 20]", "{dia_inicio} y {dia_fin}"),
+        ],
+    },
+    "normal_avance": {
+        "categoria": "Cobros",
+        "nombre": "Normal Avance",
+        "formulario": None,
+    },
+}
+
+
+# ================= COMPILACIÓN =================
+def _compilar_regla(tipo_carta, regla, nombres):
+    """(marcadores, [(literal, nombre, filtro)], nombres que deben tener texto)"""
+    marcadores, plantilla, *resto = regla
+    opciones = resto[0] if resto else {}
+    marcadores = (marcadores,) if isinstance(marcadores, str) else tuple(marcadores)
+    partes = []
+    usados = []
+    for literal, nombre, filtro, _ in Formatter().parse(plantilla):
+        if nombre is None:
+            partes.append((literal, None, None))
+            continue
+        if nombre not in nombres:
+            raise ValueError(f"{tipo_carta}: '{nombre}' no es un campo ni un valor derivado ({plantilla!r})")
+        if filtro and filtro not in FILTROS:
+            raise ValueError(f"{tipo_carta}: filtro desconocido '{filtro}' ({plantilla!r})")
+        partes.append((literal, nombre, FILTROS[filtro] if filtro else None))
+        usados.append(nombre)
+    if opciones.get("siempre"):
+        requiere = ()
+    else:
+        requiere = tuple(opciones.get("requiere", usados))
+        desconocidos = [nombre for nombre in requiere if nombre not in nombres]
+        if desconocidos:
+            raise ValueError(f"{tipo_carta}: 'requiere' con nombres desconocidos: {', '.join(desconocidos)}")
+    return marcadores, tuple(partes), requiere
+
+
+def _compilar():
+    formatos = dict(CAMPOS_COMUNES)
+    categorias = {categoria: {} for categoria in ORDEN_CATEGORIAS}
+    compiladas = {}
+    for tipo_carta, carta in CARTAS.items():
+        if carta["categoria"] not in categorias:
+            raise ValueError(f"{tipo_carta}: categoría desconocida '{carta['categoria']}'")
+        categorias[carta["categoria"]][tipo_carta] = carta["nombre"]
+
+        campos = carta.get("campos", {})
+        for campo, definicion in campos.items():
+            formato = definicion.get("formato")
+            if campo in DERIVADOS:
+                raise ValueError(f"{tipo_carta}: el campo '{campo}' tiene el nombre de un valor derivado")
+            if formato is not None and (formato not in FORMATOS or formato not in FORMATOS_COLUMNA):
+                raise ValueError(f"{tipo_carta}: formato desconocido '{formato}' en '{campo}'")
+            if campo in formatos and formatos[campo] != formato:
+                raise ValueError(f"'{campo}' tiene formatos distintos entre cartas ({formatos[campo]} y {formato})")
+            formatos[campo] = formato
+        en_formulario = [campo for seccion in carta.get("secciones", ()) for columna in seccion.get("columnas", ())
+                         for campo in columna]
+        if sorted(en_formulario) != sorted(campos):
+            raise ValueError(f"{tipo_carta}: las secciones del formulario no cubren exactamente sus campos")
+
+        nombres = set(CAMPOS_COMUNES) | set(campos) | set(DERIVADOS)
+        compiladas[tipo_carta] = tuple(
+            _compilar_regla(tipo_carta, regla, nombres)
+            for regla in REEMPLAZOS_COMUNES + list(carta.get("reemplazos", ()))
+        )
+    return categorias, compiladas, formatos
+
+
+CATEGORIAS, _REGLAS, _FORMATOS_CAMPOS = _compilar()
+
+# Todos los tipos de carta disponibles, sin importar la categoría
+TIPOS_CARTA = {tipo: nombre for cartas in CATEGORIAS.values() for tipo, nombre in cartas.items()}
+
+# Campos con formato -> formato (los que se normalizan al generar)
+FORMATOS_CAMPOS = {campo: formato for campo, formato in _FORMATOS_CAMPOS.items() if formato}
+
+# Campos propios de las cartas, sin repetir, en el orden del registro
+CAMPOS_CARTAS = list(dict.fromkeys(campo for carta in CARTAS.values() for campo in carta.get("campos", ())))
+
+
+def _marcadores(reglas):
+    return tuple(dict.fromkeys(marcador for regla in reglas for marcador in regla[0]))
+
+
+MARCADORES_COMUNES = _marcadores(_compilar_regla("", regla, set(CAMPOS_COMUNES) | set(DERIVADOS))
+                                 for regla in REEMPLAZOS_COMUNES)
+MARCADORES_POR_TIPO = {
+    tipo_carta: _marcadores(reglas[len(REEMPLAZOS_COMUNES):])
+    for tipo_carta, reglas in _REGLAS.items()
+    if len(reglas) > len(REEMPLAZOS_COMUNES)
+}
+
+
+# ================= USO =================
+def carta(tipo_carta):
+    """Definición registrada de un tipo de carta (KeyError si no existe)"""
+    return CARTAS[tipo_carta]
+
+
+def formatear(formato, valor):
+    """Aplica un formato del registro ('fecha', 'monto'...) a lo ingresado; sin formato lo deja igual"""
+    return FORMATOS[formato](valor) if formato else valor
+
+
+def formatear_columna(formato, serie):
+    """formatear() de toda una columna de texto (pandas.Series)"""
+    return FORMATOS_COLUMNA[formato](serie) if formato else serie
+
+
+class _Valores(dict):
+    """Datos de la carta; los campos que faltan valen "" y los derivados se calculan al pedirlos"""
+
+    def __init__(self, datos, hoy):
+        super().__init__(datos)
+        self.hoy = hoy
+
+    def __missing__(self, nombre):
+        valor = DERIVADOS[nombre](self, self.hoy) if nombre in DERIVADOS else ""
+        self[nombre] = valor
+        return valor
+
+
+def construir_reemplazos(tipo_carta, datos, hoy):
+    """Diccionario marcador del template → texto final, para datos ya normalizados"""
+    valores = _Valores(datos, hoy)
+    reemplazos = {}
+    for marcadores, partes, requiere in _REGLAS[tipo_carta]:
+        if not all(valores[nombre] for nombre in requiere):
+            continue
+        texto = "".join(
+            literal if nombre is None else literal + (filtro(valores[nombre]) if filtro else valores[nombre])
+            for literal, nombre, filtro in partes
+        )
+        for marcador in marcadores:
+            reemplazos[marcador] = texto
+    return reemplazos
@@ -0,0 +1,78 @@
+"""
+Caché de cartas generadas, direccionada por contenido.
+
+La clave es el sha256 de (contenido del template, motor y modo, fecha de
+generación, reemplazos finales). Dos pedidos con los mismos datos el mismo
+día dan la misma clave y el segundo recibe los bytes ya generados, sin
+abrir el template ni volver a armar el .docx. Cambiar el template, la
+fecha o cualquier dato cambia la clave.
+
+La caché es un LRU en memoria limitado por MAX_BYTES y lleva contadores de
+aciertos, fallos y expulsiones (estadisticas()).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from cartas.plantillas import hash_template
+
+MAX_BYTES = 32 * 1024 * 1024  # ~1.000 cartas de 30 KB
+
+_cartas = OrderedDict()  # clave -> bytes del .docx
+_bytes = 0
+_contadores = {"aciertos": 0, "fallos": 0, "expulsadas": 0}
+_lock = threading.Lock()
+
+
+def clave(template_path, reemplazos, hoy, motor, modo):
+    """Clave de la carta: sha256 del template, motor, modo, fecha y reemplazos"""
+    partes = [
+        hash_template(template_path),
+        motor,
+        modo,
+        hoy.date().isoformat(),
+        sorted((str(k), str(v)) for k, v in reemplazos.items()),
+    ]
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def obtener(clave_carta):
+    """Bytes de la carta o None; cuenta el acierto o el fallo"""
+    with _lock:
+        contenido = _cartas.get(clave_carta)
+        if contenido is None:
+            _contadores["fallos"] += 1
+            return None
+        _cartas.move_to_end(clave_carta)
+        _contadores["aciertos"] += 1
+        return contenido
+
+
+def guardar(clave_carta, contenido):
+    global _bytes
+    if len(contenido) > MAX_BYTES:
+        return
+    with _lock:
+        anterior = _cartas.pop(clave_carta, None)
+        if anterior is not None:
+            _bytes -= len(anterior)
+        _cartas[clave_carta] = contenido
+        _bytes += len(contenido)
+        while _bytes > MAX_BYTES:
+            _, expulsada = _cartas.popitem(last=False)
+            _bytes -= len(expulsada)
+            _contadores["expulsadas"] += 1
+
+
+def estadisticas():
+    """{'cartas', 'bytes', 'aciertos', 'fallos', 'expulsadas'}"""
+    with _lock:
+        return {"cartas": len(_cartas), "bytes": _bytes, **_contadores}
+
+
+def limpiar():
+    global _bytes
+    with _lock:
+        _cartas.clear()
+        _bytes = 0
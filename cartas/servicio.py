@@ -0,0 +1,223 @@
+"""
+Servicio HTTP local para generar cartas sin pasar por Streamlit.
+
+    python -m cartas servicio --puerto 8080 --procesos 8 --cola 64
+
+Rutas:
+    POST /cartas    JSON con tipo_carta y los mismos campos del formulario
+                    (planos o dentro de "datos"); responde el .docx.
+    GET  /salud     Estado del servicio y del pool de workers.
+    GET  /metricas  Contadores de cartas atendidas, errores, rechazos y latencias.
+    GET  /metrics   Tiempos por tipo de carta y etapa (formato de Prometheus).
+
+Las cartas se generan en el pool de cartas.procesos, con los templates
+ya parseados en cada worker. El número de workers es el límite de
+concurrencia; detrás de ellos se admiten hasta 'cola' pedidos en espera y
+cualquier pedido adicional recibe 503 con Retry-After (contrapresión).
+"""
+import json
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import TimeoutError as TimeoutFuturo
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+from cartas import metricas
+from cartas.generador import fecha_chile, normalizar_datos, validar
+from cartas.procesos import PROCESOS, calentar_pool, cerrar_pool, generar_medida, obtener_pool
+
+MIME_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+COLA = 64
+TIMEOUT_CARTA = 30  # segundos
+MAX_CUERPO = 1024 * 1024
+
+
+class Estado:
+    """Admisión (concurrencia + cola) y contadores del servicio"""
+
+    def __init__(self, procesos, cola):
+        self.procesos = procesos
+        self.cola = cola
+        self._admision = threading.BoundedSemaphore(procesos + cola)
+        self._lock = threading.Lock()
+        self.inicio = time.time()
+        self.en_curso = 0
+        self.atendidas = 0
+        self.errores = 0
+        self.rechazadas = 0
+        self.segundos_total = 0.0
+        self.segundos_max = 0.0
+
+    def admitir(self):
+        if not self._admision.acquire(blocking=False):
+            with self._lock:
+                self.rechazadas += 1
+            return False
+        with self._lock:
+            self.en_curso += 1
+        return True
+
+    def liberar(self, segundos, ok):
+        with self._lock:
+            self.en_curso -= 1
+            if ok:
+                self.atendidas += 1
+                self.segundos_total += segundos
+                self.segundos_max = max(self.segundos_max, segundos)
+            else:
+                self.errores += 1
+        self._admision.release()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "procesos": self.procesos,
+                "cola_maxima": self.cola,
+                "en_curso": self.en_curso,
+                "atendidas": self.atendidas,
+                "errores": self.errores,
+                "rechazadas": self.rechazadas,
+                "latencia_promedio_ms": round(1000 * self.segundos_total / self.atendidas, 1) if self.atendidas else 0.0,
+                "latencia_maxima_ms": round(1000 * self.segundos_max, 1),
+                "uptime_s": round(time.time() - self.inicio, 1),
+            }
+
+
+class ManejadorCartas(BaseHTTPRequestHandler):
+    estado = None  # se asigna en crear_servidor()
+    server_version = "AutomatizadorCartas/1.0"
+
+    def _responder_json(self, codigo, cuerpo, encabezados=None):
+        contenido = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(contenido)))
+        for clave, valor in (encabezados or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def do_GET(self):
+        if self.path == "/salud":
+            self._responder_json(200, {"estado": "ok", "procesos": self.estado.procesos})
+        elif self.path == "/metricas":
+            self._responder_json(200, self.estado.metricas())
+        elif self.path == "/metrics":
+            contenido = metricas.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", metricas.TIPO_PROMETHEUS)
+            self.send_header("Content-Length", str(len(contenido)))
+            self.end_headers()
+            self.wfile.write(contenido)
+        else:
+            self._responder_json(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        if self.path not in ("/cartas", "/carta"):
+            self._responder_json(404, {"error": "Ruta no encontrada"})
+            return
+
+        try:
+            largo = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            self._responder_json(400, {"error": "Content-Length inválido"})
+            return
+        if largo > MAX_CUERPO:
+            self._responder_json(413, {"error": "Pedido demasiado grande"})
+            return
+        try:
+            cuerpo = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            self._responder_json(400, {"error": "JSON inválido"})
+            return
+        if not isinstance(cuerpo, dict):
+            self._responder_json(400, {"error": "Se esperaba un objeto JSON"})
+            return
+
+        datos = dict(cuerpo.get("datos") or {})
+        datos.update({clave: valor for clave, valor in cuerpo.items() if clave != "datos"})
+        datos = normalizar_datos(datos)
+        tipo_carta = datos.get("tipo_carta", "")
+        problemas = validar(tipo_carta, datos)
+        if problemas:
+            self._responder_json(400, {"error": "; ".join(problemas)})
+            return
+
+        if not self.estado.admitir():
+            self._responder_json(503, {"error": "Servicio saturado, reintente"}, {"Retry-After": "1"})
+            return
+
+        inicio = time.perf_counter()
+        ok = False
+        en_worker = False
+        try:
+            futuro = obtener_pool(self.estado.procesos).submit(generar_medida, 0, datos, fecha_chile())
+            (_, nombre, contenido, error), (_, etapas, _) = futuro.result(timeout=TIMEOUT_CARTA)
+            if error is not None:
+                metricas.registrar(tipo_carta, etapas, ok=False)
+                self._responder_json(500, {"error": error})
+                return
+            ok = True
+        except TimeoutFuturo:
+            # Si el worker ya la está generando, el cupo sigue ocupado hasta que termine:
+            # liberarlo antes dejaría pasar más pedidos que procesos + cola
+            if not futuro.cancel():
+                en_worker = True
+                futuro.add_done_callback(lambda _: self.estado.liberar(time.perf_counter() - inicio, False))
+            self._responder_json(504, {"error": "La carta tardó demasiado en generarse"})
+            return
+        except BrokenProcessPool:
+            cerrar_pool()
+            self._responder_json(500, {"error": "Se reinició el pool de workers, reintente"})
+            return
+        except Exception as e:
+            # Cualquier otra falla responde JSON como el resto; el detalle queda en el log del servicio
+            print(f"❌ POST {self.path} ({tipo_carta}):\n{traceback.format_exc()}", file=sys.stderr, flush=True)
+            self._responder_json(500, {"error": f"Error interno: {str(e) or type(e).__name__}"})
+            return
+        finally:
+            if not en_worker:
+                self.estado.liberar(time.perf_counter() - inicio, ok)
+
+        inicio = time.perf_counter()
+        self.send_response(200)
+        self.send_header("Content-Type", MIME_DOCX)
+        self.send_header("Content-Length", str(len(contenido)))
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(nombre)}")
+        self.end_headers()
+        self.wfile.write(contenido)
+        metricas.registrar(tipo_carta, {**etapas, "descarga": time.perf_counter() - inicio})
+
+    def log_message(self, formato, *args):
+        # Sin un log por pedido: a decenas por segundo solo agrega ruido
+        pass
+
+
+def crear_servidor(host="127.0.0.1", puerto=8080, procesos=None, cola=None):
+    """Arranca y precalienta el pool y devuelve el servidor (sin empezar a atender)"""
+    procesos = max(1, int(procesos or PROCESOS))
+    cola = COLA if cola is None else max(0, int(cola))
+    calentar_pool(procesos)
+
+    manejador = type("Manejador", (ManejadorCartas,), {"estado": Estado(procesos, cola)})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def servir(host="127.0.0.1", puerto=8080, procesos=None, cola=None):
+    servidor = crear_servidor(host, puerto, procesos, cola)
+    print(f"⚡ Servicio de cartas en http://{host}:{servidor.server_address[1]} ({servidor.RequestHandlerClass.estado.procesos} workers)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        cerrar_pool()
@@ -0,0 +1,197 @@
+"""
+Trabajos en segundo plano: generar sin bloquear el script de Streamlit.
+
+La app envía la carta (o el lote) a un pool de threads y recibe un id de
+trabajo; después consulta estado() cada tanto y muestra el avance. Cartas
+y lotes tienen cada uno su pool: un lote largo no deja esperando a las
+cartas sueltas. Los trabajos viven en este proceso, compartidos por todas
+las sesiones: al recargar la página basta el id (la app lo deja en la URL)
+para retomar el que estaba en curso.
+
+    trabajo_id = enviar_carta("normal_avance", datos)
+    estado(trabajo_id)   # {"estado": "en_curso", "hechas": 0, "total": 1, ...}
+    cancelar(trabajo_id)
+
+Estados: pendiente → en_curso → listo | error | cancelado. Un trabajo
+en curso se cancela en su próximo avance (en un lote, entre carta y carta).
+Los trabajos terminados se olvidan RETENCION segundos después.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cartas import indice, metricas
+from cartas.artefactos import guardar as guardar_artefacto
+from cartas.generador import fecha_chile, generar_carta, nombre_archivo
+
+# Trabajos de cada tipo que corren al mismo tiempo; el resto espera como 'pendiente'
+HILOS = {"carta": 4, "lote": 2}
+RETENCION = 60 * 60  # segundos que se guarda un trabajo terminado (y su resultado)
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+LISTO = "listo"
+ERROR = "error"
+CANCELADO = "cancelado"
+TERMINADOS = (LISTO, ERROR, CANCELADO)
+
+# id -> {"tipo", "estado", "hechas", "total", "resultado", "error", "creado", "terminado", "cancelar", "futuro"}
+_trabajos = {}
+_lock = threading.Lock()
+_pools = {}  # tipo -> ThreadPoolExecutor
+
+
+class Cancelado(Exception):
+    """El trabajo se canceló mientras corría"""
+
+
+def _obtener_pool(tipo):
+    with _lock:
+        if tipo not in _pools:
+            _pools[tipo] = ThreadPoolExecutor(max_workers=HILOS.get(tipo, 1), thread_name_prefix=f"trabajo_{tipo}")
+        return _pools[tipo]
+
+
+def _olvidar_vencidos(ahora):
+    for trabajo_id in [i for i, t in _trabajos.items() if t["terminado"] and ahora - t["terminado"] > RETENCION]:
+        del _trabajos[trabajo_id]
+
+
+def _terminar(trabajo, estado_final, resultado=None, error=None):
+    with _lock:
+        trabajo["estado"] = estado_final
+        trabajo["resultado"] = resultado
+        trabajo["error"] = error
+        trabajo["terminado"] = time.time()
+
+
+def _correr(trabajo, funcion, args, kwargs):
+    def avance(hechas, total):
+        with _lock:
+            trabajo["hechas"] = hechas
+            trabajo["total"] = total
+        if trabajo["cancelar"].is_set():
+            raise Cancelado()
+
+    with _lock:
+        if trabajo["cancelar"].is_set():
+            trabajo["estado"] = CANCELADO
+            trabajo["terminado"] = time.time()
+            return
+        trabajo["estado"] = EN_CURSO
+    try:
+        resultado = funcion(avance, *args, **kwargs)
+    except Cancelado:
+        _terminar(trabajo, CANCELADO)
+    except Exception as e:
+        _terminar(trabajo, ERROR, error=str(e) or type(e).__name__)
+    else:
+        _terminar(trabajo, LISTO, resultado=resultado)
+
+
+def enviar(tipo, funcion, *args, **kwargs):
+    """
+    Corre funcion(avance, *args, **kwargs) en segundo plano y devuelve el id
+    del trabajo. 'avance(hechas, total)' publica el progreso y levanta
+    Cancelado si se pidió cancelar.
+    """
+    ahora = time.time()
+    trabajo_id = uuid.uuid4().hex
+    trabajo = {
+        "tipo": tipo, "estado": PENDIENTE, "hechas": 0, "total": 1, "resultado": None, "error": None,
+        "creado": ahora, "terminado": None, "cancelar": threading.Event(), "futuro": None,
+    }
+    with _lock:
+        _olvidar_vencidos(ahora)
+        _trabajos[trabajo_id] = trabajo
+    trabajo["futuro"] = _obtener_pool(tipo).submit(_correr, trabajo, funcion, args, kwargs)
+    return trabajo_id
+
+
+def estado(trabajo_id):
+    """Copia del estado del trabajo (sin el evento ni el futuro), o None si no existe o ya venció"""
+    with _lock:
+        trabajo = _trabajos.get(trabajo_id) if trabajo_id else None
+        if trabajo is None:
+            return None
+        return {clave: valor for clave, valor in trabajo.items() if clave not in ("cancelar", "futuro")}
+
+
+def cancelar(trabajo_id):
+    """Pide cancelar el trabajo; devuelve False si no existe o ya terminó"""
+    with _lock:
+        trabajo = _trabajos.get(trabajo_id)
+        if trabajo is None or trabajo["estado"] in TERMINADOS:
+            return False
+        trabajo["cancelar"].set()
+        futuro = trabajo["futuro"]
+    # Si todavía no empezó no llega a correr
+    if futuro is not None and futuro.cancel():
+        _terminar(trabajo, CANCELADO)
+    return True
+
+
+def trabajos(tipo=None):
+    """{id: estado} de los trabajos guardados (de un tipo, si se indica)"""
+    with _lock:
+        ids = [i for i, t in _trabajos.items() if tipo is None or t["tipo"] == tipo]
+    return {trabajo_id: estado(trabajo_id) for trabajo_id in ids}
+
+
+def limpiar():
+    with _lock:
+        _trabajos.clear()
+
+
+# ================= CARTAS Y LOTES =================
+def _carta(avance, tipo_carta, datos, anexo=None):
+    cronometro = metricas.Cronometro(tipo_carta)
+    try:
+        contenido = generar_carta(tipo_carta, datos, hoy=fecha_chile(), anexo=anexo, cronometro=cronometro)
+        # Última oportunidad de cancelar: después la carta queda guardada
+        avance(1, 2)
+
+        # La misma carta ya está en output/ (mismo contenido): se reutiliza ese archivo,
+        # pero el pedido igual queda en el registro y en los contadores
+        existente = indice.buscar_contenido(hashlib.sha256(contenido).hexdigest())
+        if existente:
+            nombre_carta = existente["nombre"]
+            artefacto_id, _ = guardar_artefacto(nombre_carta, contenido, en_disco=False)
+            output_path = existente["ruta"]
+        else:
+            nombre_carta = nombre_archivo(tipo_carta, datos["gr_numero"])
+            artefacto_id, output_path = guardar_artefacto(nombre_carta, contenido)
+            if output_path:
+                # Con otra carta del mismo nombre en output/ el archivo lleva un sufijo
+                nombre_carta = os.path.basename(output_path)
+        # Sin copia en disco (GUARDAR_EN_DISCO = False, lo habitual) la carta se registra con ruta None
+        indice.registrar(nombre_carta, output_path, tipo_carta, datos, contenido)
+        cronometro.marcar("descarga")
+    except Cancelado:
+        raise
+    except Exception:
+        cronometro.registrar(ok=False)
+        raise
+    cronometro.registrar()
+    return {"artefacto_id": artefacto_id, "output_path": output_path}
+
+
+def enviar_carta(tipo_carta, datos, anexo=None):
+    """Genera y guarda la carta en segundo plano; el resultado es {"artefacto_id", "output_path"}"""
+    return enviar("carta", _carta, tipo_carta, datos, anexo)
+
+
+def _lote(avance, df, procesos=None, tamano_bloque=None):
+    # pandas solo se carga si se genera un lote
+    from cartas.lote import generar_lote
+
+    zip_lote, errores, generadas = generar_lote(df, progreso=avance, procesos=procesos, tamano_bloque=tamano_bloque)
+    return {"zip": zip_lote, "errores": errores, "generadas": generadas}
+
+
+def enviar_lote(df, procesos=None, tamano_bloque=None):
+    """Genera el lote en segundo plano; el resultado es {"zip", "errores", "generadas"}"""
+    return enviar("lote", _lote, df, procesos, tamano_bloque)
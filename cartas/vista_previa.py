@@ -0,0 +1,244 @@
+"""
+Vista previa HTML de una carta, armada desde el cuerpo real de su template.
+
+El document.xml de cada template se convierte a HTML una sola vez (en
+memoria, mientras el .docx no cambie) con el mismo truco de cartas.planes:
+los marcadores del catálogo se reemplazan por marcas numeradas y el HTML
+queda cortado en trozos fijos y huecos con nombre. Mostrar la carta es
+escapar los valores y unir los trozos; no se genera ningún .docx.
+
+VistaPrevia guarda lo último que mostró: al cambiar los datos solo se
+vuelven a llenar los huecos cuyo valor cambió.
+
+    vista = VistaPrevia(ruta_template("normal_avance"))
+    html = vista.actualizar(reemplazos("normal_avance", datos))
+"""
+import html
+import os
+import re
+
+from cartas import ooxml
+from cartas.generador import construir_reemplazos, fecha_chile, normalizar_datos
+from cartas.planes import claves_completas
+from cartas.plantillas import LocksPorRuta, firma_archivo
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCUMENTO = "word/document.xml"
+
+# Marcas de hueco: las mismas de cartas.planes (caracteres de uso privado)
+_INICIO = "\ue000"
+_FIN = "\ue001"
+_HUECO = re.compile(_INICIO + r"(\d+)" + _FIN)
+
+ESTILO_CARTA = (
+    "font-family:Arial;font-size:10pt;background:white;padding:30px 40px;"
+    "border:1px solid #ddd;border-radius:8px;color:black;line-height:1.35"
+)
+# Valor ingresado / marcador que sigue sin dato
+ESTILO_LLENO = "border-bottom:1px dotted #0ea5e9"
+ESTILO_VACIO = "color:#b91c1c;font-weight:bold"
+
+_ALINEACION = {"center": "center", "right": "right", "end": "right", "both": "justify", "distribute": "justify"}
+_RESALTADO = {
+    "yellow": "#ffff00", "green": "#00ff00", "cyan": "#00ffff", "magenta": "#ff00ff", "blue": "#0000ff",
+    "red": "#ff0000", "darkBlue": "#000080", "darkCyan": "#008080", "darkGreen": "#008000",
+    "darkMagenta": "#800080", "darkRed": "#800000", "darkYellow": "#808000", "darkGray": "#808080",
+    "lightGray": "#c0c0c0", "black": "#000000",
+}
+_FALSO = ("0", "false", "off", "none")
+
+# ruta -> (firma, plan HTML)
+_cache = {}
+_lock_ruta = LocksPorRuta()
+
+
+# ================= CONVERSIÓN A HTML =================
+def _activo(rpr, nombre):
+    elemento = rpr.find(_W + nombre)
+    return elemento is not None and elemento.get(_W + "val", "true") not in _FALSO
+
+
+def _estilo_run(rpr):
+    if rpr is None:
+        return ""
+    estilos = []
+    if _activo(rpr, "b"):
+        estilos.append("font-weight:bold")
+    if _activo(rpr, "i"):
+        estilos.append("font-style:italic")
+    if _activo(rpr, "u"):
+        estilos.append("text-decoration:underline")
+    tamano = rpr.find(_W + "sz")
+    if tamano is not None and tamano.get(_W + "val", "").isdigit():
+        estilos.append(f"font-size:{int(tamano.get(_W + 'val')) / 2:g}pt")
+    color = rpr.find(_W + "color")
+    if color is not None and re.fullmatch(r"[0-9A-Fa-f]{6}", color.get(_W + "val", "")):
+        estilos.append(f"color:#{color.get(_W + 'val')}")
+    resaltado = rpr.find(_W + "highlight")
+    if resaltado is not None and resaltado.get(_W + "val") in _RESALTADO:
+        estilos.append(f"background:{_RESALTADO[resaltado.get(_W + 'val')]}")
+    return ";".join(estilos)
+
+
+def _runs(parrafo):
+    """Runs del párrafo en orden, incluidos los de hipervínculos y cambios marcados"""
+    for hijo in parrafo:
+        if hijo.tag == _W + "r":
+            yield hijo
+        elif hijo.tag in (_W + "hyperlink", _W + "ins", _W + "smartTag", _W + "fldSimple"):
+            yield from _runs(hijo)
+
+
+def _html_run(run):
+    partes = []
+    for hijo in run:
+        if hijo.tag == _W + "t" and hijo.text:
+            partes.append(html.escape(hijo.text, quote=False))
+        elif hijo.tag == _W + "tab":
+            partes.append("&emsp;")
+        elif hijo.tag in (_W + "br", _W + "cr"):
+            partes.append("<br>")
+    texto = "".join(partes)
+    if not texto:
+        return ""
+    estilo = _estilo_run(run.find(_W + "rPr"))
+    return f"<span style='{estilo}'>{texto}</span>" if estilo else texto
+
+
+def _html_parrafo(parrafo):
+    estilos = ["margin:0 0 4pt 0"]
+    vineta = ""
+    ppr = parrafo.find(_W + "pPr")
+    if ppr is not None:
+        jc = ppr.find(_W + "jc")
+        if jc is not None and jc.get(_W + "val") in _ALINEACION:
+            estilos.append(f"text-align:{_ALINEACION[jc.get(_W + 'val')]}")
+        ind = ppr.find(_W + "ind")
+        izquierda = ind.get(_W + "left", ind.get(_W + "start", "")) if ind is not None else ""
+        if izquierda.lstrip("-").isdigit():
+            # twips → pt
+            estilos.append(f"margin-left:{int(izquierda) / 20:g}pt")
+        if ppr.find(_W + "numPr") is not None:
+            vineta = "•&ensp;"
+    contenido = "".join(_html_run(run) for run in _runs(parrafo))
+    return f"<p style='{';'.join(estilos)}'>{vineta}{contenido or '&nbsp;'}</p>"
+
+
+def _html_tabla(tabla):
+    filas = []
+    for tr in tabla.iter(_W + "tr"):
+        celdas = []
+        for tc in tr.findall(_W + "tc"):
+            span = tc.find(f"{_W}tcPr/{_W}gridSpan")
+            colspan = f" colspan='{span.get(_W + 'val')}'" if span is not None else ""
+            celdas.append(f"<td{colspan} style='border:1px solid #999;padding:2px 4px'>{_html_bloques(tc)}</td>")
+        filas.append("<tr>" + "".join(celdas) + "</tr>")
+    return "<table style='border-collapse:collapse;margin:4pt 0'>" + "".join(filas) + "</table>"
+
+
+def _html_bloques(contenedor):
+    bloques = []
+    for hijo in contenedor:
+        if hijo.tag == _W + "p":
+            bloques.append(_html_parrafo(hijo))
+        elif hijo.tag == _W + "tbl":
+            bloques.append(_html_tabla(hijo))
+        elif hijo.tag == _W + "sdt":
+            contenido = hijo.find(_W + "sdtContent")
+            if contenido is not None:
+                bloques.append(_html_bloques(contenido))
+    return "".join(bloques)
+
+
+def _html_cuerpo(raiz):
+    cuerpo = raiz.find(_W + "body")
+    return _html_bloques(cuerpo) if cuerpo is not None else ""
+
+
+def compilar(path_template):
+    """Plan HTML del cuerpo del template: {"trozos": [...], "huecos": [marcador, ...]}"""
+    tipo_carta = os.path.splitext(os.path.basename(path_template))[0]
+    claves = sorted(claves_completas(tipo_carta))
+    _, partes = ooxml.plantilla(path_template)
+    if _DOCUMENTO not in partes:
+        return {"trozos": [""], "huecos": []}
+    raiz = partes[_DOCUMENTO][0]
+    if _INICIO in ooxml.serializar(raiz).decode("utf-8"):
+        # El template ya contiene las marcas: se muestra tal cual, sin huecos
+        return {"trozos": [_html_cuerpo(raiz)], "huecos": []}
+
+    # El mismo reemplazo por runs de las cartas, con una marca numerada en vez del valor
+    marcas = {clave: f"{_INICIO}{i}{_FIN}" for i, clave in enumerate(claves)}
+    raiz = ooxml.aplicar({_DOCUMENTO: partes[_DOCUMENTO]}, marcas).get(_DOCUMENTO, raiz)
+    cortes = _HUECO.split(_html_cuerpo(raiz))
+    return {"trozos": cortes[0::2], "huecos": [claves[int(i)] for i in cortes[1::2]]}
+
+
+def plan(path_template):
+    """Plan HTML del template, convertido una sola vez mientras el archivo no cambie"""
+    firma = firma_archivo(path_template)
+    with _lock_ruta(path_template):
+        entrada = _cache.get(path_template)
+        if entrada is None or entrada[0] != firma:
+            entrada = (firma, compilar(path_template))
+            _cache[path_template] = entrada
+    return entrada[1]
+
+
+def limpiar_cache():
+    _cache.clear()
+
+
+# ================= VISTA PREVIA =================
+def reemplazos(tipo_carta, datos, hoy=None):
+    """Reemplazos de la carta para la vista previa: normaliza, pero no exige los campos obligatorios"""
+    return construir_reemplazos(tipo_carta, normalizar_datos(datos), hoy or fecha_chile())
+
+
+def _valor_html(marcador, valor):
+    if valor:
+        return f"<span style='{ESTILO_LLENO}'>{html.escape(str(valor), quote=False)}</span>"
+    # Sin dato: se ve el marcador del template, para notar lo que falta
+    return f"<span style='{ESTILO_VACIO}'>{html.escape(marcador, quote=False)}</span>"
+
+
+class VistaPrevia:
+    """HTML de una carta que se actualiza hueco por hueco"""
+
+    def __init__(self, path_template):
+        self.path_template = path_template
+        self._plan = None
+        self.huecos_actualizados = 0
+
+    def _preparar(self, plan_actual):
+        self._plan = plan_actual
+        trozos = plan_actual["trozos"]
+        self._unidos = [None] * (2 * len(trozos) - 1)
+        self._unidos[0::2] = trozos
+        self._posiciones = {}
+        for i, marcador in enumerate(plan_actual["huecos"]):
+            self._posiciones.setdefault(marcador, []).append(2 * i + 1)
+        self._valores = {}
+        self._html = None
+
+    def actualizar(self, reemplazos):
+        """HTML de la carta con estos reemplazos; solo se rellenan los huecos que cambiaron"""
+        plan_actual = plan(self.path_template)
+        if plan_actual is not self._plan:
+            self._preparar(plan_actual)
+
+        cambiados = 0
+        for marcador, posiciones in self._posiciones.items():
+            valor = reemplazos.get(marcador, "")
+            if marcador in self._valores and self._valores[marcador] == valor:
+                continue
+            self._valores[marcador] = valor
+            contenido = _valor_html(marcador, valor)
+            for posicion in posiciones:
+                self._unidos[posicion] = contenido
+            cambiados += 1
+
+        self.huecos_actualizados = cambiados
+        if cambiados or self._html is None:
+            self._html = f"<div style='{ESTILO_CARTA}'>{''.join(self._unidos)}</div>"
+        return self._html